@@ -0,0 +1,56 @@
+# 比較stockq原物料價格網頁的兩種解析方式：舊版pandas.read_html與parsers.py中的lxml解析
+# 使用方式：
+#   python benchmarks/commodity_parser.py --save fixtures/commodity.html   下載目前網頁存成fixture
+#   python benchmarks/commodity_parser.py fixtures/commodity.html ...      對fixture執行效能比較
+import argparse, io, os, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # 讓script可以import專案內的模組
+
+from fintechLinebot.parsers import parse_commodity_table
+
+def parse_with_pandas(content): # 舊版解析方式，將網頁中所有表格轉成DataFrame後取第8個
+    import pandas as pd
+    commodity = pd.read_html(io.BytesIO(content))[7]
+    commodity = commodity.drop(commodity.columns[0],axis=0)
+    commodity = commodity.drop(commodity.columns[1],axis=0)
+    return [tuple(row) for row in commodity.itertuples(index=False)]
+
+def measure(func, content, repeat): # 回傳(平均毫秒, 記憶體峰值KB)
+    func(content) # 預熱，排除第一次import的時間
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(content)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('fixtures', nargs='*', help='已儲存的原物料價格網頁')
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    arg_parser.add_argument('--save', help='下載目前的原物料價格網頁並存到此路徑')
+    args = arg_parser.parse_args()
+    if args.save:
+        import requests
+        with open(args.save, 'wb') as f:
+            f.write(requests.get('http://www.stockq.org/market/commodity.php', timeout=10).content)
+        print('saved', args.save)
+        return
+    for path in args.fixtures:
+        with open(path, 'rb') as f:
+            content = f.read()
+        rows = parse_commodity_table(content)
+        print(path, len(content) // 1024, 'KB,', len(rows), 'commodities')
+        for name, func in [('pandas.read_html', parse_with_pandas), ('lxml', parse_commodity_table)]:
+            try:
+                elapsed, peak = measure(func, content, args.repeat)
+            except ImportError as e: # 未安裝pandas
+                print('  {:<18} skipped ({})'.format(name, e))
+                continue
+            print('  {:<18} {:8.2f} ms/parse  peak {:8.0f} KB'.format(name, elapsed, peak))
+
+if __name__ == '__main__':
+    main()
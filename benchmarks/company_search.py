@@ -0,0 +1,35 @@
+# 測量公司搜尋的索引建立時間及每次查詢的時間，確認每次查詢遠低於1毫秒
+# 使用方式：
+#   python benchmarks/company_search.py                  使用預設的查詢文字
+#   python benchmarks/company_search.py 台積 鴻海        只測量指定的查詢文字
+import os, sys, time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from fintechLinebot.search import company_search
+
+# 預設的查詢文字：完整代碼、部分代碼、完整名稱、名稱前綴、名稱片段、異體字、錯字、找不到
+queries = ['2330', '233', '台積電', '台積', '發科', '臺積電', '台機電', '中華電信', '你好', 'hello']
+
+def load_companies(): # 讀取company.txt，回傳[(股票代碼, 公司名稱, 產業代碼), ...]
+    with open(os.path.join(BASE_DIR, 'company.txt'), encoding='UTF-8') as f:
+        return [tuple(line.strip().split(',')[:3]) for line in f if line.strip()]
+
+def main(argv, repeat=2000):
+    companies = load_companies()
+    index = company_search(lambda: companies)
+    start = time.perf_counter()
+    index.ready()
+    print('build {:.2f} ms for {} companies'.format((time.perf_counter() - start) * 1000, len(companies)))
+    print('{:<12} {:>10} {:>8}  {}'.format('query', 'us/query', 'results', 'top'))
+    for query in argv or queries:
+        start = time.perf_counter()
+        for i in range(repeat):
+            results = index.search(query)
+        elapsed = (time.perf_counter() - start) / repeat * 1e6
+        top = ' '.join(code + name for code, name, industry_id in results[:3])
+        print('{:<12} {:>10.1f} {:>8}  {}'.format(query, elapsed, len(results), top))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
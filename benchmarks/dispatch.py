@@ -0,0 +1,52 @@
+# 測量每個事件從建構回覆訊息到產生reply API請求內容的成本，比較每次重建選單與預先序列化的選單
+# 不會發出任何網路請求，只測量固定選單類的指令
+# 使用方式：
+#   python benchmarks/dispatch.py [--repeat 2000]
+import argparse, json, os, sys, time, logging
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.chdir(BASE_DIR) # views.py以相對路徑讀取company.txt及JSON檔
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fintech.settings')
+
+def rebuild(text, views, messages): # 舊版做法：每次都重新建構選單物件
+    if text == '產業相關資訊':
+        return messages.industry_carousel(views.industry_dict)
+    if text == '原物料價格':
+        return messages.commodity_carousel(views.commodity_dict)
+    if text in views.industry_dict.values():
+        return messages.industry_menu(text)
+    if text in views.commodity_dict.keys():
+        return messages.commodity_menu(text)
+    return messages.main_menu()
+
+def old_body(reply_token, result): # 舊版做法：與LineBotApi.reply_message相同的序列化方式
+    if not isinstance(result, list):
+        result = [result]
+    return json.dumps({'replyToken': reply_token, 'messages': [message.as_json_dict() for message in result]})
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--repeat', type=int, default=2000)
+    args = arg_parser.parse_args()
+    import django
+    django.setup()
+    logging.disable(logging.CRITICAL) # 忽略背景工作無法連線的錯誤
+    from linebot.models import MessageEvent, TextMessage, SourceUser
+    from fintechLinebot import views, messages
+    texts = ['你好', '產業相關資訊', '原物料價格', '半導體業', '黃金']
+    print('{:<14} {:>12} {:>12}'.format('text', 'rebuild us', 'prebuilt us'))
+    for text in texts:
+        event = MessageEvent(reply_token='0' * 32, source=SourceUser(user_id='U0'), message=TextMessage(text=text))
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            old_body(event.reply_token, rebuild(text, views, messages))
+        before = (time.perf_counter() - start) / args.repeat * 1e6
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            messages.reply_body(event.reply_token, views.build_reply(event))
+        after = (time.perf_counter() - start) / args.repeat * 1e6
+        print('{:<14} {:>12.1f} {:>12.1f}'.format(text, before, after))
+
+if __name__ == '__main__':
+    main()
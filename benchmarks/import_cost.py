@@ -0,0 +1,60 @@
+# 測量各模組的載入時間及記憶體用量，用來確認worker啟動成本沒有退步
+# 每個模組都在新的Python行程中載入，數值不受其他模組影響
+# 使用方式：
+#   python benchmarks/import_cost.py                  測量預設的模組清單
+#   python benchmarks/import_cost.py numpy pandas     只測量指定的模組
+import os, subprocess, sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 預設測量的模組，fintechLinebot開頭的模組需要先設定Django
+modules = [
+    'requests', 'lxml.html', 'bs4', 'httpx', 'linebot', 'numpy', 'pandas', 'matplotlib.pyplot',
+    'fintechLinebot.spider', 'fintechLinebot.views'
+]
+
+# 在子行程中執行：先完成Django設定，再測量目標模組的載入時間及RSS增加量
+probe = '''
+import os, sys, time, resource
+sys.path.insert(0, {base!r})
+os.chdir({base!r})
+def rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if {module!r}.startswith('fintechLinebot'):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fintech.settings')
+    import django
+    django.setup()
+before = rss()
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in ('matplotlib', 'pandas', 'numpy', 'bs4') if name in sys.modules]
+print(elapsed * 1000, rss() - before, ','.join(heavy) or '-')
+'''
+
+def measure(module): # 回傳(毫秒, RSS增加KB, 已載入的大型套件)
+    result = subprocess.run(
+        [sys.executable, '-c', probe.format(base=BASE_DIR, module=module)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if result.returncode != 0:
+        return None, None, result.stderr.strip().splitlines()[-1]
+    elapsed, rss, heavy = result.stdout.split()
+    return float(elapsed), int(rss), heavy
+
+def main():
+    targets = sys.argv[1:] or modules
+    print('{:<24} {:>10} {:>10}  {}'.format('module', 'ms', 'RSS KB', 'heavy modules loaded'))
+    for module in targets:
+        elapsed, rss, heavy = measure(module)
+        if elapsed is None:
+            print('{:<24} {:>10} {:>10}  {}'.format(module, '-', '-', heavy))
+        else:
+            print('{:<24} {:>10.1f} {:>10}  {}'.format(module, elapsed, rss, heavy))
+
+if __name__ == '__main__':
+    main()
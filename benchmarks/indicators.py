@@ -0,0 +1,60 @@
+# 比較逐筆迴圈與numpy向量化計算移動平均等指標的時間，並確認兩者結果一致
+# 使用方式：
+#   python benchmarks/indicators.py                   預設測量5年、20年、50年的日資料
+#   python benchmarks/indicators.py 2500 100000       指定資料筆數
+import os, sys, time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+from fintechLinebot import indicators
+
+windows = [5, 20, 60, 120, 240] # 測量的移動平均視窗
+
+def loop_sma(values, window): # 逐筆迴圈的簡單移動平均，資料不足window筆時為NaN
+    result = []
+    for index in range(len(values)):
+        if index + 1 < window:
+            result.append(float('nan'))
+        else:
+            result.append(sum(values[index + 1 - window:index + 1]) / window)
+    return result
+
+def loop_ema(values, window): # 逐筆迴圈的指數移動平均
+    alpha = 2.0 / (window + 1)
+    result = [values[0]]
+    for value in values[1:]:
+        result.append(alpha * value + (1 - alpha) * result[-1])
+    return result
+
+def loop_high(values, window): # 逐筆迴圈的滾動最高價
+    return [float('nan') if index + 1 < window else max(values[index + 1 - window:index + 1]) for index in range(len(values))]
+
+def timed(func, *args): # 回傳(結果, 毫秒)
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def synthetic_prices(size, seed=0): # 以隨機漫步產生價格
+    rng = np.random.RandomState(seed)
+    return (1000 * np.exp(np.cumsum(rng.normal(0, 0.01, size)))).tolist()
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [250 * 5, 250 * 20, 250 * 50]
+    print('{:>8} {:<16} {:>10} {:>10} {:>8} {:>10}'.format('rows', 'indicator', 'loop ms', 'numpy ms', 'speedup', 'max diff'))
+    for size in sizes:
+        prices = synthetic_prices(size)
+        cases = [('SMA x' + str(len(windows)), lambda: [loop_sma(prices, w) for w in windows], lambda: [indicators.sma(prices, w) for w in windows]),
+                 ('EMA x' + str(len(windows)), lambda: [loop_ema(prices, w) for w in windows], lambda: [indicators.ema(prices, w) for w in windows]),
+                 ('HIGH240', lambda: [loop_high(prices, 240)], lambda: [indicators.rolling_high(prices, 240)])]
+        for name, loop, vectorized in cases:
+            expected, loop_ms = timed(loop)
+            actual, numpy_ms = timed(vectorized)
+            diff = max(np.nanmax(np.abs(np.array(e) - a) / np.array(e)) for e, a in zip(expected, actual))
+            print('{:>8} {:<16} {:>10.2f} {:>10.2f} {:>7.1f}x {:>10.1e}'.format(size, name, loop_ms, numpy_ms, loop_ms / numpy_ms, diff))
+        _, all_ms = timed(indicators.compute, prices, windows, windows, [20, 240], [20, 240], [1, 5])
+        print('{:>8} {:<16} {:>10} {:>10.2f}'.format(size, 'compute(all)', '-', all_ms))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
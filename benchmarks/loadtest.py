@@ -0,0 +1,230 @@
+# 離線壓力測試：以測試用的channel secret簽署模擬的webhook請求，以指定的同時請求數送到views.reply(WSGI)及views.async_reply(ASGI)
+# LINE Platform及stockq、證交所、pchome皆由stub_servers.py在本機模擬，可加入延遲，不會發出任何對外的網路請求
+# 延遲為送出webhook到模擬的LINE Platform收到回覆的時間，包含背景事件處理；ack為webhook本身的回應時間
+# 每種模式在獨立的子行程中執行，使用暫存的資料庫及圖片快取，每次執行的起始狀態相同；同一模式中的情境依序執行並共用快取
+# 使用方式：
+#   python benchmarks/loadtest.py                                                      全部情境，WSGI及ASGI
+#   python benchmarks/loadtest.py --mode asgi --scenarios news chart --concurrency 20 --latency 0.2
+#   python benchmarks/loadtest.py --fixture /market/commodity.php=fixtures/commodity.html   以儲存的真實網頁取代產生的內容
+#   python benchmarks/loadtest.py --scenarios chart quote --events 4                   每次webhook包含4個不同使用者的事件
+#   python benchmarks/loadtest.py --json results.json                                  另存結果，供不同版本比較
+import argparse, asyncio, base64, hashlib, hmac, json, logging, os, shutil, subprocess, sys, tempfile, time, uuid, threading
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fintech.settings')
+
+import stub_servers
+
+channel_secret = 'loadtest-channel-secret' # 測試用的channel secret，只在子行程的設定中使用
+scenario_names = ['menu', 'quote', 'news', 'chart']
+mode_paths = {'wsgi': '/fintechLinebot/reply', 'asgi': '/fintechLinebot/async_reply'}
+
+def scenario_texts(name, codes, commodities): # 各情境輪流送出的文字訊息
+    if name == 'menu': # 固定選單、公司選單及公司搜尋，不需要上游資料
+        return ['你好', '產業相關資訊', '原物料價格', '半導體業', commodities[0], codes[0], '台泥', '積體']
+    if name == 'quote': # 原物料及股票最新價格，由報價快照提供
+        return [commodity + '—最新價格' for commodity in commodities] + [code + '—股票價格' for code in codes[:50]]
+    if name == 'news': # 公司新聞，每個股票代碼第一次查詢時向pchome抓取
+        return [code + '—公司新聞' for code in codes[:100]]
+    if name == 'chart': # 原物料及股票走勢圖，每個代碼第一次查詢時抓取歷史資料並繪圖
+        return [commodity + '—價格走勢圖' for commodity in commodities[:5]] + [code + '—股票走勢圖' for code in codes[:5]]
+    raise ValueError(name)
+
+def webhook(texts, reply_tokens): # 建構LINE Platform送出的webhook內容及簽章，每個文字訊息為一個不同使用者的事件
+    body = json.dumps({
+        'destination': 'U' + '0' * 32,
+        'events': [{
+            'type': 'message',
+            'mode': 'active',
+            'timestamp': int(time.time() * 1000),
+            'replyToken': reply_token,
+            'source': {'type': 'user', 'userId': 'U' + reply_token},
+            'message': {'id': reply_token[:16], 'type': 'text', 'text': text}
+        } for text, reply_token in zip(texts, reply_tokens)]
+    }, ensure_ascii=False).encode('utf-8')
+    signature = base64.b64encode(hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()).decode('ascii')
+    return body, signature
+
+def percentile(values, p): # 第p百分位數(最近排名法)
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def rss_mb(pid='self'): # 行程目前的常駐記憶體(MB)，非Linux時回傳None
+    try:
+        with open('/proc/' + str(pid) + '/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+def children_rss_mb(): # 所有子行程(繪圖行程)目前的常駐記憶體總和(MB)
+    total = 0.0
+    for pid in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/' + pid + '/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == os.getpid():
+            total += rss_mb(pid) or 0.0
+    return total
+
+def summarize(mode, name, results, elapsed): # 統計一個情境的結果，results為每個事件的(延遲, ack)，失敗時為None
+    done = [result for result in results if result is not None]
+    summary = {'mode': mode, 'scenario': name, 'events': len(results), 'errors': len(results) - len(done), 'seconds': elapsed,
+               'throughput': len(done) / elapsed if elapsed else 0.0, 'rss_mb': rss_mb(), 'children_rss_mb': children_rss_mb()}
+    for key, index in [('', 0), ('ack_', 1)]:
+        for p in (50, 95, 99):
+            summary[key + 'p' + str(p) + '_ms'] = percentile([result[index] for result in done], p) * 1000 if done else None
+    return summary
+
+def delivery(texts, i, events): # 第i次webhook的文字訊息及reply token
+    return [texts[(i * events + j) % len(texts)] for j in range(events)], [uuid.uuid4().hex for j in range(events)]
+
+def replies(line, reply_tokens, start, ack): # 每個事件的(延遲, ack)，未回覆時為None
+    times = [line.reply_time(reply_token) for reply_token in reply_tokens]
+    return [None if reply_time is None else (reply_time - start, ack) for reply_time in times]
+
+def run_wsgi(line, texts, requests, concurrency, timeout, events): # 以執行緒池同時送出請求，經由Django的WSGI handler呼叫views.reply
+    from django.test import Client
+    local = threading.local()
+    def one(i):
+        if not hasattr(local, 'client'): # 每個執行緒使用各自的Client
+            local.client = Client()
+        messages, reply_tokens = delivery(texts, i, events)
+        body, signature = webhook(messages, reply_tokens)
+        waiters = [line.expect(reply_token) for reply_token in reply_tokens]
+        start = time.perf_counter()
+        response = local.client.post(mode_paths['wsgi'], data=body, content_type='application/json', HTTP_X_LINE_SIGNATURE=signature)
+        ack = time.perf_counter() - start
+        if response.status_code != 200: # 驗證失敗
+            return [None] * events
+        deadline = time.perf_counter() + timeout
+        for waiter in waiters: # 逾時未回覆的事件計為錯誤
+            waiter.wait(max(0, deadline - time.perf_counter()))
+        return replies(line, reply_tokens, start, ack)
+    with ThreadPoolExecutor(concurrency) as pool:
+        return [result for results in pool.map(one, range(requests)) for result in results]
+
+async def run_asgi_async(line, texts, requests, concurrency, timeout, events): # 以協程同時送出請求，經由Django的ASGI handler呼叫views.async_reply
+    from django.test import AsyncClient
+    client = AsyncClient()
+    limit = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_event_loop()
+    async def one(i):
+        async with limit:
+            messages, reply_tokens = delivery(texts, i, events)
+            body, signature = webhook(messages, reply_tokens)
+            waiters = [line.expect(reply_token) for reply_token in reply_tokens]
+            start = time.perf_counter()
+            response = await client.post(mode_paths['asgi'], data=body, content_type='application/json', **{'x-line-signature': signature})
+            ack = time.perf_counter() - start
+            if response.status_code != 200:
+                return [None] * events
+            for waiter in waiters: # 回覆在請求結束前送出，通常不需等待
+                if not waiter.is_set():
+                    await loop.run_in_executor(None, waiter.wait, timeout)
+            return replies(line, reply_tokens, start, ack)
+    results = [result for results in await asyncio.gather(*[one(i) for i in range(requests)]) for result in results]
+    from fintechLinebot import async_spider
+    if async_spider.client is not None: # 共用連線池屬於此事件迴圈，下一個情境會建立新的
+        await async_spider.client.aclose()
+    return results
+
+def run_asgi(line, texts, requests, concurrency, timeout, events):
+    return asyncio.run(run_asgi_async(line, texts, requests, concurrency, timeout, events))
+
+def worker(args): # 子行程：啟動模擬伺服器、改寫設定後載入views，依序執行各情境並以JSON輸出結果
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    try:
+        from django.conf import settings
+        from fintechLinebot.refdata import reference_index
+        from fintechLinebot.catalog import commodity_dict
+        companies = [(code, name) for code, name, industry in reference_index(settings.BASE_DIR, settings.REFDATA_PATH).companies()]
+        fixtures = {}
+        for fixture in args.fixture:
+            path, filename = fixture.split('=', 1)
+            with open(filename, 'rb') as f:
+                fixtures[path] = f.read()
+        upstream = {site: stub_servers.stub_server(companies, commodity_dict, args.latency, args.jitter, fixtures).start() for site in ('stockq', 'twse', 'pchome')}
+        line = stub_servers.stub_server(latency=args.line_latency).start()
+        # 改寫設定，必須在載入views及spider之前
+        settings.DEBUG = False # 不紀錄每個SQL查詢
+        settings.ALLOWED_HOSTS = ['testserver'] + list(settings.ALLOWED_HOSTS) # Django測試Client使用的主機名稱，圖片網域仍為最後一個
+        settings.LINE_CHANNEL_SECRET = channel_secret
+        settings.LINE_API_ENDPOINT = line.url
+        settings.UPSTREAM_BASE_URLS = {
+            'http://www.stockq.org': upstream['stockq'].url,
+            'http://www.twse.com.tw': upstream['twse'].url,
+            'https://www.twse.com.tw': upstream['twse'].url,
+            'https://pchome.megatime.com.tw': upstream['pchome'].url
+        }
+        database = os.path.join(workdir, 'db.sqlite3')
+        shutil.copy(settings.DATABASES['default']['NAME'], database)
+        settings.DATABASES['default']['NAME'] = database
+        settings.RENDER_CACHE_DIR = os.path.join(workdir, 'render')
+        os.chdir(workdir) # 圖表暫存資料夾等相對路徑都放在暫存資料夾中
+        import django
+        django.setup()
+        if not args.verbose: # 預設不輸出背景工作及事件處理的錯誤紀錄，只計入錯誤數
+            logging.disable(logging.CRITICAL)
+        from fintechLinebot import views
+        run = run_wsgi if args.mode == 'wsgi' else run_asgi
+        results = []
+        codes = [code for code, name in companies]
+        for name in args.scenarios:
+            texts = scenario_texts(name, codes, list(commodity_dict.keys()))
+            start = time.perf_counter()
+            outcome = run(line, texts, args.requests, args.concurrency, args.timeout, args.events)
+            results.append(summarize(args.mode, name, outcome, time.perf_counter() - start))
+        print(json.dumps(results))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return
+
+def format_ms(value):
+    return '-' if value is None else '%.1f' % value
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+    arg_parser.add_argument('--scenarios', nargs='+', choices=scenario_names, default=scenario_names)
+    arg_parser.add_argument('--requests', type=int, default=200, help='每個情境送出的請求數')
+    arg_parser.add_argument('--events', type=int, default=1, help='每個請求包含的事件數，每個事件來自不同使用者')
+    arg_parser.add_argument('--concurrency', type=int, default=10, help='同時進行的請求數')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='模擬上游網站的回應秒數')
+    arg_parser.add_argument('--jitter', type=float, default=0.0, help='模擬上游回應秒數的隨機抖動')
+    arg_parser.add_argument('--line-latency', type=float, default=0.02, help='模擬LINE Platform的回應秒數')
+    arg_parser.add_argument('--timeout', type=float, default=60, help='等待回覆的秒數上限，超過時計為錯誤')
+    arg_parser.add_argument('--fixture', action='append', default=[], metavar='PATH=FILE', help='以檔案內容回應此路徑')
+    arg_parser.add_argument('--json', help='將結果另存成JSON檔')
+    arg_parser.add_argument('--verbose', action='store_true', help='輸出錯誤紀錄')
+    arg_parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.worker:
+        return worker(args)
+    results = []
+    for mode in (['wsgi', 'asgi'] if args.mode == 'both' else [args.mode]):
+        command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ['--worker', '--mode', mode] # 後面的--mode優先
+        output = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+        results += json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    print('{:<5} {:<6} {:>6} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9}'.format(
+        'mode', 'case', 'events', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'ack p50', 'ev/s', 'rss MB', 'child MB'))
+    for result in results:
+        print('{:<5} {:<6} {:>6} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8.1f} {:>8} {:>9.1f}'.format(
+            result['mode'], result['scenario'], result['events'], result['errors'],
+            format_ms(result['p50_ms']), format_ms(result['p95_ms']), format_ms(result['p99_ms']), format_ms(result['ack_p50_ms']),
+            result['throughput'], format_ms(result['rss_mb']), result['children_rss_mb']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return
+
+if __name__ == '__main__':
+    main()
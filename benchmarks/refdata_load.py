@@ -0,0 +1,90 @@
+# 比較「啟動時解析company.txt及產業JSON」與「開啟參考資料索引」的載入時間、記憶體用量及查詢成本
+# 每種方式都在新的Python行程中執行，數值不受彼此影響
+# 使用方式：
+#   python benchmarks/refdata_load.py                 預設查詢10000次
+#   python benchmarks/refdata_load.py 100000          指定查詢次數
+import os, subprocess, sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 共用的子行程開頭：測量RSS的函式
+prelude = '''
+import os, sys, time, resource
+sys.path.insert(0, {base!r})
+os.chdir({base!r})
+def rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+codes = [line.split(',')[0] for line in open('company.txt', encoding='UTF-8') if line.strip()]
+before = rss()
+start = time.perf_counter()
+'''
+
+# 原本的做法：啟動時將全部資料讀進dict
+parse = prelude + '''
+import json
+with open('industry_news.json', encoding='UTF-8') as json_file:
+    industry_news_dict = json.load(json_file)
+with open('industry_analysis.json', encoding='UTF-8') as json_file:
+    industry_analysis = json.load(json_file)
+company_dict = {{}}
+company_industry_dict = {{}}
+with open('company.txt', 'r', encoding='UTF-8') as f:
+    for line in f:
+        com = line.strip().split(',')
+        if len(com) >= 3:
+            company_dict[com[0]] = com[1]
+            company_industry_dict[com[0]] = com[2]
+loaded = time.perf_counter()
+lookup = lambda code: (company_dict.get(code), company_industry_dict.get(code))
+'''
+
+# 新的做法：開啟已建立的參考資料索引，第一次查詢時才連線
+index = prelude + '''
+from fintechLinebot.refdata import reference_index
+refdata = reference_index({base!r}, {path!r})
+refdata.company(codes[0])
+loaded = time.perf_counter()
+lookup = refdata.company
+'''
+
+# 共用的子行程結尾：測量查詢成本
+epilogue = '''
+memory = rss() - before
+lookups = {lookups}
+query_start = time.perf_counter()
+for i in range(lookups):
+    lookup(codes[i % len(codes)])
+query = time.perf_counter() - query_start
+print((loaded - start) * 1000, memory, query / lookups * 1e6)
+'''
+
+def measure(script, **kwargs): # 回傳(載入毫秒, RSS增加KB, 每次查詢微秒)
+    result = subprocess.run(
+        [sys.executable, '-c', (script + epilogue).format(base=BASE_DIR, **kwargs)],
+        capture_output=True, text=True, cwd=BASE_DIR
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    load, memory, query = result.stdout.split()
+    return float(load), int(memory), float(query)
+
+def main(argv):
+    lookups = int(argv[0]) if argv else 10000
+    sys.path.insert(0, BASE_DIR)
+    from fintechLinebot.refdata import build_index
+    path = os.path.join(BASE_DIR, 'benchmarks', 'refdata.sqlite3')
+    build_index(BASE_DIR, path) # 索引於部署時預先建立，不列入載入時間
+    try:
+        print('%-8s %10s %10s %12s' % ('method', 'load ms', 'RSS KB', 'lookup us'))
+        for name, script in (('parse', parse), ('index', index)):
+            load, memory, query = measure(script, path=path, lookups=lookups)
+            print('%-8s %10.2f %10d %12.2f' % (name, load, memory, query))
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
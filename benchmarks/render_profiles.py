@@ -0,0 +1,51 @@
+# 比較各繪圖設定的繪圖時間、編碼時間、圖片尺寸及檔案大小
+# legacy為舊版設定(20x15英吋、300dpi、JPEG品質5，原圖與預覽圖共用同一張)，current為spider.py目前使用的設定
+# 使用方式：
+#   python benchmarks/render_profiles.py              每種設定繪製3次取平均
+#   python benchmarks/render_profiles.py 10           指定繪製次數
+import os, sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+from fintechLinebot.renderer import draw_line_chart, draw_table, render_profiles
+
+legacy_profiles = {'original': {'format': 'jpeg', 'max_size': 100000, 'quality': 5}}
+settings = {
+    'legacy': ({'figsize': [20, 15], 'dpi': 300, 'profiles': legacy_profiles}, {'rows': 10, 'dpi': 300, 'profiles': legacy_profiles}),
+    'current': ({'figsize': [20, 15], 'dpi': 100, 'profiles': render_profiles}, {'rows': 10, 'dpi': 200, 'profiles': render_profiles})
+}
+
+def sample_data(size=250): # 以隨機漫步產生一年的價格及移動平均
+    rng = np.random.RandomState(0)
+    prices = 1000 * np.exp(np.cumsum(rng.normal(0, 0.01, size)))
+    ma20 = np.convolve(prices, np.ones(20) / 20, mode='full')[:size]
+    ma60 = np.convolve(prices, np.ones(60) / 60, mode='full')[:size]
+    x = ['2020/%02d/%02d' % (1 + i // 28 % 12, 1 + i % 28) for i in range(size)]
+    return x, [prices.tolist(), ma20.tolist(), ma60.tolist()]
+
+def measure(func, args, repeat): # 回傳平均的metrics
+    runs = [func(*args)['metrics'] for i in range(repeat)]
+    average = {'draw_ms': sum(run['draw_ms'] for run in runs) / repeat, 'size': '%dx%d' % (runs[0]['width'], runs[0]['height'])}
+    for name in runs[0]:
+        if isinstance(runs[0][name], dict):
+            average[name] = (sum(run[name]['encode_ms'] for run in runs) / repeat, runs[-1][name]['bytes'])
+    return average
+
+def main(argv):
+    repeat = int(argv[0]) if argv else 3
+    x, series = sample_data()
+    cells = [['{:.1f}'.format(value) for value in row] for row in np.array(series).T[-10:]]
+    rowlabel = x[-10:]
+    print('{:<8} {:<6} {:>9} {:>11} {:<9} {:>10} {:>10}'.format('setting', 'chart', 'draw ms', 'size', 'output', 'encode ms', 'bytes'))
+    for name, (line_params, table_params) in settings.items():
+        for chart, func, args in (('line', draw_line_chart, ('TEST', x, series, line_params)),
+                                  ('table', draw_table, ('TEST', ['Price', 'MA20', 'MA60'], rowlabel, cells, table_params))):
+            metrics = measure(func, args, repeat)
+            for output in [key for key in metrics if isinstance(metrics[key], tuple)]:
+                encode_ms, size = metrics[output]
+                print('{:<8} {:<6} {:>9.1f} {:>11} {:<9} {:>10.1f} {:>10}'.format(name, chart, metrics['draw_ms'], metrics['size'], output, encode_ms, size))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,155 @@
+# 壓力測試用的本機模擬伺服器，模擬LINE Platform及stockq、證交所、pchome，回應格式與真實網站相同，可加入人為延遲
+# 回應內容由companies(股票代碼, 公司名稱)及commodities(原物料名稱→代碼)產生，不需連線即可重現
+# 也可以用fixtures資料夾中儲存的真實網頁取代產生的內容：fixtures={'/market/commodity.php': b'...'}
+import datetime, json, random, threading, time, urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def commodity_js(commodity, days=400): # 產生stockq原物料歷史價格(<原物料代碼>_sma.js)，價格以隨機漫步產生
+    rng = random.Random(commodity)
+    price = rng.uniform(10, 2000)
+    today = datetime.date.today()
+    lines = ["['Date', 'Price', 'MA20', 'MA60']"]
+    for i in range(days, 0, -1):
+        price *= 1 + rng.gauss(0, 0.01)
+        date = today - datetime.timedelta(days=i)
+        lines.append("['%s', %.2f, %.2f, %.2f]" % (date.strftime('%Y/%m/%d'), price, price * 0.99, price * 0.98))
+    return 'data.addRows([\n' + ',\n'.join(lines) + '\n]);\n'
+
+def commodity_page(commodities): # 產生stockq原物料價格網頁，報價表格前後有其他表格
+    rows = ''.join(
+        '<tr><td>%s</td><td>%.2f</td><td>+1.20</td><td>+0.35%%</td><td>%s</td></tr>' % (name, random.Random(name).uniform(10, 2000), time.strftime('%H:%M'))
+        for name in commodities
+    )
+    return ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"></head><body><table><tr><td>menu</td></tr></table>'
+            '<table><tr><td>原物料</td><td>買價</td><td>漲跌</td><td>比例</td><td>時間</td></tr>' + rows + '</table>'
+            '<table><tr><td>footer</td></tr></table></body></html>')
+
+def stock_row(code, name, rng): # 產生證交所行情資料列，代號之後的欄位
+    close = rng.uniform(10, 600)
+    return [code, name, '{:,}'.format(rng.randint(1000, 10 ** 8)), '{:,}'.format(rng.randint(10 ** 5, 10 ** 10)),
+            '%.2f' % (close * 0.99), '%.2f' % (close * 1.01), '%.2f' % (close * 0.98), '%.2f' % close, '%+.2f' % (close * 0.01),
+            '{:,}'.format(rng.randint(10, 10 ** 5))]
+
+def stock_day_all(companies): # 產生證交所當日全部股票行情(STOCK_DAY_ALL)
+    rng = random.Random(0)
+    return json.dumps({'date': datetime.date.today().strftime('%Y%m%d'), 'data': [stock_row(code, name, rng) for code, name in companies]})
+
+def stock_day(code, month): # 產生證交所個股月成交資訊(STOCK_DAY)，month為該月任一天
+    rng = random.Random(code + month.strftime('%Y%m'))
+    rows = []
+    for day in range(1, 32):
+        try:
+            date = month.replace(day=day)
+        except ValueError: # 該月沒有這一天
+            break
+        if date.weekday() < 5 and date <= datetime.date.today():
+            rows.append(['%d/%02d/%02d' % (date.year - 1911, date.month, date.day)] + stock_row(code, '', rng)[2:])
+    return json.dumps({'stat': 'OK', 'data': rows})
+
+def news_page(code, count=8): # 產生pchome股票頁面，新聞區塊外另有其他連結
+    links = ''.join('<li><a href="/news/cat1/%s%02d">%s 新聞標題 %d</a></li>' % (code, i, code, i) for i in range(count))
+    return ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"><title>%s</title></head><body><div id="menu"><a href="/">首頁</a></div>'
+            '<div id="stock_info_news"><ul>%s</ul></div><div id="footer"><a href="/about">關於</a></div></body></html>' % (code, links))
+
+# 定義stub_server物件，在背景執行緒中執行一個本機HTTP伺服器
+class stub_server:
+    def __init__(self, companies=(), commodities=None, latency=0.0, jitter=0.0, fixtures=None): # 初始化，latency及jitter為每個回應的延遲秒數及隨機抖動
+        self.companies = list(companies)
+        self.commodities = commodities or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.fixtures = fixtures or {} # 路徑→固定回應內容，優先於產生的內容
+        self.lock = threading.Lock()
+        self.requests = 0 # 已收到的請求數
+        self.replies = {} # LINE reply token→收到回覆的時間(perf_counter)
+        self.waiters = {} # LINE reply token→threading.Event
+        self.cache = {} # 已產生的回應內容
+        server = self
+        class handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # 支援keep-alive
+            disable_nagle_algorithm = True # 標頭及內容分兩次寫入時不等待用戶端的ACK
+            wbufsize = -1 # 回應寫入緩衝區，處理完請求後一次送出
+            def log_message(self, *args): # 不輸出每個請求的紀錄
+                pass
+            def do_GET(self):
+                server.respond(self, None)
+            def do_POST(self):
+                server.respond(self, self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.httpd.server_address[1] # 伺服器網址
+        return
+    def start(self): # 在背景執行緒中開始接受請求
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return
+    def delay(self): # 模擬上游的回應時間
+        seconds = self.latency + random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+        return
+    def content(self, path, query): # 依路徑產生回應內容，回傳(Content-Type, bytes)，找不到時回傳None
+        if path in self.fixtures:
+            return 'text/html', self.fixtures[path]
+        if path.startswith('/commodity/js/') and path.endswith('_sma.js'):
+            key = path
+            build = lambda: commodity_js(path[len('/commodity/js/'):-len('_sma.js')])
+            kind = 'application/javascript'
+        elif path == '/market/commodity.php':
+            key, build, kind = path, lambda: commodity_page(self.commodities), 'text/html; charset=utf-8'
+        elif path == '/exchangeReport/STOCK_DAY_ALL':
+            key, build, kind = path, lambda: stock_day_all(self.companies), 'application/json'
+        elif path == '/exchangeReport/STOCK_DAY':
+            month = datetime.datetime.strptime(query['date'][0], '%Y%m%d').date()
+            key, build, kind = (path, query['stockNo'][0], month.strftime('%Y%m')), lambda: stock_day(query['stockNo'][0], month), 'application/json'
+        elif path.startswith('/stock/sid') and path.endswith('.html'):
+            key, build, kind = path, lambda: news_page(path[len('/stock/sid'):-len('.html')]), 'text/html; charset=utf-8'
+        else:
+            return None
+        with self.lock:
+            data = self.cache.get(key)
+        if data is None:
+            data = build().encode('utf-8')
+            with self.lock:
+                self.cache[key] = data
+        return kind, data
+    def respond(self, request, body): # 處理一個請求
+        with self.lock:
+            self.requests += 1
+        self.delay()
+        url = urllib.parse.urlsplit(request.path)
+        if body is not None and url.path == '/v2/bot/message/reply': # LINE Messaging API的reply
+            self.received(json.loads(body)['replyToken'])
+            result = ('application/json', b'{}')
+        else:
+            result = self.content(url.path, urllib.parse.parse_qs(url.query))
+        if result is None:
+            request.send_response(404)
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+            return
+        request.send_response(200)
+        request.send_header('Content-Type', result[0])
+        request.send_header('Content-Length', str(len(result[1])))
+        request.end_headers()
+        request.wfile.write(result[1])
+        return
+    def expect(self, reply_token): # 登記即將收到的reply token，回傳可等待的Event
+        event = threading.Event()
+        with self.lock:
+            self.waiters[reply_token] = event
+        return event
+    def received(self, reply_token): # 紀錄收到回覆的時間並通知等待中的執行緒
+        now = time.perf_counter()
+        with self.lock:
+            self.replies[reply_token] = now
+            event = self.waiters.pop(reply_token, None)
+        if event is not None:
+            event.set()
+        return
+    def reply_time(self, reply_token): # 收到該reply token回覆的時間，尚未收到時回傳None
+        with self.lock:
+            return self.replies.pop(reply_token, None)
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 from pathlib import Path
-import os
+import os, sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 #BASE_DIR = Path(__file__).resolve().parent.parent
@@ -130,4 +130,97 @@ STATICFILES_DIRS = (
 
 # For Line Bot
 LINE_CHANNEL_ACCESS_TOKEN = '****************************************************************************************************************************************************************************'
-LINE_CHANNEL_SECRET = '********************************'
\ No newline at end of file
+LINE_CHANNEL_SECRET = '********************************'
+LINE_API_ENDPOINT = 'https://api.line.me' # Messaging API base URL; benchmarks/loadtest.py points it at a local stub
+
+# TWSE STOCK_DAY_ALL snapshot cache
+TWSE_SNAPSHOT_TTL = 600 # seconds a snapshot is served before refetching
+TWSE_PUBLISH_TIMES = ['14:00', '14:30'] # Taipei time; snapshots expire at each publication
+TWSE_SNAPSHOT_RETRY = 30 # seconds to keep serving the last good snapshot after a failed fetch
+TWSE_SNAPSHOT_STALE = 600 # seconds past expiry the last snapshot is served at once while refetching in the background
+TWSE_REFRESH_DELAY = 60 # seconds after each publication before the snapshot is refreshed in the background
+
+# Generated chart directories under ./static/<rand>/
+ARTIFACT_MAX_AGE = 60 # seconds a chart directory is kept so LINE can fetch the images
+ARTIFACT_SWEEP_INTERVAL = 15 # seconds between background sweeps
+
+# Rendered chart cache, served by fintechLinebot/image/<sha1>.<ext>
+RENDER_CACHE_MAX_BYTES = 200 * 1024 * 1024 # evict least recently used images above this size
+RENDER_CACHE_MAX_FILES = 500 # evict least recently used images above this count
+RENDER_CACHE_DIR = os.path.join(BASE_DIR, 'render') # content-addressed chart images shared by the workers on this host
+RENDER_CACHE_MEMORY_BYTES = 32 * 1024 * 1024 # recently served images kept in memory per process
+
+# Webhook event processing
+LINE_ASYNC_REPLY = True # ack LINE immediately and reply from background worker threads
+LINE_WORKER_THREADS = 4 # worker threads per process; events from one sender always go to the same thread, in order
+LINE_QUEUE_SIZE = 100 # pending events per process, split evenly across the worker threads
+LINE_QUEUE_WAIT = 1 # seconds to wait for room in a full queue before handling the event on the request thread
+LINE_EVENT_PARALLELISM = 4 # senders handled at once within one webhook delivery (sync and async_reply); 1 handles events in order
+LINE_FANOUT_THREADS = 16 # threads shared by all concurrent deliveries in sync mode; each delivery uses at most LINE_EVENT_PARALLELISM - 1
+
+# Async webhook path (fintechLinebot/async_reply, ASGI deployments)
+ASYNC_HTTP_MAX_CONNECTIONS = 100 # total connections in the shared async HTTP pool
+ASYNC_HTTP_MAX_KEEPALIVE = 20 # idle keep-alive connections kept open
+
+# Shared upstream HTTP layer (fintechLinebot/fetcher.py); timeouts also apply to the async client
+HTTP_CONNECT_TIMEOUT = 3.05 # seconds
+HTTP_READ_TIMEOUT = 10 # seconds
+HTTP_RETRIES = 2 # retries on connection errors and 5xx responses
+HTTP_BACKOFF = 0.3 # base seconds between retries, doubled each attempt with random jitter
+HTTP_PER_HOST_LIMIT = 8 # concurrent requests per upstream host per process
+HTTP_SLOT_TIMEOUT = 10 # seconds a request waits for a free per-host slot before failing fast (counted as a breaker failure)
+HTTP_POOL_SIZE = 10 # keep-alive connection pools
+HTTP_CONDITIONAL_CACHE_SIZE = 256 # URLs whose last ETag/Last-Modified response is kept for 304 revalidation
+
+# Per-host circuit breakers shared by the sync and async upstream requests
+UPSTREAM_BREAKER_WINDOW = 20 # most recent requests per host used to compute the failure rate
+UPSTREAM_BREAKER_MIN_REQUESTS = 5 # requests in the window before the breaker can open
+UPSTREAM_BREAKER_FAILURE_RATE = 0.5 # connection errors, timeouts and 5xx responses that open the breaker
+UPSTREAM_BREAKER_COOLDOWN = 30 # seconds an open breaker fails fast before letting one probe request through
+
+# Background refreshes (quotes, hot news, TWSE publications) start when the webhook views load.
+# Off under "manage.py test" so the test suite never contacts upstream; PREFETCH_ENABLED=0 also turns it off.
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', '1') == '1' and sys.argv[1:2] != ['test']
+
+# stockq commodity quote snapshot, refreshed in the background
+STOCKQ_REFRESH_INTERVAL = 60 # seconds between background refreshes of the quote page
+STOCKQ_SNAPSHOT_TTL = 180 # seconds before a request refetches if background refreshes keep failing
+STOCKQ_SNAPSHOT_RETRY = 30 # seconds to keep serving the last good quotes after a failed request-time fetch
+STOCKQ_SNAPSHOT_STALE = 300 # seconds past expiry the last quotes are served at once while refetching in the background
+
+# Chart renderer process pool (fintechLinebot/renderer.py)
+RENDER_PROCESSES = 2 # long-lived renderer processes per web worker; 0 renders in-process
+RENDER_MAX_PER_PROCESS = 50 # renders per process before the pool is replaced
+RENDER_TIMEOUT = 60 # seconds to wait for one chart; a hung render's pool is terminated and replaced
+
+# Reference data index compiled from company.txt and the industry JSON files
+# (rebuilt automatically when missing or stale, or with `python manage.py build_refdata`)
+REFDATA_PATH = os.path.join(BASE_DIR, 'refdata.sqlite3')
+
+# Local price history (fintechLinebot.models); fill it with `python manage.py ingest_prices`
+COMMODITY_HISTORY_MAX_AGE = 6 * 3600 # seconds before a chart request resyncs a commodity's history from stockq
+HISTORY_CHART_DAYS = 250 # trading days drawn in commodity charts
+CHART_MA_WINDOWS = [20, 60] # moving averages computed locally from the stored history and drawn on charts
+CHART_MA_MAX_COUNT = 5 # most moving averages a user may request in one chart command, e.g. "2330—股票走勢圖 5 20 120"
+CHART_MA_MAX_WINDOW = 240 # longest moving average a user may request
+STOCK_CHART_MONTHS = 6 # months of TWSE history backfilled for a stock chart (one upstream request per missing month)
+STOCK_BACKFILL_THREADS = 2 # background threads fetching missing months; charts render from stored history meanwhile
+
+# Company news from pchome, cached per stock code
+STOCK_NEWS_TTL = 600 # seconds a stock's news is served before refetching
+STOCK_NEWS_RETRY = 30 # seconds to keep serving the last good news after a failed fetch
+STOCK_NEWS_STALE = 1800 # seconds past expiry the last news is served at once while refetching in the background
+STOCK_NEWS_CACHE_SIZE = 500 # stock codes kept in the news cache
+STOCK_NEWS_HOT_TICKERS = 20 # most requested stocks refreshed in the background; 0 disables
+STOCK_NEWS_REFRESH_INTERVAL = 300 # seconds between background refreshes of hot stocks
+
+# Upstream sites, replaced by local stub servers in benchmarks/loadtest.py
+UPSTREAM_BASE_URLS = {} # origin -> replacement base URL, e.g. {'http://www.stockq.org': 'http://127.0.0.1:8001'}
+
+# Per-stage timings, exposed in Prometheus text format on fintechLinebot/metrics (per process)
+METRICS_ENABLED = False # serve fintechLinebot/metrics; False returns 404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '') # when set, scrapes must send "Authorization: Bearer <token>" (Prometheus bearer_token); others get 403
+METRICS_TRACE_LOG = False # log one JSON line per webhook event with its stage timings (logger fintechLinebot.metrics.trace)
+
+# Price alerts ("2330 > 600", "黃金 跌破 1800"), checked on every new stockq or TWSE snapshot and pushed to the user
+ALERT_MAX_PER_TARGET = 20 # pending alerts per LINE user, group or room
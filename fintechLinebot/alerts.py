@@ -0,0 +1,185 @@
+# re            Python標準套件，用來解析提醒指令
+# bisect        Python標準套件，在依門檻排序的提醒中找出觸發範圍，不需逐筆比較
+# threading     Python標準套件，保護提醒索引及統計數據
+# collections   Python標準套件，用來依推播對象及訊息內容分組
+# concurrent    Python標準套件，在背景執行緒中檢查提醒及推播，不佔用刷新快照的執行緒
+# logging       Python標準套件，用來紀錄檢查或推播失敗
+import re, bisect, threading, collections, concurrent.futures, logging
+# django        資料庫操作
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+# linebot       Linebot SDK，用來建構推播訊息
+from linebot.models import TextSendMessage
+
+# models        自己寫的資料表，內容在models.py
+from .models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+# 提醒指令，例如「2330 > 600」、「黃金 跌破 1800」
+alert_pattern = re.compile(r'^(\S+?)\s*(>=|<=|>|<|突破|跌破|高於|低於)\s*([0-9][0-9,]*(?:\.[0-9]+)?)$')
+direction_words = {'>': 'above', '>=': 'above', '突破': 'above', '高於': 'above',
+                   '<': 'below', '<=': 'below', '跌破': 'below', '低於': 'below'} # 指令中的比較文字→方向
+direction_names = dict(PriceAlert.DIRECTION_CHOICES) # 方向→中文
+multicast_size = 500 # LINE multicast一次最多的user ID數
+
+def parse_alert(text): # 解析提醒指令，回傳(名稱或代碼, 方向, 門檻)，不是提醒指令時回傳None
+    match = alert_pattern.match(text)
+    if match is None:
+        return None
+    symbol, word, threshold = match.groups()
+    return symbol, direction_words[word], float(threshold.replace(',', ''))
+
+def parse_price(text): # 將報價文字轉成float，無資料('--'等)時回傳None
+    try:
+        return float(str(text).replace(',', ''))
+    except ValueError:
+        return None
+
+def commodity_prices(quotes): # 原物料報價快照→ 原物料名稱→買價
+    return {name: parse_price(quote[0]) for name, quote in quotes.items()}
+
+def stock_prices(stocks): # 證交所行情快照→ 股票代碼→收盤價
+    return {code: parse_price(row[7]) for code, row in stocks.items()}
+
+def triggered(direction, threshold, price): # 價格是否已達到門檻
+    return price >= threshold if direction == 'above' else price <= threshold
+
+def format_price(value): # 去除多餘的小數位數
+    return ('%.4f' % value).rstrip('0').rstrip('.')
+
+def describe(symbol, direction, threshold): # 提醒的文字說明
+    return symbol + ' ' + direction_names[direction] + ' ' + format_price(threshold)
+
+def add_alert(target, market, symbol, direction, threshold, limit): # 新增提醒，已達上限時回傳None
+    with transaction.atomic():
+        if PriceAlert.objects.filter(target=target, triggered_at=None).count() >= limit:
+            return None
+        return PriceAlert.objects.create(target=target, market=market, symbol=symbol, direction=direction, threshold=threshold)
+
+def list_alerts(target): # 回傳尚未觸發的提醒
+    return list(PriceAlert.objects.filter(target=target, triggered_at=None).order_by('id'))
+
+def cancel_alerts(target, alert_id=None): # 取消提醒，alert_id為None時取消全部，回傳取消的數量
+    alerts = PriceAlert.objects.filter(target=target, triggered_at=None)
+    if alert_id is not None:
+        alerts = alerts.filter(id=alert_id)
+    return alerts.delete()[0]
+
+# 定義alert_index物件，將同一市場尚未觸發的提醒依 名稱或代碼→方向 分組，各組門檻由小到大排序
+# 檢查時每個有提醒的名稱或代碼只需一次二分搜尋，觸發的提醒為排序後連續的一段
+# 提醒可能由其他worker新增、觸發或取消，每次檢查前以(尚未觸發的數量, 最大ID, 最新建立時間)判斷是否需要重新載入
+class alert_index:
+    def __init__(self, market): # 初始化
+        self.market = market # 'commodity'或'stock'
+        self.version = None # 載入時的(尚未觸發的數量, 最大ID, 最新建立時間)
+        self.symbols = {} # 名稱或代碼→{方向: ([門檻, ...], [提醒ID, ...])}
+        return
+    def current_version(self): # 新增必定使最新建立時間變大(取消最新的提醒後ID可能被重複使用)，觸發及取消必定使數量變小
+        pending = PriceAlert.objects.filter(market=self.market, triggered_at=None)
+        latest = PriceAlert.objects.aggregate(Max('id'), Max('created_at'))
+        return pending.count(), latest['id__max'], latest['created_at__max']
+    def load(self): # 重新載入尚未觸發的提醒，資料庫依索引排序後直接分組
+        symbols = {}
+        rows = PriceAlert.objects.filter(market=self.market, triggered_at=None).order_by('symbol', 'direction', 'threshold').values_list('symbol', 'direction', 'threshold', 'id')
+        for symbol, direction, threshold, alert_id in rows.iterator():
+            thresholds, ids = symbols.setdefault(symbol, {}).setdefault(direction, ([], []))
+            thresholds.append(threshold)
+            ids.append(alert_id)
+        self.symbols = symbols
+        return
+    def refresh(self): # 提醒有變動時重新載入
+        version = self.current_version()
+        if version != self.version:
+            self.load()
+            self.version = version
+        return
+    def match(self, prices): # 回傳 (名稱或代碼, 價格)→[觸發的提醒ID, ...]，prices為 名稱或代碼→價格
+        self.refresh()
+        matches = collections.defaultdict(list)
+        for symbol, directions in self.symbols.items():
+            price = prices.get(symbol)
+            if price is None: # 此快照中沒有該名稱或代碼，或無成交價
+                continue
+            if 'above' in directions: # 門檻≤價格的提醒
+                thresholds, ids = directions['above']
+                matches[symbol, price] += ids[:bisect.bisect_right(thresholds, price)]
+            if 'below' in directions: # 門檻≥價格的提醒
+                thresholds, ids = directions['below']
+                matches[symbol, price] += ids[bisect.bisect_left(thresholds, price):]
+        return {key: ids for key, ids in matches.items() if ids}
+
+# 定義alert_monitor物件，快照更新時在背景執行緒中檢查所有提醒，並以multicast及push批次推播觸發的提醒
+class alert_monitor:
+    def __init__(self, line_bot_api): # 初始化，line_bot_api用來推播
+        self.line_bot_api = line_bot_api
+        self.indexes = {} # 市場→alert_index
+        self.lock = threading.Lock() # 同一時間只檢查一個快照，保護統計數據
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-alerts')
+        self.triggered = 0 # 已觸發的提醒數
+        self.pushes = 0 # 已呼叫的推播API次數
+        self.failed = 0 # 推播失敗的次數
+        return
+    def watch(self, snapshot, market, prices): # 快照每次抓取到新資料時檢查該市場的提醒，prices將快照資料轉成 名稱或代碼→價格
+        self.indexes[market] = alert_index(market)
+        def changed(data):
+            try:
+                self.executor.submit(self.check, market, prices, data)
+            except RuntimeError: # 行程結束中
+                pass
+        snapshot.subscribe(changed)
+        return
+    def check(self, market, prices, data): # 檢查一個市場的提醒並推播
+        try:
+            with self.lock:
+                alerts = self.claim(market, self.indexes[market].match(prices(data)))
+                self.triggered += len(alerts)
+            self.deliver(alerts)
+        except Exception:
+            logger.exception('price alert check failed for %s', market)
+        return
+    def claim(self, market, matches): # 將觸發的提醒標記為已觸發並回傳，其他worker已標記的提醒不會重複推播
+        now = timezone.now()
+        ids = []
+        with transaction.atomic():
+            for (symbol, price), price_ids in matches.items():
+                # 再次確認提醒的條件，索引載入後提醒被取消且ID被重複使用時，不會以舊提醒的條件觸發新提醒
+                condition = Q(direction='above', threshold__lte=price) | Q(direction='below', threshold__gte=price)
+                for start in range(0, len(price_ids), 500): # SQLite單一查詢的參數數量有上限
+                    chunk = price_ids[start:start + 500]
+                    PriceAlert.objects.filter(condition, id__in=chunk, market=market, symbol=symbol, triggered_at=None).update(triggered_at=now, triggered_price=price)
+                    ids += chunk
+            claimed = []
+            for start in range(0, len(ids), 500):
+                claimed += PriceAlert.objects.filter(id__in=ids[start:start + 500], triggered_at=now)
+        return claimed
+    def deliver(self, alerts): # 每個推播對象一則訊息，內容相同的user以multicast一起推播，群組及聊天室以push推播
+        lines = collections.defaultdict(list) # 推播對象→訊息各行
+        for alert in sorted(alerts, key=lambda alert: alert.id):
+            lines[alert.target].append(describe(alert.symbol, alert.direction, alert.threshold) + '，目前價格' + format_price(alert.triggered_price))
+        recipients = collections.defaultdict(list) # 訊息內容→user ID
+        for target, target_lines in lines.items():
+            text = '價格提醒\n' + '\n'.join(target_lines)
+            if target.startswith('U'):
+                recipients[text].append(target)
+            else:
+                self.send(self.line_bot_api.push_message, target, text)
+        for text, targets in recipients.items():
+            for start in range(0, len(targets), multicast_size):
+                chunk = targets[start:start + multicast_size]
+                if len(chunk) == 1:
+                    self.send(self.line_bot_api.push_message, chunk[0], text)
+                else:
+                    self.send(self.line_bot_api.multicast, chunk, text)
+        return
+    def send(self, api, to, text): # 呼叫推播API，失敗時紀錄後繼續推播其他對象
+        try:
+            api(to, TextSendMessage(text=text))
+            self.pushes += 1
+        except Exception:
+            self.failed += 1
+            logger.exception('price alert push failed')
+        return
+    def stats(self): # 回傳目前統計數據
+        return {'triggered': self.triggered, 'pushes': self.pushes, 'failed': self.failed}
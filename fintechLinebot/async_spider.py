@@ -0,0 +1,105 @@
+# asyncio       Python標準套件，用來取得目前的事件迴圈
+# urllib.parse  Python標準套件，用來取出網址的主機名稱
+# contextvars   Python標準套件，紀錄目前請求專用的連線池
+# contextlib    Python標準套件，用來撰寫請求專用連線池的async with區塊
+import asyncio, urllib.parse, contextvars, contextlib
+# httpx         支援非同步及連線重複使用(keep-alive)的HTTP套件
+import httpx
+# asgiref       Django內建，用來在執行緒中等待同步的繪圖程式及資料庫操作
+from asgiref.sync import sync_to_async
+# django        讀取settings.py中的設定
+from django.conf import settings
+
+# spider        自己寫的爬蟲套件，解析網頁及繪圖的部分與同步版本共用
+from .spider import (commodity_spider, stock_snapshot, commodity_snapshot,
+                     stockq_commodity_js_url, stockq_commodity_url, twse_stock_day_all_url, pchome_stock_url,
+                     build_newest_price_msg, build_stock_price_msg, build_stock_news_msg, news_cache, metrics,
+                     fetcher, freshness_note,
+                     commodity_history_stale, store_commodity_history, sync_failed, commodity_history_data)
+from . import spider as sync_spider
+
+client = None # 全行程共用的非同步HTTP連線池
+client_loop = None # 建立連線池時的事件迴圈，連線池不可跨事件迴圈使用
+scoped_client = contextvars.ContextVar('scoped_client', default=None) # 目前請求專用的連線池，由request_client設定
+
+def new_client(): # 建立非同步HTTP連線池
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=getattr(settings, 'ASYNC_HTTP_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'ASYNC_HTTP_MAX_KEEPALIVE', 20)
+        ),
+        timeout=httpx.Timeout(
+            getattr(settings, 'HTTP_READ_TIMEOUT', 10),
+            connect=getattr(settings, 'HTTP_CONNECT_TIMEOUT', 3.05)
+        )
+    )
+
+def get_client(): # 取得非同步HTTP連線池，請求專用的連線池優先，否則使用共用連線池，第一次使用或事件迴圈改變時建立
+    global client, client_loop
+    scoped = scoped_client.get()
+    if scoped is not None:
+        return scoped
+    loop = asyncio.get_event_loop()
+    if client is None or client_loop is not loop:
+        client = new_client()
+        client_loop = loop
+    return client
+
+@contextlib.asynccontextmanager
+async def request_client(): # 請求專用的連線池，離開時關閉；以WSGI佈署時async_to_sync每個請求都建立新的事件迴圈，共用連線池無法重複使用
+    async with new_client() as scoped:
+        token = scoped_client.set(scoped)
+        try:
+            yield scoped
+        finally:
+            scoped_client.reset(token)
+
+async def fetch(url, headers=None): # 對目標網址發出非同步請求並回傳回應，與同步版本相同紀錄回應時間、狀態碼及位元組數，並共用各網站的斷路器
+    host = urllib.parse.urlsplit(url).netloc
+    breaker = fetcher.admit(url) # 網站持續失敗時不發出請求，直接失敗
+    try:
+        with metrics.stage(host, 'upstream_seconds', 'host'):
+            response = await get_client().get(url, headers=headers)
+    except BaseException: # 包含被取消(CancelledError)的請求，試探請求也必須回報結果
+        breaker.record(False)
+        metrics.inc('upstream_responses_total', host=host, status='error')
+        raise
+    breaker.record(response.status_code < 500)
+    metrics.inc('upstream_responses_total', host=host, status=str(response.status_code))
+    metrics.inc('upstream_bytes_total', len(response.content), host=host)
+    response.raise_for_status()
+    return response
+
+@metrics.timed()
+async def load_commodity_spider(commodity, windows=None): # 非同步版本的load_commodity_spider，本地資料過期時才向上游抓取
+    series, stale = await sync_to_async(commodity_history_stale)(commodity)
+    if stale:
+        try:
+            response = await fetch(stockq_commodity_js_url + commodity + '_sma.js')
+            await sync_to_async(store_commodity_history)(series, response.text)
+        except Exception as e:
+            sync_failed(series, e)
+    days = getattr(settings, 'HISTORY_CHART_DAYS', 250)
+    data_list = await sync_to_async(commodity_history_data)(commodity, days, windows)
+    return commodity_spider(commodity, data_list=data_list, windows=windows, days=days)
+
+async def load_stock_spider(stock_code, windows=None): # 缺少的月份在背景回補，只需讀取資料庫，直接在執行緒中執行同步版本
+    return await sync_to_async(sync_spider.load_stock_spider, thread_sensitive=False)(stock_code, windows)
+
+async def draw_commodity_charts(spider): # 繪製折線圖及表格，繪圖在繪圖行程中進行，可在任意執行緒中等待
+    def draw():
+        return spider.draw_line_chart(), spider.draw_table()
+    return await sync_to_async(draw, thread_sensitive=False)()
+
+@metrics.timed()
+async def get_newest_price_msg(commodity_name): # 非同步抓原物料價格，與同步版本共用報價快照
+    quotes = await commodity_snapshot.aget()
+    return freshness_note(build_newest_price_msg(commodity_name, quotes, commodity_snapshot.age()), commodity_snapshot, stockq_commodity_url)
+
+@metrics.timed()
+async def get_newest_stock_price(stock_code): # 非同步抓股票價格，與同步版本共用行情快照
+    return freshness_note(build_stock_price_msg(stock_code, await stock_snapshot.aget()), stock_snapshot, twse_stock_day_all_url)
+
+@metrics.timed()
+async def get_stock_news(stock_id): # 非同步抓股票新聞，與同步版本共用新聞快取
+    return freshness_note(build_stock_news_msg(await news_cache.aget(stock_id)), news_cache.snapshot(stock_id), pchome_stock_url)
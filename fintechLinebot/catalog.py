@@ -0,0 +1,82 @@
+# 原物料名稱→stockq原物料代碼
+commodity_dict = {
+    "黃金": "COMMGOLD", 
+    "銀": "COMMSILV", 
+    "白金": "COMMPLAT", 
+    "鈀": "COMMPALL", 
+    "銠": "COMMRHDM", 
+    "銅": "COMMCOPP", 
+    "鎳": "COMMNIKL", 
+    "鋁": "COMMALUM", 
+    "鋅": "COMMZINC", 
+    "鉛": "COMMLEAD", 
+    "黃金期貨": "FUTRGOLD", 
+    "銀期貨": "FUTRSILV", 
+    "銅期貨": "FUTRCOPP", 
+    "紐約輕原油": "FUTRWOIL", 
+    "布蘭特油期": "FUTRBOIL", 
+    "天然氣期": "FUTRNGAS", 
+    "燃油期貨": "FUTRHOIL", 
+    "無鉛汽油": "FUTRRBOB", 
+    "玉米期貨": "FUTRCORN", 
+    "小麥期貨": "FUTRWHEA", 
+    "黃豆期貨": "FUTRBEAN", 
+    "黃豆油期貨": "FUTRBNOL", 
+    "活牛期貨": "FUTRCATT", 
+    "瘦豬期貨": "FUTRHOGS", 
+    "可可豆期": "FUTRCOCO", 
+    "咖啡C期": "FUTRCOFF", 
+    "十一號糖": "FUTRSUGR", 
+    "二號棉期": "FUTRCTTN", 
+    "XAU/USD": "XAUUSD", 
+    "XAG/USD": "XAGUSD", 
+    "倫敦銅期貨": "FUTRCOPPUK", 
+    "倫敦鋁期貨": "FUTRALMNUK", 
+    "倫敦鎳期貨": "FUTRNIKLUK", 
+    "倫敦重柴油": "FUTRLNGO", 
+    "碳排放期貨": "FUTRCRBN", 
+    "倫敦咖啡豆": "FUTRLNCF"
+}
+
+# 產業代碼→產業名稱，產業代碼與company.txt第三欄相同
+industry_dict = {
+    "1": "水泥工業",
+    "2": "食品工業",
+    "3": "塑膠工業",
+    "4": "紡織工業",
+    "5": "電機機械",
+    "6": "電器電纜",
+    "7": "化學生技業",
+    "21": "化學工業",
+    "22": "生技醫療",
+    "8": "玻璃陶瓷",
+    "9": "造紙工業",
+    "10": "鋼鐵工業",
+    "11": "橡膠工業",
+    "12": "汽車工業",
+    "13": "電子工業",
+    "24": "半導體業",
+    "25": "電腦及週邊設備業",
+    "26": "光電業",
+    "27": "通訊網路業",
+    "28": "電子零組件業",
+    "29": "電子通路業",
+    "30": "資訊服務業",
+    "31": "其他電子業",
+    "14": "建材營造",
+    "15": "航運",
+    "16": "觀光",
+    "17": "金融",
+    "18": "貿易百貨",
+    "23": "油電燃氣",
+    "19": "綜合",
+    "20": "其他",
+    "80": "管理股票",
+    "32": "文化創意業",
+    "33": "農業科技",
+    "34": "電子商務",
+    "91": "台灣存託憑證",
+    "97": "社會企業",
+    "98": "農林漁牧",
+    "-": "傳產其他"
+}
@@ -0,0 +1,188 @@
+# requests      用來對網站發出請求
+# random        Python標準套件，用來產生重試等待時間的隨機抖動
+# threading     Python標準套件，用來限制同一網站的同時請求數
+# time          Python標準套件，用來等待重試
+# collections   Python標準套件，OrderedDict用來實作有上限的條件式請求快取
+# urllib.parse  Python標準套件，用來取出網址的主機名稱
+import requests, random, threading, time, collections, urllib.parse
+from requests.adapters import HTTPAdapter
+
+# 上游網站的斷路器開啟中，請求未送出即失敗
+class circuit_open_error(requests.ConnectionError):
+    pass
+
+# 同一網站的同時請求數已達上限，且在等待時間內沒有空出名額，請求未送出即失敗
+class host_busy_error(requests.ConnectionError):
+    pass
+
+# 定義circuit_breaker物件，依最近請求的失敗比例決定是否暫停對某個上游網站發出請求
+# closed：正常發出請求；open：直接失敗，冷卻時間過後轉為half_open；half_open：只放行一個試探請求，成功則回到closed，失敗則重新開啟
+# 試探請求若未回報結果(例如被取消)，超過冷卻時間後再放行下一個試探請求，避免斷路器永遠停在half_open
+class circuit_breaker:
+    def __init__(self, window=20, min_requests=5, failure_rate=0.5, cooldown=30): # 初始化
+        self.window = window # 計算失敗比例的最近請求數
+        self.min_requests = min_requests # 最近請求數達到此數量才會判斷是否開啟
+        self.failure_rate = failure_rate # 失敗比例達到此值時開啟
+        self.cooldown = cooldown # 開啟後經過多少秒才放行試探請求
+        self.lock = threading.Lock() # 保護狀態及紀錄
+        self.results = collections.deque(maxlen=window) # 最近請求是否成功
+        self.state = 'closed' # closed、open或half_open
+        self.opened_at = 0 # 最後一次開啟的時間
+        self.probing = False # half_open時是否已有試探請求進行中
+        self.probe_started = 0 # 試探請求的開始時間
+        self.rejected = 0 # 開啟期間被拒絕的請求數
+        return
+    def allow(self): # 是否可以發出請求，half_open時只放行一個試探請求
+        with self.lock:
+            now = time.time()
+            if self.state == 'open' and now - self.opened_at >= self.cooldown: # 冷卻時間已過
+                self.state = 'half_open'
+                self.probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and (not self.probing or now - self.probe_started >= self.cooldown): # 沒有試探請求，或上一個試探請求未回報結果
+                self.probing = True
+                self.probe_started = now
+                return True
+            self.rejected += 1
+            return False
+    def open(self): # 開啟斷路器，需持有lock
+        self.state = 'open'
+        self.opened_at = time.time()
+        self.probing = False
+        self.results.clear()
+        return
+    def record(self, ok): # 紀錄一次請求結果
+        with self.lock:
+            if self.state == 'half_open': # 試探請求的結果決定是否恢復
+                if ok:
+                    self.state = 'closed'
+                    self.probing = False
+                else:
+                    self.open()
+                return
+            if self.state == 'open': # 開啟前已送出的請求，結果不影響狀態
+                return
+            self.results.append(ok)
+            failures = self.results.count(False)
+            if len(self.results) >= self.min_requests and failures >= self.failure_rate * len(self.results):
+                self.open()
+        return
+
+# 定義http_fetcher物件，所有爬蟲共用的連線池，提供逾時、重試、同網站同時請求上限及條件式請求
+class http_fetcher:
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3,
+                 per_host_limit=8, pool_size=10, conditional_cache_size=256, metrics=None,
+                 breaker_window=20, breaker_min_requests=5, breaker_failure_rate=0.5, breaker_cooldown=30, slot_timeout=None): # 初始化，metrics為metrics_registry，用來紀錄各網站的回應時間、狀態碼及位元組數，breaker_開頭為各網站斷路器的設定
+        self.timeout = (connect_timeout, read_timeout) # 連線及讀取逾時秒數
+        self.retries = retries # 連線失敗或伺服器錯誤時的重試次數
+        self.backoff = backoff # 重試等待的基本秒數，每次加倍並加上隨機抖動
+        self.per_host_limit = per_host_limit # 同一網站同時進行的請求數上限
+        self.slot_timeout = read_timeout if slot_timeout is None else slot_timeout # 等待同一網站請求名額的秒數上限，預設與讀取逾時相同
+        self.session = requests.Session() # 共用Session，同一網站的連線會重複使用(keep-alive)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max(pool_size, per_host_limit))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock() # 保護host_limits及條件式請求快取
+        self.host_limits = {} # 主機名稱→Semaphore
+        self.conditional_cache = collections.OrderedDict() # 網址→帶有ETag或Last-Modified的最後一次回應
+        self.conditional_cache_size = conditional_cache_size # 條件式請求快取的網址數上限
+        self.not_modified = 0 # 收到304的次數
+        self.metrics = metrics
+        self.breaker_options = dict(window=breaker_window, min_requests=breaker_min_requests, failure_rate=breaker_failure_rate, cooldown=breaker_cooldown)
+        self.breakers = {} # 主機名稱→circuit_breaker
+        return
+    def host_limit(self, url): # 取得該網站的Semaphore
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_limits[host]
+    def acquire(self, url): # 取得該網站的請求名額並回傳Semaphore，slot_timeout秒內取不到時拋出host_busy_error，網站卡住時請求執行緒不會無限期排隊
+        limit = self.host_limit(url)
+        if not limit.acquire(timeout=self.slot_timeout):
+            host = urllib.parse.urlsplit(url).netloc
+            if self.metrics is not None:
+                self.metrics.inc('upstream_responses_total', host=host, status='busy')
+            raise host_busy_error('no free request slot for ' + host)
+        return limit
+    def breaker(self, url): # 取得該網站的斷路器
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = circuit_breaker(**self.breaker_options)
+            return self.breakers[host]
+    def admit(self, url): # 斷路器允許時回傳該網站的斷路器，開啟中時拋出circuit_open_error，非同步版本的請求也共用
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise circuit_open_error('circuit open for ' + urllib.parse.urlsplit(url).netloc)
+        return breaker
+    def breaker_states(self): # 回傳 主機名稱→(斷路器狀態, 被拒絕的請求數)
+        with self.lock:
+            breakers = list(self.breakers.items())
+        return {host: (breaker.state, breaker.rejected) for host, breaker in breakers}
+    def cached(self, url): # 取得該網址上一次的回應
+        with self.lock:
+            response = self.conditional_cache.get(url)
+            if response is not None:
+                self.conditional_cache.move_to_end(url) # 最近使用的移到最後
+            return response
+    def remember(self, url, response): # 紀錄帶有ETag或Last-Modified的回應，供下次條件式請求使用
+        if 'ETag' not in response.headers and 'Last-Modified' not in response.headers:
+            return
+        with self.lock:
+            self.conditional_cache[url] = response
+            self.conditional_cache.move_to_end(url)
+            while len(self.conditional_cache) > self.conditional_cache_size: # 超過上限時移除最久未使用的網址
+                self.conditional_cache.popitem(last=False)
+        return
+    def request(self, url, headers): # 發出請求，連線失敗或5xx時依次數重試
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code < 500 or attempt >= self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)) # 指數退避加隨機抖動，避免同時重試
+            attempt += 1
+    def timed_request(self, url, headers): # 發出請求並紀錄回應時間、狀態碼及位元組數，包含重試
+        if self.metrics is None:
+            return self.request(url, headers)
+        host = urllib.parse.urlsplit(url).netloc
+        try:
+            with self.metrics.stage(host, 'upstream_seconds', 'host'):
+                response = self.request(url, headers)
+        except Exception:
+            self.metrics.inc('upstream_responses_total', host=host, status='error')
+            raise
+        self.metrics.inc('upstream_responses_total', host=host, status=str(response.status_code))
+        self.metrics.inc('upstream_bytes_total', len(response.content), host=host)
+        return response
+    def get(self, url, headers=None): # 對目標網址發出GET請求並回傳回應，內容未改變時回傳上一次的回應
+        headers = dict(headers or {})
+        previous = self.cached(url)
+        if previous is not None: # 帶上條件式請求標頭，內容未改變時伺服器只會回傳304
+            if 'ETag' in previous.headers:
+                headers['If-None-Match'] = previous.headers['ETag']
+            if 'Last-Modified' in previous.headers:
+                headers['If-Modified-Since'] = previous.headers['Last-Modified']
+        breaker = self.admit(url) # 網站持續失敗時不發出請求，直接失敗
+        try:
+            limit = self.acquire(url) # 限制同一網站的同時請求數，等不到名額時視為失敗
+            try:
+                response = self.timed_request(url, headers)
+            finally:
+                limit.release()
+        except BaseException: # 等不到名額、重試後仍連線失敗、逾時或被中斷，試探請求也必須回報結果
+            breaker.record(False)
+            raise
+        breaker.record(response.status_code < 500)
+        if response.status_code == 304 and previous is not None:
+            self.not_modified += 1
+            return previous
+        response.raise_for_status()
+        self.remember(url, response)
+        return response
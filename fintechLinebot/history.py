@@ -0,0 +1,181 @@
+# datetime      Python標準套件，用來處理資料日期
+import datetime
+# django        使用ORM儲存歷史價格
+from django.db import transaction
+from django.utils import timezone
+
+# models        歷史價格的資料表，內容在models.py
+from .models import PriceSeries, DailyBar, SyncRecord
+# parsers       自己寫的解析工具，內容在parsers.py
+from .parsers import parse_commodity_js
+
+taipei = datetime.timezone(datetime.timedelta(hours=8)) # 證交所所在時區
+
+def parse_number(text, kind=float): # 將證交所的數字字串轉成數字，'--'等無資料時回傳None
+    text = str(text).replace(',', '').strip()
+    try:
+        return kind(float(text)) if kind is int else kind(text)
+    except ValueError:
+        return None
+
+def parse_roc_date(text): # 將民國日期(109/12/01)轉成date
+    year, month, day = (int(part) for part in text.strip().split('/'))
+    return datetime.date(year + 1911, month, day)
+
+def get_series(market, symbol, name=''): # 取得價格序列，不存在時建立
+    series, created = PriceSeries.objects.get_or_create(market=market, symbol=symbol, defaults={'name': name})
+    if name and series.name != name:
+        series.name = name
+        series.save(update_fields=['name'])
+    return series
+
+def is_stale(series, max_age): # 序列是否從未同步或已超過max_age秒未同步
+    return series.synced_at is None or (timezone.now() - series.synced_at).total_seconds() > max_age
+
+def append_bars(series, bars): # 只新增比已儲存的最新日期還新的日資料，bars為依日期排序的[{'date': ..., 'close': ...}, ...]，回傳新增筆數
+    if series.latest_date is not None:
+        bars = [bar for bar in bars if bar['date'] > series.latest_date]
+    with transaction.atomic():
+        DailyBar.objects.bulk_create([DailyBar(series=series, **bar) for bar in bars], batch_size=500, ignore_conflicts=True)
+        if bars:
+            series.latest_date = max(bar['date'] for bar in bars)
+        series.synced_at = timezone.now()
+        series.save(update_fields=['latest_date', 'synced_at'])
+    return len(bars)
+
+def merge_bars(series, bars): # 新增尚未儲存的日期，不限於最新日期之後，用來回補歷史資料，回傳新增筆數
+    if bars:
+        stored = set(series.bars.filter(date__gte=min(bar['date'] for bar in bars)).values_list('date', flat=True))
+        bars = [bar for bar in bars if bar['date'] not in stored]
+    with transaction.atomic():
+        DailyBar.objects.bulk_create([DailyBar(series=series, **bar) for bar in bars], batch_size=500, ignore_conflicts=True)
+        if bars and (series.latest_date is None or max(bar['date'] for bar in bars) > series.latest_date):
+            series.latest_date = max(bar['date'] for bar in bars)
+            series.save(update_fields=['latest_date'])
+    return len(bars)
+
+def record_sync(feed, symbol, date, now=None): # 紀錄一次同步
+    SyncRecord.objects.update_or_create(feed=feed, symbol=symbol, date=date, defaults={'synced_at': now or timezone.now()})
+    return
+
+def commodity_bars(content): # 解析stockq原物料歷史價格，回傳依日期排序的日資料
+    data_list = parse_commodity_js(content)
+    return [
+        {'date': datetime.datetime.strptime(row[0], '%Y/%m/%d').date(), 'close': row[1]}
+        for row in data_list[1:]
+    ]
+
+def sync_commodity(commodity, content, name=''): # 將stockq原物料歷史價格中尚未儲存的日期加入資料庫，回傳新增筆數
+    return append_bars(get_series('commodity', commodity, name), commodity_bars(content))
+
+def load_closes(market, symbol, days=None): # 依日期順序回傳最近days筆[(日期, 價格), ...]，days為None時回傳全部
+    bars = DailyBar.objects.filter(series__market=market, series__symbol=symbol).order_by('-date').values_list('date', 'close')
+    if days is not None:
+        bars = bars[:days]
+    return list(reversed(bars))
+
+def stock_day_date(payload): # 取得證交所當日全部股票行情的資料日期，沒有時以台北時間的今天為準
+    if payload.get('date'):
+        return datetime.datetime.strptime(payload['date'], '%Y%m%d').date()
+    return datetime.datetime.now(taipei).date()
+
+def stock_day_bar(row): # 將證交所行情資料列(代號, 名稱, 成交股數, 成交金額, 開盤價, 最高價, 最低價, 收盤價, 漲跌價差, 成交筆數)轉成日資料
+    return {
+        'volume': parse_number(row[2], int),
+        'turnover': parse_number(row[3], int),
+        'open': parse_number(row[4]),
+        'high': parse_number(row[5]),
+        'low': parse_number(row[6]),
+        'close': parse_number(row[7]),
+        'change': parse_number(row[8]),
+        'transactions': parse_number(row[9], int)
+    }
+
+def sync_stock_day(payload): # 將證交所當日全部股票行情存入資料庫，同一天只會新增一次，回傳新增筆數
+    date = stock_day_date(payload)
+    rows = payload['data']
+    now = timezone.now()
+    with transaction.atomic():
+        # 一次建立尚未存在的序列
+        existing = dict(PriceSeries.objects.filter(market='stock').values_list('symbol', 'id'))
+        PriceSeries.objects.bulk_create(
+            [PriceSeries(market='stock', symbol=row[0], name=row[1]) for row in rows if row[0] not in existing],
+            batch_size=500, ignore_conflicts=True
+        )
+        existing = dict(PriceSeries.objects.filter(market='stock').values_list('symbol', 'id'))
+        # 只新增此日期尚未儲存的日資料
+        stored = set(DailyBar.objects.filter(series__market='stock', date=date).values_list('series_id', flat=True))
+        bars = [DailyBar(series_id=existing[row[0]], date=date, **stock_day_bar(row)) for row in rows if existing[row[0]] not in stored]
+        DailyBar.objects.bulk_create(bars, batch_size=500, ignore_conflicts=True)
+        PriceSeries.objects.filter(market='stock', symbol__in=[row[0] for row in rows]).exclude(latest_date__gte=date).update(latest_date=date)
+        PriceSeries.objects.filter(market='stock').update(synced_at=now)
+        record_sync('stock_day_all', '', date, now)
+    return len(bars)
+
+def stock_synced_since(since): # 證交所當日行情是否已在since(datetime)之後同步過
+    return SyncRecord.objects.filter(feed='stock_day_all', synced_at__gte=since).exists()
+
+def stock_day_all_date(): # 最近一次同步的證交所當日全部行情的資料日期，從未同步時回傳None
+    return SyncRecord.objects.filter(feed='stock_day_all').order_by('-date').values_list('date', flat=True).first()
+
+def format_number(value, pattern): # 將數字轉回證交所的顯示格式，無資料時顯示'--'
+    return '--' if value is None else pattern.format(value)
+
+def load_stock_day(): # 回傳最近一次同步的證交所當日全部行情，格式與證交所行情資料列相同：股票代碼→資料列
+    # 只看當日行情的同步紀錄，個股走勢圖回補的較新日資料只有單一股票，不能當成全部行情的日期
+    latest = stock_day_all_date()
+    if latest is None:
+        return {}
+    bars = DailyBar.objects.filter(series__market='stock', date=latest).values_list(
+        'series__symbol', 'series__name', 'volume', 'turnover', 'open', 'high', 'low', 'close', 'change', 'transactions'
+    )
+    patterns = ['{:,}', '{:,}', '{:.2f}', '{:.2f}', '{:.2f}', '{:.2f}', '{:+.2f}', '{:,}']
+    return {
+        bar[0]: [bar[0], bar[1]] + [format_number(value, pattern) for value, pattern in zip(bar[2:], patterns)]
+        for bar in bars
+    }
+
+def stock_month_bars(payload): # 解析證交所個股月成交資訊(STOCK_DAY)，回傳依日期排序的日資料
+    bars = []
+    for row in payload.get('data', []): # 日期, 成交股數, 成交金額, 開盤價, 最高價, 最低價, 收盤價, 漲跌價差, 成交筆數
+        bar = stock_day_bar([None, None] + row[1:])
+        bar['date'] = parse_roc_date(row[0])
+        bars.append(bar)
+    return sorted(bars, key=lambda bar: bar['date'])
+
+def sync_stock_month(series, month, payload): # 將個股月成交資訊存入資料庫並紀錄該月已抓取，回傳新增筆數
+    with transaction.atomic():
+        added = merge_bars(series, stock_month_bars(payload))
+        record_sync('stock_day', series.symbol, month)
+    return added
+
+def month_start(date): # 該月1日
+    return datetime.date(date.year, date.month, 1)
+
+def next_month(date): # 下個月1日
+    return month_start(month_start(date) + datetime.timedelta(days=31))
+
+def weekdays(start, end): # start(含)到end(不含)之間的週一至週五天數
+    return sum(1 for i in range((end - start).days) if (start + datetime.timedelta(days=i)).weekday() < 5)
+
+def missing_months(series, months, recent_days=3, today=None): # 回傳最近months個月中需要向證交所抓取的月份(每月1日)
+    # 每日同步只會補上同步當天的資料，月份是否完整只能由個股月成交資訊的抓取紀錄判斷，不看日資料的日期
+    # 過去的月份：從未抓取，或抓取時該月尚未結束，則重新抓取
+    # 本月：從未抓取則抓取；上次抓取超過recent_days天，且之後的日資料少於這段期間的週一至週五天數(中間有缺漏)時重新抓取
+    today = today or datetime.datetime.now(taipei).date()
+    month = month_start(today)
+    candidates = []
+    for i in range(months):
+        candidates.append(month)
+        month = month_start(month - datetime.timedelta(days=1))
+    records = dict(SyncRecord.objects.filter(feed='stock_day', symbol=series.symbol, date__gte=candidates[-1]).values_list('date', 'synced_at'))
+    synced = {month: synced_at.astimezone(taipei).date() for month, synced_at in records.items()} # 月份→抓取日期(台北時間)
+    result = [month for month in candidates[1:] if month not in synced or synced[month] < next_month(month)]
+    current = candidates[0]
+    if current not in synced:
+        result.append(current)
+    elif (today - synced[current]).days > recent_days:
+        stored = series.bars.filter(date__gte=synced[current], date__lt=today).count()
+        if stored < weekdays(synced[current], today):
+            result.append(current)
+    return sorted(result)
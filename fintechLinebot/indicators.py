@@ -0,0 +1,68 @@
+# numpy         支援高階大量的維度陣列與矩陣運算，所有指標都以陣列運算一次算完，不逐筆迴圈
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# 此模組可同時用於原物料及證交所股票，輸入為依日期排序且不含缺值的價格，輸出與輸入等長，資料不足的位置為NaN
+
+def as_prices(values): # 將價格轉成float64陣列，None轉成NaN
+    return np.array(values, dtype=np.float64)
+
+def sma(values, window, min_periods=None): # 簡單移動平均，min_periods為至少需要幾筆資料，預設為window
+    values = as_prices(values)
+    min_periods = window if min_periods is None else min_periods
+    total = np.cumsum(values)
+    total[window:] = total[window:] - total[:-window] # 以累積和相減取得每個視窗的總和
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    result = total / counts
+    result[counts < min_periods] = np.nan
+    return result
+
+def ema(values, window): # 指數移動平均，alpha為2/(window+1)，第一筆以價格本身為起點
+    values = as_prices(values)
+    alpha = 2.0 / (window + 1)
+    decay = 1.0 - alpha
+    if decay == 0 or len(values) == 0: # window為1時即為價格本身
+        return values.copy()
+    # 將遞迴式展開成 y_k = decay^(k+1) * (起點 + alpha * sum(x_j / decay^(j+1)))，以累積和一次算完
+    # decay的負次方會隨長度變大，因此每block筆(decay^block約為1e-50)重新以上一段的結果為起點，避免數值溢位
+    block = max(1, int(np.log(1e-50) / np.log(decay)))
+    result = np.empty_like(values)
+    previous = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        result[start:start + len(chunk)] = powers * (previous + alpha * np.cumsum(chunk / powers))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+def windows(values, window): # 回傳每個位置往前window筆的二維唯讀視圖，不複製資料，前window-1個位置以NaN補齊
+    padded = np.concatenate([np.full(window - 1, np.nan), as_prices(values)])
+    stride = padded.strides[0]
+    return as_strided(padded, shape=(len(padded) - window + 1, window), strides=(stride, stride), writeable=False)
+
+def rolling_high(values, window): # 滾動最高價，資料不足window筆時為NaN
+    return windows(values, window).max(axis=1)
+
+def rolling_low(values, window): # 滾動最低價，資料不足window筆時為NaN
+    return windows(values, window).min(axis=1)
+
+def pct_change(values, periods=1): # 與periods筆之前相比的漲跌比例(%)，前periods個位置為NaN
+    values = as_prices(values)
+    result = np.full(len(values), np.nan)
+    result[periods:] = (values[periods:] / values[:-periods] - 1.0) * 100
+    return result
+
+def compute(values, sma_windows=(), ema_windows=(), high_windows=(), low_windows=(), change_periods=(), min_periods=None): # 一次計算多個指標，回傳 指標名稱→陣列，名稱如'MA20'、'EMA12'、'HIGH20'、'LOW20'、'CHG1'
+    prices = as_prices(values)
+    result = {}
+    for window in sma_windows:
+        result['MA' + str(window)] = sma(prices, window, min_periods)
+    for window in ema_windows:
+        result['EMA' + str(window)] = ema(prices, window)
+    for window in high_windows:
+        result['HIGH' + str(window)] = rolling_high(prices, window)
+    for window in low_windows:
+        result['LOW' + str(window)] = rolling_low(prices, window)
+    for periods in change_periods:
+        result['CHG' + str(periods)] = pct_change(prices, periods)
+    return result
@@ -0,0 +1,59 @@
+# os            Python標準套件，用來列出資料夾及取得修改時間
+# shutil        Python標準套件，用來遞迴刪除資料夾
+# threading     Python標準套件，用來在背景執行清理工作
+# time          Python標準套件，用來計算資料夾存在時間
+import os, shutil, threading, time
+
+# 定義artifact_janitor物件，在背景定期刪除過期的圖表資料夾及執行其他清理工作，不佔用處理請求的執行緒
+class artifact_janitor:
+    def __init__(self, root, max_age=60, interval=15): # 初始化
+        self.root = root # 圖表資料夾所在的根目錄
+        self.max_age = max_age # 資料夾存活秒數，需足夠讓LINE下載圖片
+        self.interval = interval # 每次清理間隔秒數
+        self.lock = threading.Lock() # 保護背景執行緒只會啟動一次
+        self.thread = None # 背景清理執行緒
+        self.tasks = [] # 每次清理時一併執行的其他工作，例如淘汰圖片快取
+        self.removed = 0 # 累計刪除的資料夾數量
+        self.alive = 0 # 最後一次清理後仍存在的資料夾數量
+        return
+    def start(self): # 啟動背景執行緒，重複呼叫不會啟動第二個
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='artifact-janitor', daemon=True)
+                self.thread.start()
+        return
+    def add_task(self, task): # 加入每次清理時要執行的工作，並確保背景執行緒已啟動
+        self.tasks.append(task)
+        self.start()
+        return
+    def artifacts(self): # 列出根目錄下舊版commodity_spider留下的隨機整數名稱資料夾
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.root, name) for name in names if name.isdigit()]
+    def sweep(self): # 刪除超過存活時間的資料夾
+        now = time.time()
+        alive = 0
+        for path in self.artifacts():
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError: # 已被其他worker刪除
+                continue
+            if age < self.max_age:
+                alive += 1
+                continue
+            shutil.rmtree(path, ignore_errors=True) # 多個worker可能同時刪除，忽略錯誤
+            self.removed += 1
+        self.alive = alive
+        return alive
+    def run(self): # 背景執行緒主迴圈
+        while True:
+            time.sleep(self.interval)
+            for task in [self.sweep] + self.tasks:
+                try:
+                    task()
+                except Exception: # 清理失敗不可讓背景執行緒結束
+                    pass
+    def stats(self): # 回傳目前統計數據
+        return {'removed': self.removed, 'alive': self.alive}
@@ -0,0 +1,13 @@
+# django    用來撰寫管理指令
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+# refdata   自己寫的參考資料索引，內容在refdata.py
+from fintechLinebot.refdata import build_index
+
+# 定義build_refdata指令，部署時預先將company.txt及產業JSON編譯成參考資料索引
+class Command(BaseCommand):
+    help = '將company.txt、industry_analysis.json、industry_news.json編譯成參考資料索引'
+    def handle(self, *args, **options):
+        count = build_index(settings.BASE_DIR, settings.REFDATA_PATH)
+        self.stdout.write('已建立參考資料索引：' + settings.REFDATA_PATH + '（' + str(count) + '家公司）')
@@ -0,0 +1,47 @@
+# json      Python標準套件，用來解析證交所回應
+import json
+# django    用來撰寫管理指令
+from django.core.management.base import BaseCommand, CommandError
+
+# catalog   原物料清單，內容在catalog.py
+from fintechLinebot.catalog import commodity_dict
+# history   自己寫的歷史價格儲存，內容在history.py
+from fintechLinebot import history
+# spider    共用的連線池及上游網址
+from fintechLinebot.spider import fetcher, stockq_commodity_js_url, twse_stock_day_all_url, sync_stock_history
+
+# 定義ingest_prices指令，將原物料及股票日資料增量存入資料庫，可由排程每天執行
+class Command(BaseCommand):
+    help = '將原物料歷史價格及證交所當日行情增量存入資料庫，只新增尚未儲存的日期'
+    def add_arguments(self, parser):
+        parser.add_argument('--commodities', action='store_true', help='只同步原物料歷史價格')
+        parser.add_argument('--stocks', action='store_true', help='只同步證交所當日全部股票行情')
+        parser.add_argument('--backfill', nargs='+', metavar='CODE', default=[], help='回補指定股票的歷史日資料')
+        parser.add_argument('--months', type=int, default=12, help='回補的月數，已儲存的月份不再抓取')
+    def handle(self, *args, **options):
+        everything = not (options['commodities'] or options['stocks'] or options['backfill'])
+        if everything or options['commodities']:
+            self.ingest_commodities()
+        if everything or options['stocks']:
+            self.ingest_stock_day()
+        for code in options['backfill']:
+            self.backfill_stock(code, options['months'])
+    def ingest_commodities(self): # 每個原物料抓取一次歷史價格，只新增尚未儲存的日期
+        for name, commodity in commodity_dict.items():
+            try:
+                content = fetcher.get(stockq_commodity_js_url + commodity + '_sma.js').text
+                added = history.sync_commodity(commodity, content, name)
+            except Exception as e:
+                self.stderr.write(name + '(' + commodity + ')同步失敗：' + repr(e))
+                continue
+            self.stdout.write(name + '(' + commodity + ')新增' + str(added) + '筆')
+    def ingest_stock_day(self): # 抓取一次證交所當日全部股票行情，同一天只會新增一次
+        try:
+            payload = json.loads(fetcher.get(twse_stock_day_all_url).content)
+        except Exception as e:
+            raise CommandError('證交所行情同步失敗：' + repr(e))
+        added = history.sync_stock_day(payload)
+        self.stdout.write('證交所' + str(history.stock_day_date(payload)) + '行情新增' + str(added) + '筆')
+    def backfill_stock(self, code, months): # 依月份回補個股歷史日資料
+        added = sync_stock_history(code, months)
+        self.stdout.write(code + '回補' + str(added) + '筆')
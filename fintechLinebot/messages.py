@@ -0,0 +1,165 @@
+# json      Python標準套件，用來序列化訊息
+import json
+
+# linebot   Linebot SDK，Line官方提供用來處理訊息的套件
+from linebot.models import TemplateSendMessage, ButtonsTemplate, MessageTemplateAction, CarouselTemplate, CarouselColumn
+
+# 定義prebuilt_message物件，啟動時就序列化好的固定訊息，回覆時只需加上reply token
+class prebuilt_message:
+    def __init__(self, messages): # 初始化，messages為SendMessage或其list
+        self.payload = serialize(messages) # 序列化後的訊息JSON字串
+        return
+
+def serialize(messages): # 將訊息序列化成LINE API的messages欄位，已序列化的訊息直接回傳
+    if isinstance(messages, prebuilt_message):
+        return messages.payload
+    if not isinstance(messages, list):
+        messages = [messages]
+    return json.dumps([message.as_json_dict() for message in messages], ensure_ascii=False, separators=(',', ':'))
+
+def reply_body(reply_token, messages): # 建構reply API的請求內容
+    return ('{"replyToken":' + json.dumps(reply_token) + ',"messages":' + serialize(messages) + '}').encode('utf-8')
+
+def main_menu(): # 主功能選單
+    return TemplateSendMessage(
+        alt_text='功能選單',
+        template=ButtonsTemplate(
+            title='產業資訊',
+            text='本功能提供查詢產業、原物料、特定公司等相關資訊。',
+            actions=[
+                MessageTemplateAction(
+                    label='查詢特定公司相關資訊',
+                    text='特定公司相關資訊'
+                ),
+                MessageTemplateAction(
+                    label='查詢原物料價格',
+                    text='原物料價格'
+                ),
+                MessageTemplateAction(
+                    label='查詢產業相關資訊',
+                    text='產業相關資訊'
+                )
+            ]
+        )
+    )
+
+def carousel(labels, title, alt_text, first_message_columns): # 將按鈕每三個放進一個輪播欄位，並分成兩則輪播訊息
+    button_list = []
+    ### 將按鈕每三個分成一個sublist
+    for count, label in enumerate(labels):
+        if count % 3 == 0:
+            button_list.append([]) # 插入新的空sublist
+        #在最後一個sublist放入按鈕
+        button_list[-1].append(
+            MessageTemplateAction(
+                label=label,
+                text=label
+            )
+        )
+    columns = [
+        CarouselColumn(
+            title=title + str(index+1),
+            text=' ',
+            actions=sub_button_list
+        )
+        for index, sub_button_list in enumerate(button_list)
+    ]
+    ### 將選單分為兩則訊息
+    return [
+        TemplateSendMessage(
+            alt_text=alt_text,
+            template=CarouselTemplate(
+                columns=columns[:first_message_columns]
+            )
+        ),
+        TemplateSendMessage(
+            alt_text=alt_text,
+            template=CarouselTemplate(
+                columns=columns[first_message_columns:]
+            )
+        )
+    ]
+
+def industry_carousel(industry_dict): # 產業輪播選單
+    return carousel(industry_dict.values(), '產業', '產業列表', 7)
+
+def commodity_carousel(commodity_dict): # 原物料輪播選單
+    return carousel(commodity_dict.keys(), '原料', '原物料列表', 6)
+
+def industry_menu(industry): # 產業資訊功能選單
+    return TemplateSendMessage(
+        alt_text=industry + '產業資訊',
+        template=ButtonsTemplate(
+            title=industry,
+            text='請選擇欲查詢的項目。',
+            actions=[
+                MessageTemplateAction(
+                    label='產業分析',
+                    text=industry + '—產業分析'
+                ),
+                MessageTemplateAction(
+                    label='產業新聞',
+                    text=industry + '—產業新聞'
+                )
+            ]
+        )
+    )
+
+def commodity_menu(commodity): # 原物料價格功能選單
+    return TemplateSendMessage(
+        alt_text='原物料價格',
+        template=ButtonsTemplate(
+            title=commodity,
+            text='請選擇欲查詢的項目。',
+            actions=[
+                MessageTemplateAction(
+                    label='價格走勢圖',
+                    text=commodity + '—價格走勢圖'
+                ),
+                MessageTemplateAction(
+                    label='最新價格',
+                    text=commodity + '—最新價格'
+                )
+            ]
+        )
+    )
+
+def company_carousel(companies, industry_dict): # 公司搜尋結果輪播選單，companies為依相關程度排序的[(股票代碼, 公司名稱, 產業代碼), ...]
+    return TemplateSendMessage(
+        alt_text='公司搜尋結果',
+        template=CarouselTemplate(
+            columns=[
+                CarouselColumn(
+                    title=code + ' - ' + name,
+                    text=industry_dict.get(industry_id, ' '),
+                    actions=[
+                        MessageTemplateAction(
+                            label='股票價格',
+                            text=code + '—股票價格'
+                        ),
+                        MessageTemplateAction(
+                            label='公司新聞',
+                            text=code + '—公司新聞'
+                        ),
+                        MessageTemplateAction(
+                            label='公司相關資訊',
+                            text=code
+                        )
+                    ]
+                )
+                for code, name, industry_id in companies
+            ]
+        )
+    )
+
+def build_registry(industry_dict, commodity_dict): # 啟動時預先序列化所有固定選單，回傳 名稱→prebuilt_message
+    registry = {
+        'main_menu': prebuilt_message(main_menu()),
+        'industry_carousel': prebuilt_message(industry_carousel(industry_dict)),
+        'commodity_carousel': prebuilt_message(commodity_carousel(commodity_dict))
+    }
+    for industry in industry_dict.values():
+        registry['industry:' + industry] = prebuilt_message(industry_menu(industry))
+    for commodity in commodity_dict.keys():
+        registry['commodity:' + commodity] = prebuilt_message(commodity_menu(commodity))
+    return registry
@@ -0,0 +1,140 @@
+# bisect        Python標準套件，用來找出數值所屬的直方圖區間
+# threading     Python標準套件，保護統計數據
+# time          Python標準套件，用來計時
+# contextvars   Python標準套件，紀錄目前處理中事件的追蹤資料，執行緒及協程各自獨立
+# contextlib    Python標準套件，用來撰寫計時用的with區塊
+# functools     Python標準套件，用來撰寫計時用的裝飾器
+# asyncio       Python標準套件，用來判斷是否為coroutine函式
+# json          Python標準套件，將追蹤資料輸出成一行JSON
+# logging       Python標準套件，用來輸出追蹤紀錄
+import bisect, threading, time, contextvars, contextlib, functools, asyncio, json, logging
+
+trace_logger = logging.getLogger(__name__ + '.trace')
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # 預設的直方圖區間上限(秒)
+
+current_trace = contextvars.ContextVar('current_trace', default=None) # 目前處理中事件的追蹤資料
+
+# 定義histogram物件，固定區間的直方圖，只保存各區間的次數、總和及總次數
+class histogram:
+    def __init__(self, buckets): # 初始化
+        self.buckets = buckets # 區間上限，由小到大
+        self.counts = [0] * (len(buckets) + 1) # 各區間的次數，最後一個為超過所有上限的次數
+        self.sum = 0.0 # 觀測值總和
+        self.count = 0 # 觀測次數
+        return
+    def observe(self, value): # 加入一個觀測值
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        return
+
+def format_labels(labels): # 轉成Prometheus的標籤格式，如{stage="parse"}
+    if not labels:
+        return ''
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+    return '{' + ','.join(key + '="' + value + '"' for key, value in escaped) + '}'
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# 定義metrics_registry物件，在行程內彙整計數器及直方圖，並輸出成Prometheus文字格式
+# 每個gunicorn worker各自統計，由Prometheus分別抓取後彙總
+class metrics_registry:
+    def __init__(self, prefix='', buckets=default_buckets, trace_log=False): # 初始化
+        self.prefix = prefix # 所有指標名稱的前綴
+        self.buckets = tuple(buckets) # 直方圖區間上限
+        self.trace_log = trace_log # 是否每個事件輸出一行追蹤紀錄
+        self.lock = threading.Lock() # 保護統計數據
+        self.counters = {} # (名稱, 標籤)→累計值
+        self.histograms = {} # (名稱, 標籤)→histogram
+        self.descriptions = {} # 名稱→說明
+        self.collectors = [] # 輸出時才呼叫的函式，回傳[(名稱, 類型, 標籤dict, 值), ...]，用來輸出其他物件已有的統計數據
+        return
+    def describe(self, name, text): # 設定指標說明
+        self.descriptions[name] = text
+        return
+    def add_collector(self, collect): # 加入輸出時才呼叫的函式
+        self.collectors.append(collect)
+        return
+    def inc(self, name, value=1, **labels): # 計數器加上value
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        return
+    def observe(self, name, value, **labels): # 在直方圖中加入一個觀測值
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = histogram(self.buckets)
+            self.histograms[key].observe(value)
+        return
+    @contextlib.contextmanager
+    def stage(self, name, histogram='stage_seconds', label='stage'): # 計算with區塊的執行時間，紀錄在直方圖及目前事件的追蹤資料中
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(histogram, elapsed, **{label: name})
+            trace = current_trace.get()
+            if trace is not None:
+                trace['stages'].append((name, elapsed))
+    def timed(self, histogram='spider_seconds', label='function'): # 計算函式執行時間的裝飾器，支援coroutine函式
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.stage(func.__name__, histogram, label):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(func.__name__, histogram, label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    @contextlib.contextmanager
+    def trace(self, **fields): # 追蹤一個事件，with區塊中的每個stage都會紀錄在回傳的dict中，結束時依設定輸出一行JSON
+        trace = dict(fields, stages=[])
+        token = current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        except Exception as e: # 紀錄錯誤類型後繼續往外拋出
+            trace['error'] = type(e).__name__
+            raise
+        finally:
+            current_trace.reset(token)
+            elapsed = time.perf_counter() - start
+            self.observe('event_seconds', elapsed)
+            if self.trace_log:
+                trace['total_ms'] = round(elapsed * 1000, 2)
+                trace['stages'] = [[name, round(seconds * 1000, 2)] for name, seconds in trace['stages']]
+                trace_logger.info(json.dumps(trace, ensure_ascii=False))
+    def render(self): # 輸出成Prometheus文字格式
+        families = {} # 名稱→(類型, [(後綴, 標籤, 值), ...])
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                families.setdefault(name, ('counter', []))[1].append(('', labels, value))
+            for (name, labels), data in self.histograms.items():
+                samples = families.setdefault(name, ('histogram', []))[1]
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), data.counts):
+                    cumulative += count
+                    samples.append(('_bucket', labels + (('le', '+Inf' if bound == float('inf') else repr(float(bound))),), cumulative))
+                samples.append(('_sum', labels, data.sum))
+                samples.append(('_count', labels, data.count))
+        for collect in self.collectors:
+            for name, kind, labels, value in collect():
+                families.setdefault(name, (kind, []))[1].append(('', tuple(sorted(labels.items())), value))
+        lines = []
+        for name in sorted(families):
+            kind, samples = families[name]
+            full_name = self.prefix + name
+            if name in self.descriptions:
+                lines.append('# HELP ' + full_name + ' ' + self.descriptions[name])
+            lines.append('# TYPE ' + full_name + ' ' + kind)
+            for suffix, labels, value in samples:
+                lines.append(full_name + suffix + format_labels(labels) + ' ' + format_value(value))
+        return '\n'.join(lines) + '\n'
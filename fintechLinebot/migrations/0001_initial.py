@@ -0,0 +1,57 @@
+# Generated by Django 3.1.4 on 2026-10-18 09:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBar',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('open', models.FloatField(null=True)),
+                ('high', models.FloatField(null=True)),
+                ('low', models.FloatField(null=True)),
+                ('close', models.FloatField(null=True)),
+                ('change', models.FloatField(null=True)),
+                ('volume', models.BigIntegerField(null=True)),
+                ('turnover', models.BigIntegerField(null=True)),
+                ('transactions', models.BigIntegerField(null=True)),
+            ],
+            options={
+                'ordering': ['series', 'date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('market', models.CharField(choices=[('commodity', '原物料'), ('stock', '股票')], max_length=16)),
+                ('symbol', models.CharField(max_length=32)),
+                ('name', models.CharField(blank=True, max_length=64)),
+                ('latest_date', models.DateField(null=True)),
+                ('synced_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='priceseries',
+            constraint=models.UniqueConstraint(fields=('market', 'symbol'), name='unique_price_series'),
+        ),
+        migrations.AddField(
+            model_name='dailybar',
+            name='series',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bars', to='fintechLinebot.priceseries'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailybar',
+            constraint=models.UniqueConstraint(fields=('series', 'date'), name='unique_daily_bar'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.4 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fintechLinebot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(max_length=64)),
+                ('market', models.CharField(choices=[('commodity', '原物料'), ('stock', '股票')], max_length=16)),
+                ('symbol', models.CharField(max_length=32)),
+                ('direction', models.CharField(choices=[('above', '突破'), ('below', '跌破')], max_length=8)),
+                ('threshold', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('triggered_at', models.DateTimeField(null=True)),
+                ('triggered_price', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['market', 'triggered_at', 'symbol', 'direction', 'threshold'], name='price_alert_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['target', 'triggered_at'], name='price_alert_target'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.4 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fintechLinebot', '0002_pricealert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=32)),
+                ('symbol', models.CharField(blank=True, max_length=32)),
+                ('date', models.DateField()),
+                ('synced_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='syncrecord',
+            constraint=models.UniqueConstraint(fields=('feed', 'symbol', 'date'), name='unique_sync_record'),
+        ),
+    ]
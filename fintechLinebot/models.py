@@ -1,3 +1,60 @@
 from django.db import models
 
-# Create your models here.
+# 價格序列，每個原物料或股票一筆，紀錄最新資料日期及最後同步時間，用來判斷是否需要向上游抓取
+class PriceSeries(models.Model):
+    MARKET_CHOICES = [('commodity', '原物料'), ('stock', '股票')]
+    market = models.CharField(max_length=16, choices=MARKET_CHOICES)
+    symbol = models.CharField(max_length=32) # stockq原物料代碼或股票代碼
+    name = models.CharField(max_length=64, blank=True) # 原物料或證券名稱
+    latest_date = models.DateField(null=True) # 已儲存的最新一筆日資料日期
+    synced_at = models.DateTimeField(null=True) # 最後一次向上游同步的時間
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['market', 'symbol'], name='unique_price_series')]
+    def __str__(self):
+        return self.market + ':' + self.symbol
+
+# 日資料，(序列, 日期)唯一，查詢時依此索引取出連續的日期區間
+class DailyBar(models.Model):
+    series = models.ForeignKey(PriceSeries, on_delete=models.CASCADE, related_name='bars')
+    date = models.DateField()
+    open = models.FloatField(null=True) # 開盤價，原物料沒有此欄位
+    high = models.FloatField(null=True) # 最高價
+    low = models.FloatField(null=True) # 最低價
+    close = models.FloatField(null=True) # 收盤價，原物料為stockq的價格，當日無成交時為None
+    change = models.FloatField(null=True) # 漲跌價差
+    volume = models.BigIntegerField(null=True) # 成交股數
+    turnover = models.BigIntegerField(null=True) # 成交金額
+    transactions = models.BigIntegerField(null=True) # 成交筆數
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['series', 'date'], name='unique_daily_bar')]
+        ordering = ['series', 'date']
+
+# 上游資料的同步紀錄，證交所當日全部行情每個資料日期一筆，個股月成交資訊每個(股票代碼, 月份)一筆
+# 日資料表同時存放兩種來源，需由此判斷哪一天是當日行情的日期、哪些月份已完整抓取過
+class SyncRecord(models.Model):
+    feed = models.CharField(max_length=32) # 'stock_day_all'或'stock_day'
+    symbol = models.CharField(max_length=32, blank=True) # 股票代碼，當日全部行情為空字串
+    date = models.DateField() # 資料日期，個股月成交資訊為該月1日
+    synced_at = models.DateTimeField() # 最後一次同步的時間
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['feed', 'symbol', 'date'], name='unique_sync_record')]
+
+# 價格提醒，價格突破或跌破門檻時推播一次，之後紀錄觸發時間不再檢查
+class PriceAlert(models.Model):
+    MARKET_CHOICES = PriceSeries.MARKET_CHOICES
+    DIRECTION_CHOICES = [('above', '突破'), ('below', '跌破')]
+    target = models.CharField(max_length=64) # 推播對象，LINE的user、group或room ID
+    market = models.CharField(max_length=16, choices=MARKET_CHOICES)
+    symbol = models.CharField(max_length=32) # 股票代碼或原物料名稱，與報價快照的鍵值相同
+    direction = models.CharField(max_length=8, choices=DIRECTION_CHOICES)
+    threshold = models.FloatField() # 價格門檻
+    created_at = models.DateTimeField(auto_now_add=True)
+    triggered_at = models.DateTimeField(null=True) # 觸發時間，None表示尚未觸發
+    triggered_price = models.FloatField(null=True) # 觸發時的價格
+    class Meta:
+        indexes = [
+            models.Index(fields=['market', 'triggered_at', 'symbol', 'direction', 'threshold'], name='price_alert_pending'), # 每次快照更新時依序取出尚未觸發的提醒
+            models.Index(fields=['target', 'triggered_at'], name='price_alert_target') # 查詢使用者的提醒
+        ]
+    def __str__(self):
+        return self.target + ':' + self.symbol + ' ' + self.direction + ' ' + str(self.threshold)
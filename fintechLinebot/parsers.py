@@ -0,0 +1,56 @@
+# json          Python標準套件，用來解析stockq歷史價格中的陣列
+import json
+# lxml          用來快速解析HTML，僅取出需要的表格
+from lxml import html as lxml_html
+
+# 定義commodity_layout_error例外，stockq網頁格式改變、找不到或無法解析原物料報價表格時拋出
+class commodity_layout_error(ValueError):
+    pass
+
+def cell_texts(row): # 取出表格列中每個儲存格的文字
+    return [cell.text_content().strip() for cell in row if cell.tag in ('td', 'th')]
+
+def is_commodity_header(texts): # 判斷是否為原物料報價表格的標題列：原物料、買價、漲跌、比例、時間
+    return len(texts) == 5 and '價' in texts[1] and '漲跌' in texts[2]
+
+def parse_commodity_table(content): # 解析stockq原物料價格網頁，回傳[(原物料, 買價, 漲跌, 比例, 時間), ...]
+    doc = lxml_html.fromstring(content)
+    for table in doc.iter('table'):
+        rows = table.xpath('./tr | ./thead/tr | ./tbody/tr') # 僅取該表格本身的列，不含巢狀表格
+        for index, row in enumerate(rows):
+            if is_commodity_header(cell_texts(row)):
+                return parse_commodity_rows(rows[index+1:])
+    raise commodity_layout_error('找不到原物料報價表格，stockq網頁格式可能已變更')
+
+def parse_commodity_rows(rows): # 將標題列之後的每一列轉成tuple並檢查格式
+    quotes = []
+    for row in rows:
+        texts = cell_texts(row)
+        if not any(texts): # 空白列
+            continue
+        if len(texts) != 5:
+            raise commodity_layout_error('原物料報價表格欄位數應為5，實際為' + str(len(texts)) + '：' + repr(texts))
+        try:
+            float(texts[1].replace(',', '')) # 買價需為數字
+        except ValueError:
+            raise commodity_layout_error('原物料報價表格買價欄位不是數字：' + repr(texts))
+        quotes.append(tuple(texts))
+    if not quotes:
+        raise commodity_layout_error('原物料報價表格沒有任何資料')
+    return quotes
+
+def parse_commodity_js(content): # 解析stockq原物料歷史價格(<原物料代碼>_sma.js)，回傳[['Date', 'Price', 'MA20', 'MA60'], [日期, 價格, MA20, MA60], ...]
+    lines = content.split('\n') # 將每一行內容切分成list
+    # 將想要的內容寫成JSON字串
+    data_str = '['
+    for line in lines:
+        if line and line[0] == '[' and line[2] != '\'':
+            data_str += line.replace('\'', '"')
+    data_str += ']'
+    return json.loads(data_str) # 將JSON字串轉換成python物件
+
+def parse_stock_news(content, limit=5): # 以XPath只取出pchome股票頁面#stock_info_news區塊中的新聞，回傳[(標題, 連結), ...]，沒有此區塊時回傳None
+    blocks = lxml_html.fromstring(content).xpath('//div[@id="stock_info_news"]')
+    if not blocks: # 沒有此公司新聞
+        return None
+    return [(a.text_content(), a.get('href')) for a in blocks[0].iter('a') if a.get('href')][:limit]
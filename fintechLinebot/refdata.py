@@ -0,0 +1,99 @@
+# sqlite3       Python標準套件，參考資料索引的儲存格式，唯讀開啟並使用mmap讓多個worker共用作業系統的快取
+# json          Python標準套件，用來讀取產業分析及產業新聞
+# os            Python標準套件，用來取得來源檔案狀態及更名
+# threading     Python標準套件，每個執行緒使用各自的資料庫連線，並保護建立索引的過程
+import sqlite3, json, os, threading
+
+schema_version = 1 # 索引格式版本，修改資料表時需加1，舊版索引會自動重建
+
+# 建立索引用的資料表
+schema = '''
+CREATE TABLE company (code TEXT PRIMARY KEY, name TEXT NOT NULL, industry_id TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE industry_text (kind TEXT NOT NULL, industry TEXT NOT NULL, text TEXT NOT NULL, PRIMARY KEY (kind, industry)) WITHOUT ROWID;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+'''
+
+def source_paths(base_dir): # 來源檔案路徑
+    return {
+        'company': os.path.join(base_dir, 'company.txt'),
+        'analysis': os.path.join(base_dir, 'industry_analysis.json'),
+        'news': os.path.join(base_dir, 'industry_news.json')
+    }
+
+def source_signature(base_dir): # 以來源檔案的大小及修改時間判斷索引是否需要重建，不需讀取檔案內容
+    parts = []
+    for kind, path in sorted(source_paths(base_dir).items()):
+        stat = os.stat(path)
+        parts.append(kind + ':' + str(stat.st_size) + ':' + str(int(stat.st_mtime)))
+    return str(schema_version) + '|' + ','.join(parts)
+
+def build_index(base_dir, path): # 將company.txt及產業JSON編譯成SQLite索引，寫入暫存檔後再更名，避免其他worker讀到一半的檔案
+    paths = source_paths(base_dir)
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(schema)
+        with open(paths['company'], 'r', encoding='UTF-8') as f:
+            rows = [line.strip().split(',') for line in f if line.strip()]
+        conn.executemany('INSERT OR REPLACE INTO company VALUES (?, ?, ?)', [row[:3] for row in rows])
+        for kind in ('analysis', 'news'):
+            with open(paths[kind], encoding='UTF-8') as json_file:
+                texts = json.load(json_file)
+            conn.executemany('INSERT INTO industry_text VALUES (?, ?, ?)', [(kind, name, text) for name, text in texts.items()])
+        conn.execute('INSERT INTO meta VALUES (?, ?)', ('signature', source_signature(base_dir)))
+        conn.execute('PRAGMA user_version = ' + str(schema_version))
+        conn.commit()
+        conn.execute('VACUUM') # 壓縮檔案
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return len(rows)
+
+def index_is_current(base_dir, path): # 索引是否存在且與來源檔案一致
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect('file:' + path + '?mode=ro', uri=True)
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] != schema_version:
+            return False
+        row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        return row is not None and row[0] == source_signature(base_dir)
+    except sqlite3.DatabaseError: # 檔案損毀或格式不符
+        return False
+    finally:
+        conn.close()
+
+# 定義reference_index物件，第一次查詢時才開啟索引，索引不存在或過期時自動重建
+class reference_index:
+    def __init__(self, base_dir, path, mmap_size=16 * 1024 * 1024): # 初始化
+        self.base_dir = base_dir # 來源檔案所在的資料夾
+        self.path = path # 索引檔路徑
+        self.mmap_size = mmap_size # 以mmap讀取的大小上限，多個worker共用作業系統的頁面快取
+        self.lock = threading.Lock() # 保護索引只檢查及建立一次
+        self.ready = False # 索引是否已確認為最新
+        self.local = threading.local() # 每個執行緒各自的資料庫連線
+        return
+    def connection(self): # 取得目前執行緒的唯讀資料庫連線
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if not self.ready:
+                with self.lock:
+                    if not self.ready:
+                        if not index_is_current(self.base_dir, self.path):
+                            build_index(self.base_dir, self.path)
+                        self.ready = True
+            conn = sqlite3.connect('file:' + self.path + '?mode=ro', uri=True)
+            conn.execute('PRAGMA mmap_size = ' + str(int(self.mmap_size)))
+            self.local.conn = conn
+        return conn
+    def company(self, code): # 回傳(公司名稱, 產業代碼)，找不到時回傳None
+        return self.connection().execute('SELECT name, industry_id FROM company WHERE code = ?', (code,)).fetchone()
+    def companies(self): # 依股票代碼順序回傳全部(股票代碼, 公司名稱, 產業代碼)
+        return self.connection().execute('SELECT code, name, industry_id FROM company ORDER BY code').fetchall()
+    def industry_text(self, kind, industry): # 回傳產業分析(kind='analysis')或產業新聞(kind='news')，找不到時拋出KeyError
+        row = self.connection().execute('SELECT text FROM industry_text WHERE kind = ? AND industry = ?', (kind, industry)).fetchone()
+        if row is None:
+            raise KeyError(industry)
+        return row[0]
@@ -0,0 +1,46 @@
+# threading     Python標準套件，用來在背景定期執行工作
+# time          Python標準套件，用來計算下一次執行時間
+# logging       Python標準套件，用來紀錄背景工作的錯誤
+import threading, time, logging
+
+logger = logging.getLogger(__name__)
+
+# 定義background_refresher物件，在背景執行緒中依各自的間隔或排程定期執行工作，例如預先抓取上游資料
+class background_refresher:
+    def __init__(self): # 初始化
+        self.tasks = [] # [間隔秒數或排程函式, 工作函式, 下一次執行時間]
+        self.lock = threading.Lock() # 保護工作清單及執行緒啟動
+        self.thread = None # 背景執行緒
+        self.wakeup = threading.Event() # 新增工作時喚醒背景執行緒
+        return
+    def add(self, interval, task): # 新增定期工作，啟動後立即執行第一次
+        with self.lock:
+            self.tasks.append([interval, task, 0])
+        self.wakeup.set()
+        return
+    def add_schedule(self, schedule, task): # 新增依排程執行的工作，schedule(now)回傳now之後的下一次執行時間
+        with self.lock:
+            self.tasks.append([schedule, task, schedule(time.time())])
+        self.wakeup.set()
+        return
+    def start(self): # 啟動背景執行緒，重複呼叫不會啟動第二個
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='background-refresher', daemon=True)
+                self.thread.start()
+        return
+    def run(self): # 背景執行緒主迴圈
+        while True:
+            now = time.time()
+            with self.lock:
+                due = [entry for entry in self.tasks if entry[2] <= now] # 到期的工作
+                for entry in due:
+                    entry[2] = entry[0](now) if callable(entry[0]) else now + entry[0]
+                next_run = min([entry[2] for entry in self.tasks] or [now + 60])
+            for interval, task, _ in due:
+                try:
+                    task()
+                except Exception: # 工作失敗不可讓背景執行緒結束
+                    logger.exception('background task failed')
+            self.wakeup.wait(max(0, next_run - time.time())) # 等到下一個工作到期或有新工作加入
+            self.wakeup.clear()
@@ -0,0 +1,130 @@
+# os            Python標準套件，用來管理快取檔案
+# hashlib       Python標準套件，用來計算快取鍵值及圖片內容雜湊
+# json          Python標準套件，用來將繪圖參數轉成固定格式的字串及儲存圖片清單
+# threading     Python標準套件，保護記憶體快取並產生不重複的暫存檔名稱
+# collections   Python標準套件，OrderedDict用來做LRU淘汰
+import os, hashlib, json, threading, collections
+
+# 定義render_cache物件，依(原料代碼, 資料雜湊, 繪圖參數)快取已繪製好的圖片
+# 圖片以內容雜湊命名，同一個worker的圖片放在有大小上限的記憶體中，同一台主機的worker共用磁碟上的檔案
+# 鍵值→圖片清單(輸出名稱→圖片檔名)另外存成<鍵值>.json，任何worker都能由鍵值找到已繪製好的圖片
+class render_cache:
+    def __init__(self, root, url_prefix, max_bytes=200 * 1024 * 1024, max_files=500, memory_bytes=32 * 1024 * 1024): # 初始化
+        self.root = root # 快取檔案存放的資料夾
+        self.url_prefix = url_prefix # 圖片對外的網址前綴，後接圖片檔名
+        self.max_bytes = max_bytes # 磁碟快取總大小上限
+        self.max_files = max_files # 磁碟快取檔案數量上限
+        self.memory_bytes = memory_bytes # 記憶體快取總大小上限
+        self.lock = threading.Lock() # 保護記憶體快取
+        self.memory = collections.OrderedDict() # 圖片檔名→圖片bytes，最久未使用的在前
+        self.memory_used = 0 # 記憶體快取目前的總大小
+        self.hits = 0 # 命中次數
+        self.misses = 0 # 未命中次數
+        self.files = 0 # 最後一次淘汰後仍存在的檔案數量
+        os.makedirs(self.root, exist_ok=True) # 建立快取資料夾
+        return
+    def key(self, name, kind, digest, params): # 產生快取鍵值，相同資料及參數會得到相同鍵值
+        params_str = json.dumps(params, sort_keys=True) # 固定參數字串順序
+        params_hash = hashlib.sha1((digest + params_str).encode('utf-8')).hexdigest()[:20]
+        return name + '-' + kind + '-' + params_hash
+    def path(self, filename): # 快取檔案的完整路徑
+        return os.path.join(self.root, filename)
+    def write(self, filename, data): # 先寫入暫存檔再更名，避免其他worker讀到未完成的檔案
+        tmp_path = self.path(filename) + '.' + str(os.getpid()) + '-' + str(threading.get_ident()) + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(filename))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return
+    def remember(self, filename, data): # 放入記憶體快取，超過上限時淘汰最久未使用的圖片
+        with self.lock:
+            if filename in self.memory:
+                self.memory.move_to_end(filename)
+                return
+            self.memory[filename] = data
+            self.memory_used += len(data)
+            while self.memory_used > self.memory_bytes and len(self.memory) > 1:
+                evicted_name, evicted = self.memory.popitem(last=False)
+                self.memory_used -= len(evicted)
+        return
+    def put(self, data, ext): # 儲存圖片並回傳以內容雜湊命名的檔名，相同內容只會存一份
+        filename = hashlib.sha1(data).hexdigest() + '.' + ext
+        if not os.path.exists(self.path(filename)):
+            self.write(filename, data)
+        self.remember(filename, data)
+        return filename
+    def get(self, filename): # 依檔名取得圖片bytes，記憶體中沒有時讀取磁碟，找不到時回傳None
+        with self.lock:
+            data = self.memory.get(filename)
+            if data is not None:
+                self.memory.move_to_end(filename)
+                return data
+        try:
+            with open(self.path(filename), 'rb') as f:
+                data = f.read()
+        except OSError: # 已被淘汰或在其他主機上
+            return None
+        self.remember(filename, data)
+        return data
+    def exists(self, filename): # 圖片是否仍在快取中
+        with self.lock:
+            if filename in self.memory:
+                return True
+        return os.path.exists(self.path(filename))
+    def lookup(self, key): # 讀取鍵值對應的圖片清單，圖片都還在時回傳 輸出名稱→圖片檔名，否則回傳None
+        manifest = key + '.json'
+        try:
+            with open(self.path(manifest), 'r') as f:
+                filenames = json.load(f)
+        except (OSError, ValueError): # 尚未繪製、已被淘汰或正在寫入
+            return None
+        if not all(self.exists(filename) for filename in filenames.values()):
+            return None
+        try:
+            for filename in [manifest] + list(filenames.values()):
+                os.utime(self.path(filename)) # 更新修改時間，作為LRU淘汰依據
+        except OSError: # 剛好被淘汰
+            return None
+        return filenames
+    def fetch(self, key, render, files): # 取得一組圖片網址，files為 輸出名稱→副檔名，未命中時呼叫render()繪製，render回傳 輸出名稱→圖片bytes
+        filenames = self.lookup(key)
+        if filenames is not None: # 命中快取
+            self.hits += 1
+        else:
+            self.misses += 1
+            images = render()
+            filenames = {name: self.put(images[name], ext) for name, ext in files.items()}
+            self.write(key + '.json', json.dumps(filenames).encode('utf-8'))
+        return {name: self.url_prefix + filename for name, filename in filenames.items()}
+    def evict(self): # 依最後使用時間淘汰磁碟上的檔案，直到總大小及數量都在上限內，記憶體快取不受影響
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.tmp'): # 寫入中的暫存檔
+                continue
+            try:
+                stat = os.stat(self.path(name))
+            except OSError: # 已被其他worker刪除
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort() # 最久未使用的在前
+        total = sum(size for mtime, size, name in entries)
+        count = len(entries)
+        for mtime, size, name in entries:
+            if total <= self.max_bytes and count <= self.max_files:
+                break
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+            total -= size
+            count -= 1
+        self.files = count
+        return count
+    def stats(self): # 回傳目前統計數據
+        with self.lock:
+            memory_files = len(self.memory)
+            memory_used = self.memory_used
+        return {'hits': self.hits, 'misses': self.misses, 'files': self.files, 'memory_files': memory_files, 'memory_bytes': memory_used}
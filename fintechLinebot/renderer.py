@@ -0,0 +1,222 @@
+# io            Python標準套件，用來將圖片存在記憶體中
+# time          Python標準套件，用來測量繪圖及編碼時間
+# threading     Python標準套件，保護行程池的建立及替換
+# multiprocessing、concurrent.futures  Python標準套件，用來建立繪圖專用的行程池
+# os、signal    Python標準套件，用來結束卡住的繪圖行程
+import io, time, threading, multiprocessing, concurrent.futures, os, signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 此模組會在繪圖行程中被載入，不可依賴Django
+
+def load_pyplot(): # 第一次繪圖時才載入matplotlib，並強制使用不需要視窗的Agg後端
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+# 輸出設定，每張圖表繪製一次後依各設定縮放及編碼
+# original  使用者點開時的原圖：折線圖及表格都是線條及色塊，使用減色PNG，長邊不超過2048像素(LINE原圖上限10MB)
+# preview   聊天室中顯示的預覽圖：長邊240像素的JPEG(LINE預覽圖上限1MB)
+render_profiles = {
+    'original': {'format': 'png', 'max_size': 2048, 'colors': 256},
+    'preview': {'format': 'jpeg', 'max_size': 240, 'quality': 75}
+}
+image_extensions = {'png': 'png', 'jpeg': 'jpg'} # 編碼格式→副檔名
+
+def encode_image(image, profile): # 依輸出設定縮小並編碼圖片，回傳bytes
+    from PIL import Image
+    if max(image.size) > profile['max_size']:
+        image = image.copy()
+        image.thumbnail((profile['max_size'], profile['max_size']), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if profile['format'] == 'png':
+        if profile.get('colors'): # 以八元樹減色成調色盤PNG，線條圖幾乎沒有差異，編碼比全彩PNG快且檔案小很多
+            image = image.quantize(colors=profile['colors'], method=Image.FASTOCTREE)
+        image.save(buffer, format='PNG')
+    else:
+        image.save(buffer, format='JPEG', quality=profile['quality'], optimize=True)
+    return buffer.getvalue()
+
+def save_figure(plt, fig, params, started, **kwargs): # 將圖表依params['profiles']輸出並關閉圖表，避免pyplot持續持有圖表
+    # 回傳{'images': 輸出設定→圖片bytes, 'metrics': 繪圖毫秒數及各輸出設定的編碼毫秒數、檔案大小}，started為開始繪圖的時間
+    from PIL import Image
+    try:
+        buffer = io.BytesIO()
+        # 先以最快的壓縮等級輸出無損的點陣圖，再由各輸出設定縮放及編碼
+        fig.savefig(buffer, format='png', bbox_inches="tight", pad_inches=0.1, pil_kwargs={'compress_level': 1}, **kwargs)
+    finally:
+        plt.close(fig)
+    image = Image.open(buffer).convert('RGB')
+    metrics = {'draw_ms': (time.perf_counter() - started) * 1000, 'width': image.size[0], 'height': image.size[1]}
+    images = {}
+    for name, profile in params['profiles'].items():
+        start = time.perf_counter()
+        images[name] = encode_image(image, profile)
+        metrics[name] = {'encode_ms': (time.perf_counter() - start) * 1000, 'bytes': len(images[name])}
+    return {'images': images, 'metrics': metrics}
+
+line_colors = ['r', '#0000E3', '#D26900', '#2E8B57', '#8B008B', '#696969'] # 依序為價格及各移動平均線的顏色
+
+def draw_line_chart(title, x, series, params, labels=('Price', 'MA20', 'MA60')): # 將資料畫成折線圖，series依序為價格及各移動平均，回傳值同save_figure
+    started = time.perf_counter()
+    # matplotlib  用來繪製圖表
+    plt = load_pyplot()
+    import matplotlib.ticker as ticker
+    fig = plt.figure(figsize=params['figsize'],dpi=params['dpi']) # 設定圖片大小
+    ax = fig.add_subplot(1, 1, 1) # 建立圖表
+    ax.set_title(title, fontsize=28, fontweight='bold') # 設置標題
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(10)) # 設置x軸顯示名稱區間
+    ax.yaxis.set_major_locator(ticker.MultipleLocator(50)) # 設置y軸顯示名稱區間
+    ax.grid(True) # 畫出網格
+    ax.plot(x, series[0], color=line_colors[0], linewidth=3) # 畫出價格線
+    for index, values in enumerate(series[1:], 1): # 畫出各移動平均線
+        ax.plot(x, values, color=line_colors[index % len(line_colors)], ls='-', markeredgecolor='#343deb', linewidth=3)
+    ax.legend(labels, shadow=True, loc='best', handlelength=1.5, fontsize=20) # 畫出圖例
+    ax.set_xlabel('Date ', fontsize=25, fontweight='bold', loc='right') # 設置x軸標題
+    ax.set_ylabel('Price ', fontsize=25, fontweight='bold', loc='top') # 設置y軸標題
+    ax.tick_params(axis='x', labelsize=15) # 設置x軸刻度標籤字體大小
+    ax.tick_params(axis='y', labelsize=18) # 設置y軸刻度標籤字體大小
+    return save_figure(plt, fig, params, started)
+
+def draw_table(title, collabel, rowlabel, cells, params): # 將資料畫成表格，回傳值同save_figure
+    started = time.perf_counter()
+    # matplotlib  用來繪製表格
+    plt = load_pyplot()
+    from matplotlib.font_manager import FontProperties
+    # numpy       支援高階大量的維度陣列與矩陣運算，僅用來產生表格漸層顏色
+    import numpy as np
+    colcolours = [['#ff6666', '#788cff', '#ffa882'][i % 3] for i in range(len(collabel))] # 設置行標籤顏色
+    rowcolours = plt.get_cmap('YlOrRd')(np.linspace(0.4, 0, len(rowlabel))) # 設置行標籤顏色為漸層顏色
+    fig, ax = plt.subplots() # 建立圖表
+    ax.axis('tight') # 設置圖表布局
+    ax.axis('off') # 隱藏x，y軸
+    ax.set_title(title, fontsize=15, fontweight='bold', verticalalignment='top', pad=80.0) # 設置標題
+    # 畫表格
+    the_table = ax.table(cellText=cells , colLabels=collabel, colColours=colcolours, loc='center', rowLabels=rowlabel, rowColours=rowcolours, cellLoc='center', fontsize=1000)
+    the_table.auto_set_font_size(False)
+    the_table.set_fontsize(14)
+    the_table.scale(1, 3)
+    # 設置行標籤(第0列)及列標籤(第-1行)的字體參數，不論資料有幾列幾行
+    for (row, col), cell in the_table.get_celld().items():
+        if row == 0 or col == -1:
+            cell.set_text_props(fontproperties=FontProperties(weight='bold', size='large'))
+    return save_figure(plt, fig, params, started, dpi=params['dpi'])
+
+def price_series(prices, windows, count): # 在繪圖行程中以indicators計算各移動平均，回傳最後count筆的[價格, MA..., ...]
+    # indicators(numpy)只在繪圖行程中載入，prices需包含計算移動平均所需的前置資料，資料不足window筆時以現有資料平均
+    from . import indicators
+    columns = indicators.compute(prices, sma_windows=windows, min_periods=1)
+    return [list(prices[-count:])] + [columns['MA' + str(window)][-count:].tolist() for window in windows]
+
+def price_labels(windows): # 價格及各移動平均的名稱
+    return ['Price'] + ['MA' + str(window) for window in windows]
+
+def draw_price_chart(title, dates, prices, windows, days, params): # 計算移動平均後畫出最後days筆的折線圖，回傳值同save_figure
+    return draw_line_chart(title, dates[-days:], price_series(prices, windows, days), params, price_labels(windows))
+
+def draw_price_table(title, dates, prices, windows, params): # 計算移動平均後將最新params['rows']筆畫成表格，最新的在前，回傳值同save_figure
+    rows = min(params['rows'], len(dates))
+    series = price_series(prices, windows, rows)
+    cells = [["{:.1f}".format(column[i]) for column in series] for i in reversed(range(rows))]
+    return draw_table(title, price_labels(windows), list(reversed(dates[-rows:])), cells, params)
+
+def register_process(pids): # 繪圖行程啟動時回報自己的pid，行程池卡住時才能結束繪圖行程
+    pids.put(os.getpid())
+
+# 定義render_pool物件，將繪圖工作交給長駐的繪圖行程，web worker不需載入matplotlib也不會累積圖表
+class render_pool:
+    def __init__(self, processes=2, max_renders=50, metrics=None, timeout=60): # 初始化，processes為0時在目前的行程中直接繪圖，metrics為metrics_registry
+        self.processes = processes # 繪圖行程數量
+        self.timeout = timeout # 等待單一繪圖工作的秒數上限
+        self.max_renders = max_renders # 每個繪圖行程平均繪製幾張圖後就更換新的行程池，釋放累積的記憶體
+        self.lock = threading.Lock() # 保護行程池的建立及替換
+        self.executor = None # 目前使用中的行程池
+        self.pids = {} # 行程池→繪圖行程回報pid的佇列，ProcessPoolExecutor沒有公開的方式取得或結束其行程
+        self.submitted = 0 # 目前行程池已接收的繪圖工作數量
+        self.recycled = 0 # 已更換行程池的次數
+        self.totals = {} # 繪圖函式名稱→累計的次數、繪圖毫秒數及各輸出設定的編碼毫秒數、檔案大小
+        self.metrics = metrics # 紀錄繪圖及編碼時間的直方圖
+        return
+    def get_executor(self): # 取得行程池，繪圖數量達上限時更換新的行程池
+        with self.lock:
+            if self.executor is not None and self.submitted >= self.max_renders * self.processes:
+                self.executor.shutdown(wait=False) # 已送出的工作會繼續完成，之後舊行程結束
+                self.pids.pop(self.executor, None)
+                self.executor = None
+                self.recycled += 1
+            if self.executor is None:
+                # 使用forkserver建立行程，避免從多執行緒的web worker直接fork
+                context = multiprocessing.get_context('forkserver')
+                pids = context.SimpleQueue()
+                self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context, initializer=register_process, initargs=(pids,))
+                self.pids[self.executor] = pids
+                self.submitted = 0
+            self.submitted += 1
+            return self.executor
+    def replace(self, executor, terminate=False): # 行程池故障時換掉，其他執行緒已換過時不重複，terminate為True時結束卡住的繪圖行程
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+                self.recycled += 1
+            pids = self.pids.pop(executor, None)
+        if terminate and pids is not None: # 以繪圖行程回報的pid結束行程，其餘工作會收到BrokenProcessPool並重試
+            while not pids.empty():
+                try:
+                    os.kill(pids.get(), signal.SIGTERM)
+                except ProcessLookupError: # 行程已結束
+                    pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        return
+    def failed(self, reason): # 紀錄繪圖失敗
+        if self.metrics is not None:
+            self.metrics.inc('render_failures_total', reason=reason)
+        return
+    def render(self, func, *args): # 執行繪圖函式，回傳 輸出設定→圖片bytes
+        if self.processes <= 0:
+            result = func(*args)
+        else:
+            result = self.submit(func, *args)
+        self.record(func.__name__, result['metrics'])
+        return result['images']
+    def submit(self, func, *args): # 交給繪圖行程執行，行程異常結束(例如被OOM killer結束)時換新的行程池重試一次，超過timeout秒時結束該行程池並拋出例外
+        for attempt in range(2):
+            executor = self.get_executor()
+            try:
+                return executor.submit(func, *args).result(timeout=self.timeout)
+            except BrokenProcessPool:
+                self.failed('broken')
+                self.replace(executor)
+                if attempt > 0:
+                    raise
+            except concurrent.futures.TimeoutError:
+                self.failed('timeout')
+                self.replace(executor, terminate=True)
+                raise
+    def record(self, name, metrics): # 累計繪圖及編碼的時間與檔案大小
+        if self.metrics is not None:
+            self.metrics.observe('render_seconds', metrics['draw_ms'] / 1000, function=name)
+            for profile, values in metrics.items():
+                if isinstance(values, dict):
+                    self.metrics.observe('encode_seconds', values['encode_ms'] / 1000, profile=profile)
+                    self.metrics.inc('encoded_bytes_total', values['bytes'], profile=profile)
+        with self.lock:
+            total = self.totals.setdefault(name, {'count': 0, 'draw_ms': 0.0})
+            total['count'] += 1
+            total['draw_ms'] += metrics['draw_ms']
+            for profile, values in metrics.items():
+                if isinstance(values, dict):
+                    profile_total = total.setdefault(profile, {'encode_ms': 0.0, 'bytes': 0})
+                    profile_total['encode_ms'] += values['encode_ms']
+                    profile_total['bytes'] += values['bytes']
+        return
+    def stats(self): # 回傳各繪圖函式的平均繪圖毫秒數及各輸出設定的平均編碼毫秒數、平均檔案大小
+        with self.lock:
+            result = {'recycled': self.recycled}
+            for name, total in self.totals.items():
+                count = total['count']
+                result[name] = {'count': count, 'draw_ms': total['draw_ms'] / count}
+                for profile, values in total.items():
+                    if isinstance(values, dict):
+                        result[name][profile] = {'encode_ms': values['encode_ms'] / count, 'bytes': values['bytes'] // count}
+            return result
@@ -0,0 +1,32 @@
+# 定義command_router物件，將文字訊息以一次dict查詢對應到處理函式
+class command_router:
+    def __init__(self, fallback, *fallback_args): # 初始化，fallback為找不到指令時的處理函式
+        self.routes = {} # 正規化後的文字→(處理函式, 參數)
+        self.resolvers = [] # 查不到固定指令時依序呼叫的查詢函式，用於數量龐大、不適合全部放入dict的指令
+        self.fallback = (fallback, fallback_args)
+        return
+    def normalize(self, text): # 正規化文字訊息，去除前後空白
+        return text.strip()
+    def add(self, text, handler, *args): # 新增指令，收到text時呼叫handler(event, *args)
+        self.routes[self.normalize(text)] = (handler, args)
+        return
+    def add_subcommands(self, names, subcommands): # 新增「名稱—子指令」形式的指令，subcommands為 子指令→處理函式
+        for name in names:
+            for subcommand, handler in subcommands.items():
+                self.add(name + '—' + subcommand, handler, name)
+        return
+    def add_resolver(self, resolver): # 新增查詢函式，resolver(正規化後的文字)回傳(處理函式, 參數)或None
+        self.resolvers.append(resolver)
+        return
+    def resolve(self, text): # 回傳(處理函式, 參數)，找不到時回傳fallback
+        text = self.normalize(text)
+        route = self.routes.get(text)
+        if route is not None:
+            return route
+        for resolver in self.resolvers:
+            route = resolver(text)
+            if route is not None:
+                return route
+        return self.fallback
+    def __len__(self): # 已登錄的指令數量
+        return len(self.routes)
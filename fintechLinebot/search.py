@@ -0,0 +1,101 @@
+# bisect        Python標準套件，用來在排序好的清單中做前綴查詢
+# unicodedata   Python標準套件，用來將全形文字轉成半形
+# threading     Python標準套件，保護索引只建立一次
+import bisect, unicodedata, threading
+
+variants = str.maketrans({'臺': '台', '－': '-', '　': ' '}) # 常見的異體字及全形符號
+
+def normalize(text): # 正規化搜尋文字：全形轉半形、統一異體字、轉小寫並去除空白
+    return unicodedata.normalize('NFKC', text).translate(variants).lower().replace(' ', '')
+
+def grams(text, n): # 取出文字中所有長度為n的片段，不重複
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+def edit_distance(a, b, limit): # 計算兩字串的編輯距離，超過limit時提早結束並回傳limit+1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (char_a != char_b)))
+        if min(current) > limit: # 此列的最小值已超過上限，之後只會更大
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+# 定義company_search物件，以預先建立的前綴清單及n-gram倒排索引搜尋公司名稱及股票代碼
+class company_search:
+    def __init__(self, load, limit=10, min_length=2): # 初始化，load為回傳[(股票代碼, 公司名稱, 產業代碼), ...]的函式，第一次搜尋時才建立索引
+        self.load = load # 載入公司清單的函式
+        self.limit = limit # 最多回傳幾筆結果，LINE輪播訊息最多10個欄位
+        self.min_length = min_length # 搜尋文字的最短長度，避免單一字元的閒聊被當成搜尋
+        self.lock = threading.Lock() # 保護索引只建立一次
+        self.companies = None # [(股票代碼, 公司名稱, 產業代碼), ...]
+        return
+    def build(self): # 建立索引
+        companies = list(self.load())
+        keys = [normalize(name) for code, name, industry_id in companies] # 正規化後的公司名稱
+        unigrams = {} # 單一字元→包含該字元的公司編號
+        bigrams = {} # 兩個字元→包含該片段的公司編號
+        for index, key in enumerate(keys):
+            for gram in grams(key, 1):
+                unigrams.setdefault(gram, []).append(index)
+            for gram in grams(key, 2):
+                bigrams.setdefault(gram, []).append(index)
+        self.keys = keys
+        self.unigrams = unigrams
+        self.bigrams = {gram: frozenset(indexes) for gram, indexes in bigrams.items()}
+        self.codes = sorted((code, index) for index, (code, name, industry_id) in enumerate(companies)) # 依股票代碼排序，用來做前綴查詢
+        self.names = sorted((key, index) for index, key in enumerate(keys)) # 依公司名稱排序，用來做前綴查詢
+        self.companies = companies
+        return
+    def ready(self): # 確認索引已建立
+        if self.companies is None:
+            with self.lock:
+                if self.companies is None:
+                    self.build()
+        return
+    def prefixed(self, entries, prefix): # 在排序好的(文字, 公司編號)清單中取出以prefix開頭的公司編號
+        position = bisect.bisect_left(entries, (prefix,))
+        while position < len(entries) and entries[position][0].startswith(prefix):
+            yield entries[position][1]
+            position += 1
+    def search(self, text): # 回傳依相關程度排序的[(股票代碼, 公司名稱, 產業代碼), ...]
+        query = normalize(text)
+        if len(query) < self.min_length:
+            return []
+        self.ready()
+        ranks = {} # 公司編號→(排序分數, 名稱長度, 股票代碼)
+        def rank(index, score): # 分數相同時，股票代碼查詢依代碼排序，公司名稱查詢優先顯示名稱較短者
+            key = (score, 0 if score <= 1 else len(self.keys[index]), self.companies[index][0])
+            if index not in ranks or key < ranks[index]:
+                ranks[index] = key
+        for index in self.prefixed(self.codes, query): # 股票代碼完全相同或前綴相同
+            rank(index, 0 if self.companies[index][0] == query else 1)
+        for index in self.prefixed(self.names, query): # 公司名稱完全相同或前綴相同
+            rank(index, 0 if self.keys[index] == query else 2)
+        # 公司名稱包含搜尋文字：取所有片段的倒排索引交集後再確認
+        postings = [self.bigrams.get(gram, frozenset()) for gram in grams(query, 2)]
+        if postings and all(postings):
+            for index in frozenset.intersection(*postings):
+                if query in self.keys[index]:
+                    rank(index, 3)
+        if len(ranks) < self.limit: # 結果不足時以編輯距離找出打錯字的公司名稱
+            self.fuzzy(query, rank)
+        return [self.companies[index] for index, key in sorted(ranks.items(), key=lambda item: item[1])[:self.limit]]
+    def fuzzy(self, query, rank): # 只對共用足夠多字元的公司計算編輯距離，不需掃描全部公司
+        if len(query) <= 2: # 搜尋文字太短，任何錯字都會找到大量不相關的公司
+            return
+        limit = 1 if len(query) < 6 else 2 # 可容許的錯字數量
+        shared = {} # 公司編號→與搜尋文字共用的字元數
+        for gram in grams(query, 1):
+            for index in self.unigrams.get(gram, ()):
+                shared[index] = shared.get(index, 0) + 1
+        needed = len(grams(query, 1)) - limit # 每個錯字最多減少一個共用字元
+        for index, count in shared.items():
+            if count >= needed:
+                distance = edit_distance(query, self.keys[index], limit)
+                if distance <= limit:
+                    rank(index, 3 + distance)
+        return
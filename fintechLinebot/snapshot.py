@@ -0,0 +1,207 @@
+# threading     Python標準套件，用來確保同一時間只有一個執行緒去抓取資料(single-flight)
+# time          Python標準套件，用來紀錄快照時間及計算到期時間
+# datetime      Python標準套件，用來將到期時間對齊資料發布時間
+# collections   Python標準套件，OrderedDict用來做LRU淘汰，Counter用來統計熱門鍵值
+# functools     Python標準套件，用來將鍵值綁定到抓取函式
+# logging       Python標準套件，用來紀錄背景更新失敗的鍵值
+# concurrent    Python標準套件，在少數長駐的執行緒中進行背景刷新
+import threading, time, datetime, collections, functools, logging, concurrent.futures
+# asgiref       Django的非同步工具，非同步版本在執行緒中等待同一個single-flight鎖
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+# 全行程共用的背景刷新執行緒，執行緒長駐，資料庫連線可重複使用
+revalidator = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix='snapshot-revalidate')
+
+# 定義snapshot_cache物件，整個行程共用一份上游資料的快照
+class snapshot_cache:
+    def __init__(self, fetch, ttl, publish_times=(), retry_after=30, utc_offset=8, stale_while_revalidate=0): # 初始化
+        self.fetch = fetch # 抓取資料的函式，回傳值即為新的快照
+        self.ttl = ttl # 快照存活秒數
+        # 上游發布資料的時間(當地時間)，快照到期時間不會超過下一次發布時間
+        self.publish_times = sorted(datetime.time(*map(int, t.split(':'))) for t in publish_times)
+        self.retry_after = retry_after # 抓取失敗時，沿用舊快照多久後再重試
+        self.tz = datetime.timezone(datetime.timedelta(hours=utc_offset)) # 上游所在時區，證交所為UTC+8
+        self.stale_while_revalidate = stale_while_revalidate # 快照過期後仍可直接回傳的秒數，同時在背景重新抓取，0表示過期時一律等待
+        self.lock = threading.Lock() # 刷新用的鎖，避免同時有多個請求打到上游
+        self.data = None # 最後一次成功抓取的快照
+        self.fetched_at = 0 # 最後一次成功抓取的時間
+        self.expires_at = 0 # 快照到期時間
+        self.last_error = None # 最後一次抓取失敗的例外
+        self.hits = 0 # 快照未過期直接回傳的次數
+        self.misses = 0 # 快照過期而需等待刷新的次數
+        self.stale_hits = 0 # 快照過期但直接回傳舊快照、改在背景刷新的次數
+        self.listeners = [] # 每次抓取到新快照時呼叫的函式，以新快照為參數
+        return
+    def next_publish(self, now): # 計算now之後的下一次發布時間(timestamp)
+        if not self.publish_times:
+            return None
+        local = datetime.datetime.fromtimestamp(now, self.tz)
+        for day in range(2): # 今天剩下的發布時間，若都過了則為明天第一個發布時間
+            date = local.date() + datetime.timedelta(days=day)
+            for t in self.publish_times:
+                publish = datetime.datetime.combine(date, t, tzinfo=self.tz)
+                if publish > local:
+                    return publish.timestamp()
+        return None
+    def last_publish(self, now): # 計算now之前(含)的最近一次發布時間(timestamp)
+        if not self.publish_times:
+            return None
+        local = datetime.datetime.fromtimestamp(now, self.tz)
+        for day in range(2): # 今天已過的發布時間，若都還沒到則為昨天最後一個發布時間
+            date = local.date() - datetime.timedelta(days=day)
+            for t in reversed(self.publish_times):
+                publish = datetime.datetime.combine(date, t, tzinfo=self.tz)
+                if publish <= local:
+                    return publish.timestamp()
+        return None
+    def expiry(self, now): # 計算新快照的到期時間
+        expires_at = now + self.ttl
+        publish = self.next_publish(now)
+        if publish is not None and publish < expires_at: # 發布新資料時快照立即過期
+            expires_at = publish
+        return expires_at
+    def age(self): # 快照已存在的秒數
+        return time.time() - self.fetched_at
+    def fresh(self, now): # 快照是否存在且未過期
+        return self.data is not None and now < self.expires_at
+    def servable(self, now): # 快照已過期，但仍在可直接回傳舊快照的時間內
+        return self.data is not None and now < self.expires_at + self.stale_while_revalidate
+    def stale(self): # 目前的快照是否為舊資料：最後一次抓取失敗或已過期
+        return self.data is not None and (self.last_error is not None or time.time() >= self.expires_at)
+    def store(self, data, now): # 紀錄新抓取的快照
+        self.data = data
+        self.fetched_at = now
+        self.expires_at = self.expiry(now)
+        self.last_error = None
+        for listener in self.listeners:
+            listener(data)
+        return data
+    def fail(self, error, now): # 抓取失敗，回傳舊快照，沒有舊快照時拋出例外
+        self.last_error = error
+        if self.data is None: # 沒有舊快照可以使用
+            raise error
+        self.expires_at = now + self.retry_after # 沿用舊快照，稍後再重試
+        return self.data
+    def revalidate(self): # 在背景執行緒中刷新快照，已有執行緒在刷新時不重複進行
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            revalidator.submit(self.revalidate_locked)
+        except RuntimeError: # 行程結束中
+            self.lock.release()
+        return
+    def revalidate_locked(self): # 由背景執行緒呼叫，lock已由revalidate取得
+        try:
+            now = time.time()
+            try:
+                self.store(self.fetch(), now)
+            except Exception as e: # 保留舊快照，retry_after秒後再重試
+                logger.warning('background revalidation failed', exc_info=True)
+                self.fail(e, now)
+        finally:
+            self.lock.release()
+        return
+    def get(self): # 取得快照，過期時才會向上游抓取
+        now = time.time()
+        if self.fresh(now): # 快照未過期，直接回傳
+            self.hits += 1
+            return self.data
+        if self.servable(now): # 剛過期，先回傳舊快照，在背景刷新
+            self.stale_hits += 1
+            self.revalidate()
+            return self.data
+        self.misses += 1
+        return self.load()
+    def load(self): # 快照過期時刷新，同一時間只有一個執行緒刷新，其餘執行緒等待並共用結果
+        with self.lock:
+            now = time.time()
+            if self.fresh(now): # 等待期間已被其他執行緒刷新
+                return self.data
+            try:
+                data = self.fetch()
+            except Exception as e:
+                return self.fail(e, now)
+            return self.store(data, now)
+    def refresh(self): # 不論是否過期都重新抓取，供背景工作預先更新快照，失敗時保留舊快照並拋出例外
+        with self.lock:
+            now = time.time()
+            try:
+                data = self.fetch()
+            except Exception as e:
+                self.last_error = e
+                raise
+            return self.store(data, now)
+    async def aget(self): # 非同步版本的get，過期時在執行緒中與同步版本共用同一個鎖刷新，各請求的事件迴圈之間也只抓取一次
+        now = time.time()
+        if self.fresh(now):
+            self.hits += 1
+            return self.data
+        if self.servable(now):
+            self.stale_hits += 1
+            self.revalidate()
+            return self.data
+        self.misses += 1
+        return await sync_to_async(self.load, thread_sensitive=False)()
+    def subscribe(self, listener): # 新增抓取到新快照時呼叫的函式，會在刷新的執行緒中呼叫，應盡快返回
+        self.listeners.append(listener)
+        return
+    def invalidate(self): # 強制下一次get時重新抓取
+        self.expires_at = 0
+        return
+    def stats(self): # 回傳目前統計數據
+        return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits, 'age': self.age() if self.data is not None else None}
+
+# 定義keyed_snapshot_cache物件，依鍵值(例如股票代碼)各自保存一份snapshot_cache，並統計各鍵值的請求次數
+class keyed_snapshot_cache:
+    def __init__(self, fetch, ttl, max_keys=500, retry_after=30, stale_while_revalidate=0): # 初始化，fetch(鍵值)回傳該鍵值的新快照
+        self.fetch = fetch # 抓取資料的函式
+        self.ttl = ttl # 每份快照的存活秒數
+        self.max_keys = max_keys # 最多保存幾個鍵值，超過時淘汰最久未使用的
+        self.retry_after = retry_after # 抓取失敗時，沿用舊快照多久後再重試
+        self.stale_while_revalidate = stale_while_revalidate # 快照過期後仍可直接回傳的秒數
+        self.lock = threading.Lock() # 保護快照表及請求次數
+        self.snapshots = collections.OrderedDict() # 鍵值→snapshot_cache，最久未使用的在前
+        self.requests = collections.Counter() # 鍵值→近期請求次數，每次背景更新後減半
+        return
+    def snapshot(self, key): # 取得鍵值對應的snapshot_cache，不存在時建立
+        with self.lock:
+            cache = self.snapshots.get(key)
+            if cache is None:
+                cache = snapshot_cache(functools.partial(self.fetch, key), self.ttl, retry_after=self.retry_after,
+                                       stale_while_revalidate=self.stale_while_revalidate)
+                self.snapshots[key] = cache
+                while len(self.snapshots) > self.max_keys:
+                    self.snapshots.popitem(last=False)
+            else:
+                self.snapshots.move_to_end(key)
+            return cache
+    def count(self, key): # 紀錄一次請求
+        with self.lock:
+            self.requests[key] += 1
+        return
+    def get(self, key): # 取得鍵值的快照，過期時才會向上游抓取
+        self.count(key)
+        return self.snapshot(key).get()
+    async def aget(self, key): # 非同步版本的get
+        self.count(key)
+        return await self.snapshot(key).aget()
+    def stats(self): # 回傳目前保存的鍵值數及所有快照的命中、未命中次數總和
+        with self.lock:
+            snapshots = list(self.snapshots.values())
+        return {'keys': len(snapshots), 'hits': sum(cache.hits for cache in snapshots), 'misses': sum(cache.misses for cache in snapshots),
+                'stale_hits': sum(cache.stale_hits for cache in snapshots)}
+    def hot(self, count): # 回傳近期請求次數最多的count個鍵值
+        with self.lock:
+            return [key for key, requests in self.requests.most_common(count)]
+    def refresh_hot(self, count): # 重新抓取熱門鍵值的快照，供背景工作使用，之後將請求次數減半讓熱門程度隨時間衰退
+        keys = self.hot(count)
+        with self.lock:
+            self.requests = collections.Counter({key: requests // 2 for key, requests in self.requests.items() if requests > 1})
+        for key in keys:
+            try:
+                self.snapshot(key).refresh()
+            except Exception: # 單一鍵值失敗時保留舊快照，繼續更新其他鍵值
+                logger.warning('snapshot refresh failed for %s', key, exc_info=True)
+        return keys
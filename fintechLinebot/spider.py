@@ -1,139 +1,357 @@
-# requests      用來對網站發出請求
 # json          Python標準套件，用來處理JSON格式
-# random        Python標準套件，用來隨機產生資料夾名稱
-# os            Python標準套件，用來建立資料夾
-# shutil        Python標準套件，用來快速刪除資料夾(一般刪除需要資料夾為空，此套件可以遞迴刪除)
-# time          Python標準套件，用來計時刪除資料夾
-import requests, json, random, os, shutil, time
-# matplotlib    用來繪製圖表及表格
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from matplotlib.font_manager import FontProperties
-# numpy         支援高階大量的維度陣列與矩陣運算，僅用來產生表格漸層顏色
-import numpy as np
-# pandas        可進行數據操作和分析，僅用來解析HTML內容
-import pandas as pd
-# bs4           BeautifulSoup用來解析HTML內容
-from bs4 import BeautifulSoup
+# hashlib       Python標準套件，用來計算資料內容的雜湊值
+# types         Python標準套件，MappingProxyType用來發布不可修改的報價表
+# time、datetime Python標準套件，用來判斷本地歷史價格是否需要同步
+# logging       Python標準套件，上游抓取失敗但仍有本地資料時記錄警告
+# threading、concurrent  Python標準套件，在背景執行緒中回補個股歷史價格
+import json, hashlib, types, time, datetime, logging, threading, concurrent.futures
+# matplotlib、numpy等較大的套件只在繪圖行程中載入，縮短worker啟動時間及記憶體用量
+# django        讀取settings.py中的設定
+from django.conf import settings
+
+# parsers       自己寫的HTML解析工具，內容在parsers.py
+from .parsers import parse_commodity_table, parse_commodity_js, parse_stock_news
+# history       自己寫的歷史價格儲存，內容在history.py
+from . import history
+# fetcher       自己寫的共用連線池，內容在fetcher.py
+from .fetcher import http_fetcher
+# snapshot      自己寫的快照快取，內容在snapshot.py
+from .snapshot import snapshot_cache, keyed_snapshot_cache
+# refresher     自己寫的背景定期工作，內容在refresher.py
+from .refresher import background_refresher
+# janitor       自己寫的背景清理工具，內容在janitor.py
+from .janitor import artifact_janitor
+# render_cache  自己寫的圖片快取，內容在render_cache.py
+from .render_cache import render_cache
+# renderer      自己寫的繪圖行程池，內容在renderer.py
+from .renderer import render_pool, draw_price_chart, draw_price_table, render_profiles, image_extensions
+# metrics       自己寫的計時及統計工具，內容在metrics.py
+from .metrics import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# 全行程共用的計時及統計數據，由views.py以Prometheus文字格式提供，METRICS_TRACE_LOG為True時每個事件輸出一行追蹤紀錄
+metrics = metrics_registry('linebot_', trace_log=getattr(settings, 'METRICS_TRACE_LOG', False))
+
+# 全行程共用的連線池，所有爬蟲都透過它發出請求
+fetcher = http_fetcher(
+    connect_timeout=getattr(settings, 'HTTP_CONNECT_TIMEOUT', 3.05),
+    read_timeout=getattr(settings, 'HTTP_READ_TIMEOUT', 10),
+    retries=getattr(settings, 'HTTP_RETRIES', 2),
+    backoff=getattr(settings, 'HTTP_BACKOFF', 0.3),
+    per_host_limit=getattr(settings, 'HTTP_PER_HOST_LIMIT', 8),
+    slot_timeout=getattr(settings, 'HTTP_SLOT_TIMEOUT', 10),
+    pool_size=getattr(settings, 'HTTP_POOL_SIZE', 10),
+    conditional_cache_size=getattr(settings, 'HTTP_CONDITIONAL_CACHE_SIZE', 256),
+    metrics=metrics,
+    breaker_window=getattr(settings, 'UPSTREAM_BREAKER_WINDOW', 20),
+    breaker_min_requests=getattr(settings, 'UPSTREAM_BREAKER_MIN_REQUESTS', 5),
+    breaker_failure_rate=getattr(settings, 'UPSTREAM_BREAKER_FAILURE_RATE', 0.5),
+    breaker_cooldown=getattr(settings, 'UPSTREAM_BREAKER_COOLDOWN', 30)
+)
+
+# 全行程共用的圖表資料夾清理工具，資料夾由背景執行緒依存在時間刪除
+janitor = artifact_janitor(
+    './static',
+    max_age=getattr(settings, 'ARTIFACT_MAX_AGE', 60),
+    interval=getattr(settings, 'ARTIFACT_SWEEP_INTERVAL', 15)
+)
+
+# 全行程共用的圖片快取，同一份資料及繪圖參數只會繪製一次，圖片以內容雜湊命名，由views.image提供下載
+chart_cache = render_cache(
+    getattr(settings, 'RENDER_CACHE_DIR', './render'),
+    '/fintechLinebot/image/', # 對應fintechLinebot/urls.py中的image路徑
+    max_bytes=getattr(settings, 'RENDER_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+    max_files=getattr(settings, 'RENDER_CACHE_MAX_FILES', 500),
+    memory_bytes=getattr(settings, 'RENDER_CACHE_MEMORY_BYTES', 32 * 1024 * 1024)
+)
+janitor.add_task(chart_cache.evict) # 由背景清理工具淘汰超出上限的快取
+
+# 全行程共用的繪圖行程池，第一次繪圖時才建立行程
+chart_renderer = render_pool(
+    processes=getattr(settings, 'RENDER_PROCESSES', 2),
+    max_renders=getattr(settings, 'RENDER_MAX_PER_PROCESS', 50),
+    metrics=metrics,
+    timeout=getattr(settings, 'RENDER_TIMEOUT', 60)
+)
+
+# 上游網站→替代網址，預設為空，壓力測試(benchmarks/loadtest.py)時指向本機的模擬伺服器
+upstream_base_urls = getattr(settings, 'UPSTREAM_BASE_URLS', {})
+
+def upstream(url): # 依UPSTREAM_BASE_URLS替換上游網址的開頭
+    for origin, base_url in upstream_base_urls.items():
+        if url.startswith(origin):
+            return base_url + url[len(origin):]
+    return url
+
+# 上游網址
+stockq_commodity_js_url = upstream('http://www.stockq.org/commodity/js/') # 原物料歷史價格，後接<原物料代碼>_sma.js
+stockq_commodity_url = upstream('http://www.stockq.org/market/commodity.php') # 原物料最新價格
+twse_stock_day_all_url = upstream('http://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_dat') # 證交所當日全部股票行情
+twse_stock_day_url = upstream('https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json') # 證交所個股月成交資訊，後接&date=<YYYYMMDD>&stockNo=<股票代碼>
+pchome_stock_url = upstream('https://pchome.megatime.com.tw/stock/sid') # 股票新聞，後接<股票代碼>.html
+# 設置請求標頭，防止被阻擋
+pchome_headers = {
+    'referer': 'https://pchome.megatime.com.tw',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36'
+}
 
 # 定義commodity_spider物件
 class commodity_spider:
-    def __init__(self, commodity): # 初始化
+    # 繪圖參數，會納入快取鍵值，修改繪圖方式時需同時修改version
+    line_chart_params = {'figsize': [20, 15], 'dpi': 100, 'profiles': render_profiles, 'version': 4}
+    table_params = {'rows': 10, 'dpi': 200, 'profiles': render_profiles, 'version': 5}
+    def __init__(self, commodity, content=None, data_list=None, windows=None, days=None): # 初始化，content為已下載的內容，data_list為已整理好的資料，皆未傳入時才發出請求
+        # windows為移動平均的天數，預設為settings.CHART_MA_WINDOWS；days為圖表顯示的筆數，預設為全部，其餘資料只用來計算移動平均
         self.commodity = commodity # 將傳入的原料參數作為成員變數
-        self.url = 'http://www.stockq.org/commodity/js/' + self.commodity + '_sma.js' # 目標網址
-        content = requests.get(self.url).text # 對目標網址發出請求並取出文本內容
-        lines = content.split('\n') # 將每一行內容切分成list
-        # 將想要的內容寫成JSON字串
-        data_str = '['
-        for line in lines:
-            if line and line[0] == '[' and line[2] != '\'':
-                data_str += line.replace('\'', '"')
-        data_str += ']'
-
-        self.data_list = json.loads(data_str) # 將JSON字串轉換成python物件
-        self.x = [ele[0] for ele in self.data_list[1:]] # 日期資料
-        self.y1 = [ele[1] for ele in self.data_list[1:]] # 價格資料
-        self.y2 = [ele[2] for ele in self.data_list[1:]] # MA20資料
-        self.y3 = [ele[3] for ele in self.data_list[1:]] # MA60資料
-        rand_int = random.randint(0, 10000000) # 產生0~10000000的隨機整數
-        while os.path.exists('./static/' + str(rand_int)): # 若隨機整數名稱的資料夾存在則重複
-            rand_int = random.randint(0, 10000000) # 重新產生隨機整數
-        self.path = '/static/' + str(rand_int) + '/' # 紀錄隨機整數名稱資料夾路徑
-        os.mkdir('.' + self.path) # 建立資料夾
-        return
-    def __del__(self): # 物件被刪除時執行
-        time.sleep(60) # 等60秒
-        shutil.rmtree('.' + self.path) # 刪除隨機整數名稱資料夾及其內容
+        self.url = stockq_commodity_js_url + self.commodity + '_sma.js' # 目標網址
+        if data_list is None:
+            if content is None:
+                content = fetcher.get(self.url).text # 對目標網址發出請求並取出文本內容
+            data_list = [row[:2] for row in parse_commodity_js(content)] # 只使用價格，移動平均在繪圖行程中計算
+        self.data_list = data_list # [['Date', 'Price'], [日期, 價格], ...]
+        self.windows = chart_windows(windows)
+        self.days = min(days or len(data_list) - 1, len(data_list) - 1)
+        # 資料內容、移動平均天數及顯示筆數的雜湊值，任一項改變時才會重新繪圖
+        self.digest = hashlib.sha1(json.dumps([data_list, self.windows, self.days]).encode('utf-8')).hexdigest()
+        self.dates = [ele[0] for ele in self.data_list[1:]] # 日期資料
+        self.prices = [ele[1] for ele in self.data_list[1:]] # 價格資料
+        self.note = None # 附在圖表後的提醒文字，例如歷史價格尚在回補中
         return
-    def draw_line_chart(self): # 將資料畫成折線圖儲存在隨機整數名稱資料夾
-        fig = plt.figure(figsize=(20,15),dpi=300) # 設定圖片大小
-        ax = fig.add_subplot(1, 1, 1) # 建立圖表
-        plt.title(self.commodity, fontsize=28, fontweight='bold') # 設置標題
-        ax.xaxis.set_major_locator(ticker.MultipleLocator(10)) # 設置x軸顯示名稱區間
-        ax.yaxis.set_major_locator(ticker.MultipleLocator(50)) # 設置y軸顯示名稱區間
-        plt.grid(True) # 畫出網格
-        plt.plot(self.x, self.y1, color='r', linewidth=3) # 畫出價格線
-        plt.plot(self.x, self.y2, color='#0000E3', ls='-', markeredgecolor='#343deb', linewidth=3) # 畫出MA20線
-        plt.plot(self.x, self.y3, color='#D26900', ls='-', markeredgecolor='#343deb', linewidth=3) # 畫出MA60線
-        plt.legend(('Price', 'MA20', 'MA60'), shadow=True, loc='best', handlelength=1.5, fontsize=20) # 畫出圖例
-        plt.xlabel('Date ', fontsize=25, fontweight='bold', loc='right') # 設置x軸標題
-        plt.ylabel('Price ', fontsize=25, fontweight='bold', loc='top') # 設置y軸標題
-        plt.xticks(fontsize=15) # 設置x軸刻度標籤字體大小
-        plt.yticks(fontsize=18) # 設置y軸刻度標籤字體大小
-        plt.savefig('.' + self.path + 'plot.jpg', bbox_inches="tight", pad_inches=0.1, pil_kwargs={'quality':5}) # 儲存折線圖
-        return self.path + 'plot.jpg' # 回傳路徑
-    def draw_table(self): # 將最新十筆資料畫成表格儲存在隨機整數名稱資料夾
-        collabel = self.data_list[0][1:] # 行標籤
-        # 表格資料
-        clust_data = [l[1:] for l in self.data_list[-10:]]
-        clust_data = [["{:.1f}".format(ele) for ele in l] for l in clust_data]
-        clust_data.reverse() # 將順序顛倒，變成最新的在前
-        rowlabel = [l[0] for l in self.data_list[-10:]] # 列標籤
-        rowlabel.reverse() # 將順序顛倒，變成最新的在前
-        colcolours = ['#ff6666', '#788cff', '#ffa882'] # 設置行標籤顏色
-        rowcolours = plt.cm.YlOrRd(np.linspace(0.4, 0, 10)) # 設置行標籤顏色為漸層顏色
-        fig, ax = plt.subplots() # 建立圖表
-        ax.axis('tight') # 設置圖表布局
-        ax.axis('off') # 隱藏x，y軸
-        ax.set_title(self.commodity, fontsize=15, fontweight='bold', verticalalignment='top', pad=80.0) # 設置標題
-        # 畫表格
-        the_table = ax.table(cellText=clust_data , colLabels=collabel, colColours=colcolours, loc='center', rowLabels=rowlabel, rowColours=rowcolours, cellLoc='center', fontsize=1000)
-        the_table.auto_set_font_size(False)
-        the_table.set_fontsize(14)
-        the_table.scale(1, 3)
-        # 設置表格內容字體參數
-        P = []
-        for key, cell in the_table.get_celld().items():
-            row, col = key
-            P.append(cell)
-        for x in P[30:]:
-            x.set_text_props(fontproperties=FontProperties(weight='bold', size='large'))
-        plt.savefig('.' + self.path + 'table.jpg', bbox_inches="tight", pad_inches=0.1, dpi=300, pil_kwargs={'quality':5}) # 儲存表格
-        return self.path + 'table.jpg' # 回傳路徑
+    @metrics.timed()
+    def draw_line_chart(self): # 取得折線圖的原圖及預覽圖網址，快取中沒有時才繪製
+        key = chart_cache.key(self.commodity, 'plot', self.digest, self.line_chart_params)
+        return chart_cache.fetch(key, self.render_line_chart, image_files(self.line_chart_params))
+    @metrics.timed()
+    def render_line_chart(self): # 由繪圖行程計算移動平均並畫成折線圖，回傳 輸出設定→圖片bytes
+        return chart_renderer.render(draw_price_chart, self.commodity, self.dates, self.prices, self.windows, self.days, self.line_chart_params)
+    @metrics.timed()
+    def draw_table(self): # 取得表格的原圖及預覽圖網址，快取中沒有時才繪製
+        key = chart_cache.key(self.commodity, 'table', self.digest, self.table_params)
+        return chart_cache.fetch(key, self.render_table, image_files(self.table_params))
+    @metrics.timed()
+    def render_table(self): # 由繪圖行程計算移動平均並將最新十筆資料畫成表格，回傳 輸出設定→圖片bytes
+        return chart_renderer.render(draw_price_table, self.commodity, self.dates, self.prices, self.windows, self.table_params)
 
-def get_newest_price_msg(commodity_name): # 抓原物料價格
-    commodity_url = 'http://www.stockq.org/market/commodity.php' # 目標網址
-    commodity = pd.read_html(commodity_url)[7] # 僅取出想要的內容
-    commodity = commodity.drop(commodity.columns[0],axis=0) # 去除多餘部分
-    commodity = commodity.drop(commodity.columns[1],axis=0) # 去除多餘部分
-    commodity.columns = ['COMMODITY', 'PRICE', 'CHANGE', 'CHANGE_PERCENT', 'TIME'] # 設置行標籤
-    commodity.set_index("COMMODITY", inplace = True) # 設置索引為"COMMODITY"行
+def image_files(params): # 輸出設定→副檔名
+    return {name: image_extensions[profile['format']] for name, profile in params['profiles'].items()}
+
+def chart_windows(windows=None): # 圖表的移動平均天數，使用者未指定時為settings.CHART_MA_WINDOWS
+    return list(windows or getattr(settings, 'CHART_MA_WINDOWS', [20, 60]))
+
+@metrics.timed()
+def history_data(market, symbol, days, windows=None): # 由本地歷史價格建構[['Date', 'Price'], [日期, 價格], ...]，包含最後days筆及計算移動平均所需的前置資料
+    lookback = max(chart_windows(windows)) - 1 # 最後days筆的移動平均需要再往前的筆數
+    bars = [(date, price) for date, price in history.load_closes(market, symbol) if price is not None]
+    return [['Date', 'Price']] + [[date.strftime('%Y/%m/%d'), price] for date, price in bars[-(days + lookback):]]
+
+def commodity_history_data(commodity, days, windows=None): # 原物料的本地歷史價格
+    return history_data('commodity', commodity, days, windows)
+
+def commodity_history_stale(commodity): # 回傳(價格序列, 是否需要向stockq同步)
+    series = history.get_series('commodity', commodity)
+    return series, history.is_stale(series, getattr(settings, 'COMMODITY_HISTORY_MAX_AGE', 6 * 3600))
+
+@metrics.timed()
+def store_commodity_history(series, content): # 將stockq歷史價格中尚未儲存的日期加入資料庫
+    return history.append_bars(series, history.commodity_bars(content))
+
+def sync_failed(series, error): # 歷史價格同步失敗時，有本地資料就記錄警告並沿用，否則拋出例外
+    if series.latest_date is None:
+        raise error
+    logger.warning('price history sync failed, serving stored data for %s', series, exc_info=True)
+    return
+
+@metrics.timed()
+def load_commodity_spider(commodity, windows=None): # 由本地歷史價格建立commodity_spider物件，上游只在本地資料過期時才抓取，windows為使用者指定的移動平均天數
+    series, stale = commodity_history_stale(commodity)
+    if stale:
+        try:
+            store_commodity_history(series, fetcher.get(stockq_commodity_js_url + commodity + '_sma.js').text)
+        except Exception as e:
+            sync_failed(series, e)
+    days = getattr(settings, 'HISTORY_CHART_DAYS', 250)
+    return commodity_spider(commodity, data_list=commodity_history_data(commodity, days, windows), windows=windows, days=days)
+
+@metrics.timed()
+def sync_stock_history(stock_code, months): # 向證交所依月份回補個股日資料，已儲存的月份不再抓取，回傳新增筆數
+    series = history.get_series('stock', stock_code)
+    added = 0
+    for month in history.missing_months(series, months):
+        url = twse_stock_day_url + '&date=' + month.strftime('%Y%m%d') + '&stockNo=' + stock_code
+        added += history.sync_stock_month(series, month, json.loads(fetcher.get(url).content))
+    return added
+
+# 個股歷史價格的背景回補，缺少的月份需依序向證交所抓取，不在處理請求的執行緒中等待
+backfiller = concurrent.futures.ThreadPoolExecutor(max_workers=getattr(settings, 'STOCK_BACKFILL_THREADS', 2), thread_name_prefix='stock-backfill')
+backfilling = set() # 回補中或等待回補的股票代碼
+backfill_lock = threading.Lock() # 保護backfilling
+
+def backfill_stock_history(stock_code, months): # 由背景執行緒呼叫，失敗時只記錄警告，下一次查詢走勢圖時再排入回補
+    try:
+        sync_stock_history(stock_code, months)
+    except Exception:
+        logger.warning('stock history backfill failed for %s', stock_code, exc_info=True)
+    finally:
+        with backfill_lock:
+            backfilling.discard(stock_code)
+    return
+
+def schedule_stock_backfill(stock_code, months): # 將股票排入背景回補，同一股票同時只排一次，回傳是否回補中
+    with backfill_lock:
+        if stock_code in backfilling:
+            return True
+        backfilling.add(stock_code)
+    try:
+        backfiller.submit(backfill_stock_history, stock_code, months)
+    except RuntimeError: # 行程結束中
+        with backfill_lock:
+            backfilling.discard(stock_code)
+        return False
+    return True
+
+def stock_backfilling(stock_code): # 股票的歷史價格是否回補中
+    with backfill_lock:
+        return stock_code in backfilling
+
+@metrics.timed()
+def load_stock_spider(stock_code, windows=None): # 由本地股票歷史價格建立走勢圖物件，沿用原物料走勢圖的繪圖及快取
+    # 缺少的月份排入背景回補，這次先以已儲存的歷史價格繪圖並附上提醒，沒有任何資料時回傳None
+    months = getattr(settings, 'STOCK_CHART_MONTHS', 6)
+    pending = False
+    if history.missing_months(history.get_series('stock', stock_code), months):
+        pending = schedule_stock_backfill(stock_code, months)
+    days = min(getattr(settings, 'HISTORY_CHART_DAYS', 250), months * 23) # 每月最多約23個交易日
+    data_list = history_data('stock', stock_code, days, windows)
+    if len(data_list) == 1: # 尚未儲存任何日資料，或證交所查無此股票
+        return None
+    spider = commodity_spider(stock_code, data_list=data_list, windows=windows, days=days)
+    if pending:
+        spider.note = '※歷史價格補齊中，目前為已儲存的' + str(min(days, len(data_list) - 1)) + '筆資料，請稍後再查詢完整走勢圖'
+    return spider
+
+@metrics.timed()
+def parse_commodity_quotes(content): # 解析原物料價格網頁，回傳 原物料名稱→(買價, 漲跌, 比例, 時間) 的不可修改dict
+    quotes = {}
+    for row in parse_commodity_table(content): # 僅解析原物料報價表格
+        quotes.setdefault(row[0], row[1:])
+    return types.MappingProxyType(quotes)
+
+@metrics.timed()
+def fetch_commodity_quotes(): # 抓取原物料價格網頁並解析全部原物料報價
+    return parse_commodity_quotes(fetcher.get(stockq_commodity_url).content)
+
+# 全行程共用的原物料報價快照，由背景工作定期更新，請求時只需查表
+commodity_snapshot = snapshot_cache(
+    fetch_commodity_quotes,
+    ttl=getattr(settings, 'STOCKQ_SNAPSHOT_TTL', 180),
+    retry_after=getattr(settings, 'STOCKQ_SNAPSHOT_RETRY', 30),
+    stale_while_revalidate=getattr(settings, 'STOCKQ_SNAPSHOT_STALE', 300)
+)
+
+# 全行程共用的背景定期工作，由views.py啟動，避免在管理指令中啟動背景執行緒
+refresher = background_refresher()
+refresher.add(getattr(settings, 'STOCKQ_REFRESH_INTERVAL', 60), commodity_snapshot.refresh)
+
+def freshness_note(msg, cache, url): # 快照為舊資料時在訊息後加上資料時間的提醒，url為資料來源，用來檢查該主機的斷路器
+    if not cache.stale():
+        return msg
+    note = '此為' + str(int(cache.age() // 60)) + '分鐘前的資料'
+    if cache.last_error is not None or fetcher.breaker(url).state == 'open': # 上游抓取失敗，而不只是正在背景刷新
+        note = '資料來源暫時無法更新，' + note
+    return msg.rstrip('\n') + '\n※' + note
+
+def build_newest_price_msg(commodity_name, quotes, age): # 由報價表建構原物料價格訊息，age為資料已存在的秒數
+    if commodity_name not in quotes: # 若原物料未在抓取的內容中出現
+        return "找不到此原物料價格。" # 回傳訊息
+    price, change, change_percent, quote_time = quotes[commodity_name]
     # 建構回傳訊息
     msg = commodity_name + '最新價格\n'
-    msg += '買價：' + str(commodity.loc[commodity_name, "PRICE"]) + '\n'
-    msg += '漲跌：' + str(commodity.loc[commodity_name, "CHANGE"]) + '\n'
-    msg += '比例：' + str(commodity.loc[commodity_name, "CHANGE_PERCENT"])
+    msg += '買價：' + str(price) + '\n'
+    msg += '漲跌：' + str(change) + '\n'
+    msg += '比例：' + str(change_percent) + '\n'
+    msg += '資料時間：' + str(int(age)) + '秒前'
     return msg # 回傳訊息
 
-def get_newest_stock_price(stock_code): # 抓股票價格
-    col_name = ['CODE', 'NAME', 'VOLUME', 'AMOUNT', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'PRICE_CHANGE', 'TRANSACTION'] # 定義行標籤
+@metrics.timed()
+def get_newest_price_msg(commodity_name): # 抓原物料價格
+    quotes = commodity_snapshot.get() # 取得報價快照
+    return freshness_note(build_newest_price_msg(commodity_name, quotes, commodity_snapshot.age()), commodity_snapshot, stockq_commodity_url)
+
+def stock_day_synced(): # 本地的證交所行情是否在最近一次發布後、且在快照存活秒數內同步過
+    now = time.time()
+    since = now - stock_snapshot.ttl
+    published = stock_snapshot.last_publish(now)
+    if published is not None and published > since:
+        since = published
+    return history.stock_synced_since(datetime.datetime.fromtimestamp(since, datetime.timezone.utc))
+
+@metrics.timed()
+def fetch_stock_day_all(): # 取得證交所當日全部股票行情，本地資料已是最新時不向上游抓取
+    if not stock_day_synced():
+        history.sync_stock_day(json.loads(fetcher.get(twse_stock_day_all_url).content))
+    return history.load_stock_day()
+
+# 全行程共用的證交所行情快照，依設定的秒數及證交所發布時間過期
+stock_snapshot = snapshot_cache(
+    fetch_stock_day_all,
+    ttl=getattr(settings, 'TWSE_SNAPSHOT_TTL', 600),
+    publish_times=getattr(settings, 'TWSE_PUBLISH_TIMES', ()),
+    retry_after=getattr(settings, 'TWSE_SNAPSHOT_RETRY', 30),
+    stale_while_revalidate=getattr(settings, 'TWSE_SNAPSHOT_STALE', 600)
+)
+
+def after_publish(now, delay=getattr(settings, 'TWSE_REFRESH_DELAY', 60)): # 下一次證交所發布時間再過delay秒，讓證交所有時間更新資料
+    return stock_snapshot.next_publish(now - delay) + delay
+
+if stock_snapshot.publish_times: # 每次發布後在背景刷新行情快照，即使沒有人查詢也會檢查股價提醒
+    refresher.add_schedule(after_publish, stock_snapshot.refresh)
+
+def build_stock_price_msg(stock_code, stock): # 由行情快照建構股票價格訊息
     col_ch_name = ["證券名稱","成交股數","成交金額","開盤價","最高價","最低價","收盤價","漲跌價差","成交筆數"] # 定義行中文標籤
-    stock_url = 'http://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL?response=open_dat' # 目標網址
-    stock = pd.DataFrame(requests.get(stock_url).json()['data']) # 將網站想要的內容取出存成DataFrame物件
-    stock.columns = col_name # 設置行標籤
-    stock.set_index("CODE", inplace = True) # 設置索引為"CODE"行
-    if not any(stock_code == stock.index): # 若股票代碼未在抓取的內容中出現
+    if stock_code not in stock: # 若股票代碼未在抓取的內容中出現
         return "找不到此公司股票。" # 回傳訊息
     # 建構回傳訊息
     msg = '證券代號：' + stock_code + '\n'
-    for name, ch_name in zip(col_name[1:], col_ch_name):
-        msg += ch_name + '：' + stock.loc[stock_code, name] + '\n'
+    for ch_name, value in zip(col_ch_name, stock[stock_code][1:]):
+        msg += ch_name + '：' + value + '\n'
     return msg.strip() # 回傳訊息
 
-def get_stock_news(stock_id): # 抓股票新聞
-    url = 'https://pchome.megatime.com.tw/stock/sid' + stock_id + '.html' # 目標網址
-    # 設置請求標頭，防止被阻擋
-    headers = {
-        'referer': 'https://pchome.megatime.com.tw',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36'
-    }
-    res = requests.get(url, headers=headers) # 發出請求
-    soup = BeautifulSoup(res.text, 'lxml') # 解析網站回應
-    if soup.find('div', id='stock_info_news') == None: # 檢查是否有此公司新聞
+@metrics.timed()
+def get_newest_stock_price(stock_code): # 抓股票價格
+    return freshness_note(build_stock_price_msg(stock_code, stock_snapshot.get()), stock_snapshot, twse_stock_day_all_url) # 取得行情快照並建構訊息
+
+def build_stock_news_msg(news): # 由新聞清單建構回傳訊息，news為None時表示沒有此公司新聞
+    if news is None: # 檢查是否有此公司新聞
         return '查無此公司新聞。' # 回傳訊息
     # 建構回傳訊息
     response = ''
-    for a in soup.find('div', id='stock_info_news').findAll('a')[:5]: # 僅加入前五筆新聞
-        response += a.text + '\n' # 新聞標題
-        response += 'https://pchome.megatime.com.tw' + a.get('href') + '\n' # 新聞超連結
-    return response # 回傳訊息
\ No newline at end of file
+    for title, href in news: # 僅包含前五筆新聞
+        response += title + '\n' # 新聞標題
+        response += 'https://pchome.megatime.com.tw' + href + '\n' # 新聞超連結
+    return response # 回傳訊息
+
+@metrics.timed()
+def fetch_stock_news(stock_id): # 抓取股票新聞網頁並只解析新聞區塊
+    res = fetcher.get(pchome_stock_url + stock_id + '.html', headers=pchome_headers) # 發出請求
+    with metrics.stage('parse_stock_news', 'spider_seconds', 'function'):
+        return parse_stock_news(res.text)
+
+# 全行程共用的股票新聞快取，依股票代碼各自過期，並統計各股票的請求次數
+news_cache = keyed_snapshot_cache(
+    fetch_stock_news,
+    ttl=getattr(settings, 'STOCK_NEWS_TTL', 600),
+    max_keys=getattr(settings, 'STOCK_NEWS_CACHE_SIZE', 500),
+    retry_after=getattr(settings, 'STOCK_NEWS_RETRY', 30),
+    stale_while_revalidate=getattr(settings, 'STOCK_NEWS_STALE', 1800)
+)
+
+def refresh_hot_news(): # 背景更新最常被查詢的股票新聞，讓熱門股票不需等待pchome
+    return news_cache.refresh_hot(getattr(settings, 'STOCK_NEWS_HOT_TICKERS', 20))
+
+if getattr(settings, 'STOCK_NEWS_HOT_TICKERS', 20) > 0:
+    refresher.add(getattr(settings, 'STOCK_NEWS_REFRESH_INTERVAL', 300), refresh_hot_news)
+
+@metrics.timed()
+def get_stock_news(stock_id): # 抓股票新聞
+    return freshness_note(build_stock_news_msg(news_cache.get(stock_id)), news_cache.snapshot(stock_id), pchome_stock_url) # 取得新聞快取並建構訊息
@@ -1,3 +1,687 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+# threading、time、datetime   Python標準套件，測試同時請求及到期時間
+import threading, time, datetime
+
+# snapshot  自己寫的快照快取，內容在snapshot.py
+from .snapshot import snapshot_cache
+
+# 測試snapshot_cache：同時請求只抓取一次、依發布時間過期、抓取失敗時沿用舊快照
+class snapshot_cache_tests(SimpleTestCase):
+    def test_single_flight(self): # 快照過期時多個執行緒同時請求，只有一個執行緒向上游抓取
+        calls = []
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'data'
+        cache = snapshot_cache(fetch, ttl=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['data'] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get(), 'data')
+        self.assertEqual(len(calls), 1)
+    def test_async_single_flight(self): # 快照不存在時，不同執行緒各自的事件迴圈(WSGI下的async_to_sync)及同步版本同時請求，只抓取一次
+        from asgiref.sync import async_to_sync
+        calls = []
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'data'
+        cache = snapshot_cache(fetch, ttl=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(async_to_sync(cache.aget)())) for _ in range(2)]
+        threads.append(threading.Thread(target=lambda: results.append(cache.get())))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['data'] * 3)
+        self.assertEqual(len(calls), 1)
+    def test_publish_time_expiry(self): # 到期時間不超過下一次發布時間
+        cache = snapshot_cache(lambda: 'data', ttl=3600, publish_times=['14:00', '14:30'])
+        tz = datetime.timezone(datetime.timedelta(hours=8))
+        now = datetime.datetime(2026, 10, 16, 13, 50, tzinfo=tz).timestamp()
+        self.assertEqual(cache.expiry(now), datetime.datetime(2026, 10, 16, 14, 0, tzinfo=tz).timestamp())
+        self.assertEqual(cache.last_publish(now), datetime.datetime(2026, 10, 15, 14, 30, tzinfo=tz).timestamp())
+        later = datetime.datetime(2026, 10, 16, 15, 0, tzinfo=tz).timestamp()
+        self.assertEqual(cache.expiry(later), later + 3600) # 下一次發布為隔天，以ttl為準
+    def test_fail_serves_previous_snapshot(self): # 抓取失敗時沿用舊快照，retry_after秒內不再重試
+        results = ['old', RuntimeError('down')]
+        def fetch():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        cache = snapshot_cache(fetch, ttl=60, retry_after=30)
+        self.assertEqual(cache.get(), 'old')
+        cache.invalidate()
+        self.assertEqual(cache.get(), 'old')
+        self.assertIsInstance(cache.last_error, RuntimeError)
+        self.assertTrue(cache.fresh(time.time()))
+        self.assertFalse(cache.fresh(time.time() + 31))
+    def test_fail_without_snapshot_raises(self): # 沒有舊快照時拋出例外
+        def fetch():
+            raise RuntimeError('down')
+        cache = snapshot_cache(fetch, ttl=60)
+        with self.assertRaises(RuntimeError):
+            cache.get()
+    def test_stale_while_revalidate(self): # 剛過期時直接回傳舊快照，在背景刷新
+        results = ['old', 'new']
+        release = threading.Event()
+        def fetch():
+            if len(results) == 1: # 背景刷新等待測試檢查完舊快照
+                release.wait(5)
+            return results.pop(0)
+        cache = snapshot_cache(fetch, ttl=60, stale_while_revalidate=60)
+        self.assertEqual(cache.get(), 'old')
+        cache.expires_at = time.time() - 1
+        self.assertEqual(cache.get(), 'old')
+        self.assertEqual(cache.stale_hits, 1)
+        self.assertTrue(cache.stale())
+        self.assertIsNone(cache.last_error)
+        release.set()
+        for _ in range(100):
+            if cache.data == 'new':
+                break
+            time.sleep(0.05)
+        self.assertEqual(cache.get(), 'new')
+        self.assertFalse(cache.stale())
+    def test_stale_while_revalidate_fail(self): # 背景刷新失敗時保留舊快照並紀錄錯誤
+        results = ['old', RuntimeError('down')]
+        def fetch():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        cache = snapshot_cache(fetch, ttl=60, retry_after=30, stale_while_revalidate=60)
+        cache.get()
+        cache.expires_at = time.time() - 1
+        self.assertEqual(cache.get(), 'old')
+        for _ in range(100):
+            if cache.last_error is not None:
+                break
+            time.sleep(0.05)
+        self.assertIsInstance(cache.last_error, RuntimeError)
+        self.assertEqual(cache.get(), 'old')
+        self.assertTrue(cache.fresh(time.time()))
+
+# 測試spider.freshness_note：正常的背景刷新只標示資料時間，上游失敗或斷路器開啟時才提示無法更新
+class freshness_note_tests(SimpleTestCase):
+    def test_wording(self):
+        from .spider import freshness_note, fetcher
+        url = 'http://freshness-note.test/quotes'
+        cache = snapshot_cache(lambda: 'data', ttl=60)
+        cache.get()
+        self.assertEqual(freshness_note('msg\n', cache, url), 'msg\n') # 未過期
+        cache.expires_at = time.time() - 1
+        self.assertEqual(freshness_note('msg\n', cache, url), 'msg\n※此為0分鐘前的資料')
+        cache.last_error = RuntimeError('down')
+        self.assertEqual(freshness_note('msg', cache, url), 'msg\n※資料來源暫時無法更新，此為0分鐘前的資料')
+        cache.last_error = None
+        breaker = fetcher.breaker(url)
+        with breaker.lock:
+            breaker.open()
+        self.assertEqual(freshness_note('msg', cache, url), 'msg\n※資料來源暫時無法更新，此為0分鐘前的資料')
+
+# 測試async_spider.request_client：請求專用的連線池優先使用，離開時關閉
+class request_client_tests(SimpleTestCase):
+    def test_scoped_client_closed(self):
+        import asyncio
+        from . import async_spider
+        async def run():
+            async with async_spider.request_client() as scoped:
+                self.assertIs(async_spider.get_client(), scoped)
+                async def in_task(): # gather建立的task也使用同一個連線池
+                    return async_spider.get_client()
+                self.assertEqual(await asyncio.gather(in_task(), in_task()), [scoped, scoped])
+            self.assertTrue(scoped.is_closed)
+            shared = async_spider.get_client()
+            self.assertIsNot(shared, scoped)
+            await shared.aclose()
+        asyncio.run(run())
+
+# 測試renderer.price_series：繪圖行程中以indicators計算的移動平均，與逐筆計算的結果相同
+class price_series_tests(SimpleTestCase):
+    def test_matches_loop(self):
+        import random
+        from .renderer import price_series, price_labels
+        prices = [random.uniform(10, 1000) for _ in range(300)]
+        def loop_sma(window, i): # 資料不足window筆時以現有資料平均
+            values = prices[max(0, i - window + 1):i + 1]
+            return sum(values) / len(values)
+        for count in (1, 10, 250, 300):
+            series = price_series(prices, [5, 20, 60], count)
+            self.assertEqual(series[0], prices[-count:])
+            for column, window in zip(series[1:], [5, 20, 60]):
+                self.assertEqual(len(column), count)
+                for offset, value in enumerate(column):
+                    self.assertAlmostEqual(value, loop_sma(window, len(prices) - count + offset), places=6)
+        self.assertEqual(price_labels([5, 120]), ['Price', 'MA5', 'MA120'])
+
+def crash_once(flag): # 第一次呼叫時讓繪圖行程異常結束，模擬被OOM killer結束
+    import os
+    if not os.path.exists(flag):
+        open(flag, 'w').close()
+        os._exit(1)
+    return {'images': {'original': b'ok'}, 'metrics': {'draw_ms': 1.0}}
+
+def hang(seconds, path=None): # 模擬卡住的繪圖，path不為None時將繪圖行程的pid寫入檔案
+    import os
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(str(os.getpid()))
+    time.sleep(seconds)
+    return {'images': {}, 'metrics': {'draw_ms': 1.0}}
+
+# 測試render_pool：繪圖行程異常結束時換新的行程池重試，卡住時在timeout後失敗且不影響之後的繪圖
+class render_pool_tests(SimpleTestCase):
+    def test_broken_pool_retried(self):
+        import os, tempfile
+        from .renderer import render_pool
+        pool = render_pool(processes=1, timeout=30)
+        with tempfile.TemporaryDirectory() as root:
+            self.assertEqual(pool.render(crash_once, os.path.join(root, 'flag')), {'original': b'ok'})
+            self.assertEqual(pool.recycled, 1)
+            self.assertEqual(pool.render(crash_once, os.path.join(root, 'flag')), {'original': b'ok'})
+        pool.executor.shutdown()
+    def test_hung_render_times_out(self):
+        import concurrent.futures, os, tempfile
+        from .renderer import render_pool
+        pool = render_pool(processes=1, timeout=30)
+        self.assertEqual(pool.render(hang, 0), {}) # 先啟動繪圖行程
+        pool.timeout = 0.5
+        with tempfile.TemporaryDirectory() as root:
+            with self.assertRaises(concurrent.futures.TimeoutError):
+                pool.render(hang, 30, os.path.join(root, 'pid'))
+            with open(os.path.join(root, 'pid')) as f:
+                pid = int(f.read())
+        for _ in range(100): # 卡住的繪圖行程已被結束
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail('hung render process still running')
+        pool.timeout = 30 # 新的行程池需要啟動時間
+        with tempfile.TemporaryDirectory() as root:
+            open(os.path.join(root, 'flag'), 'w').close()
+            self.assertEqual(pool.render(crash_once, os.path.join(root, 'flag')), {'original': b'ok'})
+        pool.executor.shutdown()
+
+# 測試renderer.draw_table：只有行標籤及列標籤使用粗體，與移動平均數量及資料列數無關
+class draw_table_tests(SimpleTestCase):
+    def test_header_cells_styled_by_key(self):
+        from unittest import mock
+        from .renderer import draw_table, render_profiles, load_pyplot
+        plt = load_pyplot()
+        for rows, columns in ((10, 3), (10, 4), (3, 4)):
+            collabel = ['Price'] + ['MA' + str(i) for i in range(columns - 1)]
+            rowlabel = ['2026/10/%02d' % (i + 1) for i in range(rows)]
+            cells = [['1.0'] * columns for _ in range(rows)]
+            tables = []
+            original = plt.Axes.table
+            def capture(ax, *args, **kwargs):
+                tables.append(original(ax, *args, **kwargs))
+                return tables[-1]
+            with mock.patch.object(plt.Axes, 'table', capture):
+                draw_table('test', collabel, rowlabel, cells, {'dpi': 50, 'profiles': {'preview': render_profiles['preview']}})
+            for (row, col), cell in tables[0].get_celld().items():
+                self.assertEqual(cell.get_text().get_fontweight() == 'bold', row == 0 or col == -1, (rows, columns, row, col))
+
+# 測試company_search：股票代碼及公司名稱完全相同、前綴、包含及打錯字的查詢
+class company_search_tests(SimpleTestCase):
+    companies = [('1101', '台泥', '01'), ('1102', '亞泥', '01'), ('2330', '台積電', '24'), ('2303', '聯電', '24'),
+                 ('2317', '鴻海', '31'), ('2412', '中華電', '27'), ('2882', '國泰金', '17'), ('6505', '台塑化', '23')]
+    def setUp(self):
+        from .search import company_search
+        self.index = company_search(lambda: self.companies, limit=5)
+    def codes(self, text):
+        return [code for code, name, industry_id in self.index.search(text)]
+    def test_exact(self): # 完全相同的股票代碼或名稱排在最前面，異體字及全形文字視為相同
+        self.assertEqual(self.codes('2330'), ['2330'])
+        self.assertEqual(self.codes('台積電')[0], '2330')
+        self.assertEqual(self.codes('臺積電')[0], '2330')
+        self.assertEqual(self.codes('２３３０'), ['2330'])
+    def test_partial_code(self): # 股票代碼前綴依代碼排序
+        self.assertEqual(self.codes('23'), ['2303', '2317', '2330'])
+        self.assertEqual(self.codes('110'), ['1101', '1102'])
+    def test_partial_name(self): # 名稱前綴優先於名稱包含
+        self.assertEqual(self.codes('台積'), ['2330'])
+        self.assertEqual(self.codes('華電'), ['2412'])
+    def test_near_miss(self): # 打錯一個字仍可找到
+        self.assertIn('2330', self.codes('台積店'))
+        self.assertIn('2882', self.codes('國太金'))
+    def test_short_and_unknown(self): # 太短或完全無關的文字沒有結果
+        self.assertEqual(self.codes('台'), [])
+        self.assertEqual(self.codes('你好嗎今天'), [])
+
+# 測試history：當日全部行情的日期不受個股回補影響，月份是否完整依抓取紀錄及日資料數量判斷
+class stock_history_tests(TestCase):
+    def stock_day_all(self, date, codes):
+        from .history import sync_stock_day
+        rows = [[code, 'name' + code, '1,000', '100,000', '10.00', '11.00', '9.00', '10.50', '+0.50', '100'] for code in codes]
+        return sync_stock_day({'date': date.strftime('%Y%m%d'), 'data': rows})
+    def test_backfill_does_not_move_stock_day(self): # 個股回補的較新日資料不會讓其他股票查無行情
+        from .history import get_series, merge_bars, load_stock_day
+        self.stock_day_all(datetime.date(2026, 10, 15), ['2330', '2317', '1101'])
+        merge_bars(get_series('stock', '2330'), [{'date': datetime.date(2026, 10, 16), 'close': 612.0}])
+        stocks = load_stock_day()
+        self.assertEqual(sorted(stocks), ['1101', '2317', '2330'])
+        self.assertEqual(stocks['2330'][7], '10.50')
+    def test_load_stock_day_empty_before_first_sync(self):
+        from .history import get_series, merge_bars, load_stock_day
+        merge_bars(get_series('stock', '2330'), [{'date': datetime.date(2026, 10, 16), 'close': 612.0}])
+        self.assertEqual(load_stock_day(), {})
+    def test_missing_months(self):
+        from .history import get_series, merge_bars, record_sync, missing_months, taipei
+        today = datetime.date(2026, 10, 16)
+        synced = lambda *args: datetime.datetime(*args, 15, 0, tzinfo=taipei)
+        self.stock_day_all(datetime.date(2026, 10, 15), ['2330'])
+        series = get_series('stock', '2330')
+        # 只有每日同步的資料，從未抓取過個股月成交資訊：全部月份都需要抓取，包含本月1至14日
+        self.assertEqual(missing_months(series, 3, today=today), [datetime.date(2026, 8, 1), datetime.date(2026, 9, 1), datetime.date(2026, 10, 1)])
+        record_sync('stock_day', '2330', datetime.date(2026, 8, 1), synced(2026, 9, 2)) # 月底後抓取，完整
+        record_sync('stock_day', '2330', datetime.date(2026, 9, 1), synced(2026, 9, 20)) # 月中抓取，之後可能缺漏
+        record_sync('stock_day', '2330', datetime.date(2026, 10, 1), synced(2026, 10, 2))
+        # 本月2日抓取後只有15日的每日同步，中間缺漏
+        self.assertEqual(missing_months(series, 3, today=today), [datetime.date(2026, 9, 1), datetime.date(2026, 10, 1)])
+        days = [datetime.date(2026, 10, day) for day in range(2, 15) if datetime.date(2026, 10, day).weekday() < 5]
+        merge_bars(series, [{'date': day, 'close': 600.0} for day in days])
+        self.assertEqual(missing_months(series, 3, today=today), [datetime.date(2026, 9, 1)])
+        # 最近抓取過的本月不重新抓取
+        series.bars.filter(date__lt=datetime.date(2026, 10, 15)).delete()
+        record_sync('stock_day', '2330', datetime.date(2026, 10, 1), synced(2026, 10, 14))
+        self.assertEqual(missing_months(series, 3, today=today), [datetime.date(2026, 9, 1)])
+
+    def test_chart_does_not_wait_for_backfill(self): # 缺少的月份在背景回補，走勢圖先以已儲存的歷史價格繪製並附上提醒
+        from unittest import mock
+        from .history import get_series, merge_bars
+        from . import spider
+        release = threading.Event()
+        calls = []
+        def slow_sync(stock_code, months): # 模擬依序向證交所抓取多個月份
+            calls.append(stock_code)
+            release.wait(5)
+        today = datetime.date.today()
+        merge_bars(get_series('stock', '2330'), [{'date': today - datetime.timedelta(days=i), 'close': 600.0 + i} for i in range(1, 6)])
+        with mock.patch.object(spider, 'sync_stock_history', slow_sync):
+            start = time.time()
+            chart = spider.load_stock_spider('2330')
+            self.assertLess(time.time() - start, 2)
+            self.assertEqual(len(chart.prices), 5)
+            self.assertIn('補齊中', chart.note)
+            self.assertTrue(spider.stock_backfilling('2330'))
+            self.assertIsNone(spider.load_stock_spider('2317')) # 沒有任何資料時不繪圖
+            self.assertTrue(spider.stock_backfilling('2317'))
+            spider.load_stock_spider('2330') # 回補中不重複排入
+            release.set()
+            for _ in range(100):
+                if not spider.stock_backfilling('2330') and not spider.stock_backfilling('2317'):
+                    break
+                time.sleep(0.05)
+        self.assertEqual(sorted(calls), ['2317', '2330'])
+        self.assertFalse(spider.stock_backfilling('2330'))
+    def test_history_data_lookback(self): # 只取出最後days筆及計算移動平均所需的前置資料
+        from .history import get_series, merge_bars
+        from .spider import history_data
+        start = datetime.date(2026, 1, 1)
+        merge_bars(get_series('stock', '2330'), [{'date': start + datetime.timedelta(days=i), 'close': float(i)} for i in range(100)])
+        data_list = history_data('stock', '2330', 10, [5, 20])
+        self.assertEqual(data_list[0], ['Date', 'Price'])
+        self.assertEqual(len(data_list) - 1, 10 + 19)
+        self.assertEqual(data_list[-1], [(start + datetime.timedelta(days=99)).strftime('%Y/%m/%d'), 99.0])
+        self.assertEqual(len(history_data('stock', '2330', 250)) - 1, 100)
+        self.assertEqual(history_data('stock', '2317', 10), [['Date', 'Price']])
+
+# 測試render_cache：以內容雜湊命名、鍵值對應的圖片清單、依最後使用時間淘汰，以及image view的304、404
+class render_cache_tests(SimpleTestCase):
+    def setUp(self):
+        import tempfile
+        from .render_cache import render_cache
+        self.root = tempfile.TemporaryDirectory()
+        self.cache = render_cache(self.root.name, '/fintechLinebot/image/', max_files=2, memory_bytes=10)
+    def tearDown(self):
+        self.root.cleanup()
+    def test_put_and_get(self): # 相同內容只存一份，記憶體快取淘汰後改由磁碟讀取
+        import hashlib
+        name = self.cache.put(b'image-a', 'png')
+        self.assertEqual(name, hashlib.sha1(b'image-a').hexdigest() + '.png')
+        self.assertEqual(self.cache.put(b'image-a', 'png'), name)
+        self.cache.put(b'image-b-is-longer', 'png') # 超過記憶體上限，淘汰image-a
+        self.assertNotIn(name, self.cache.memory)
+        self.assertEqual(self.cache.get(name), b'image-a')
+        self.assertIsNone(self.cache.get('0' * 40 + '.png'))
+    def test_fetch_and_lookup(self): # 未命中時繪製一次，之後由圖片清單取得相同網址
+        calls = []
+        def render():
+            calls.append(1)
+            return {'original': b'big', 'preview': b'small'}
+        key = self.cache.key('GOLD', 'plot', 'digest', {'dpi': 100})
+        urls = self.cache.fetch(key, render, {'original': 'png', 'preview': 'jpg'})
+        self.assertEqual(self.cache.fetch(key, render, {'original': 'png', 'preview': 'jpg'}), urls)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertTrue(urls['preview'].startswith('/fintechLinebot/image/') and urls['preview'].endswith('.jpg'))
+        self.assertNotEqual(key, self.cache.key('GOLD', 'plot', 'digest', {'dpi': 200}))
+    def test_evict_removes_least_recently_used(self): # 超過檔案數量上限時先淘汰最久未使用的檔案，圖片被淘汰後清單失效
+        import os, time
+        key = self.cache.key('GOLD', 'plot', 'digest', {})
+        self.cache.fetch(key, lambda: {'original': b'old'}, {'original': 'png'})
+        past = time.time() - 3600
+        for name in os.listdir(self.root.name):
+            os.utime(os.path.join(self.root.name, name), (past, past))
+        for data in (b'new-1', b'new-2'):
+            self.cache.put(data, 'png')
+        self.assertEqual(self.cache.evict(), 2) # 舊圖片及其清單被淘汰
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertEqual(len(os.listdir(self.root.name)), 2)
+    def test_image_view(self): # 已有相同內容時回傳304，檔名格式錯誤或已被淘汰時回傳404
+        from unittest import mock
+        from django.test import RequestFactory
+        from . import views
+        name = self.cache.put(b'image-a', 'png')
+        factory = RequestFactory()
+        with mock.patch.object(views, 'chart_cache', self.cache):
+            response = views.image(factory.get('/'), name)
+            self.assertEqual((response.status_code, response.content, response['Content-Type']), (200, b'image-a', 'image/png'))
+            self.assertIn('immutable', response['Cache-Control'])
+            response = views.image(factory.get('/', HTTP_IF_NONE_MATCH=response['ETag']), name)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(views.image(factory.get('/'), '../settings.py').status_code, 404)
+            self.assertEqual(views.image(factory.get('/'), '0' * 40 + '.png').status_code, 404)
+
+# 測試prometheus_metrics：預設關閉，設定token時需帶上相同的Bearer token
+class prometheus_metrics_tests(SimpleTestCase):
+    def test_access(self):
+        from django.test import RequestFactory, override_settings
+        from . import views
+        factory = RequestFactory()
+        self.assertEqual(views.prometheus_metrics(factory.get('/')).status_code, 404)
+        with override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret'):
+            self.assertEqual(views.prometheus_metrics(factory.get('/')).status_code, 403)
+            self.assertEqual(views.prometheus_metrics(factory.get('/', HTTP_AUTHORIZATION='Bearer wrong')).status_code, 403)
+            response = views.prometheus_metrics(factory.get('/', HTTP_AUTHORIZATION='Bearer secret'))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'# TYPE linebot_', response.content)
+            self.assertIn(b'linebot_artifact_janitor_alive ', response.content)
+            self.assertIn(b'linebot_artifact_janitor_removed_total ', response.content)
+
+def event(name, user_id=None, group_id=None): # 建立只有來源的測試事件
+    import types
+    return types.SimpleNamespace(name=name, source=types.SimpleNamespace(user_id=user_id, group_id=group_id, room_id=None))
+
+# 測試worker：依來源分組保持順序，不同來源同時處理，一個事件失敗不影響其他事件，每個請求同時使用的執行緒有上限
+class event_fanout_tests(SimpleTestCase):
+    def test_group_events_keeps_order(self):
+        from .worker import group_events
+        events = [event('a1', 'A'), event('b1', 'B'), event('a2', 'A'), event('g1', None, 'G'), event('x'), event('y'), event('b2', 'B')]
+        groups = [[e.name for e in group] for group in group_events(events)]
+        self.assertEqual(groups, [['a1', 'a2'], ['b1', 'b2'], ['g1'], ['x'], ['y']]) # 沒有來源的事件各自一組
+    def test_failure_isolated_and_order_kept(self):
+        from .worker import event_fanout
+        handled = []
+        lock = threading.Lock()
+        def handler(e):
+            if e.name == 'a1':
+                raise RuntimeError('boom')
+            time.sleep(0.01)
+            with lock:
+                handled.append(e.name)
+        fanout = event_fanout(handler, parallelism=3, threads=4)
+        with self.assertLogs('fintechLinebot.worker', 'ERROR'):
+            fanout.run([event('a1', 'A'), event('b1', 'B'), event('a2', 'A'), event('c1', 'C'), event('b2', 'B'), event('a3', 'A')])
+        self.assertEqual(sorted(handled), ['a2', 'a3', 'b1', 'b2', 'c1'])
+        self.assertLess(handled.index('a2'), handled.index('a3'))
+        self.assertLess(handled.index('b1'), handled.index('b2'))
+    def test_parallelism_bounded_per_request(self): # 大量事件的請求最多同時使用parallelism個執行緒，其他請求不需等待
+        from .worker import event_fanout
+        lock = threading.Lock()
+        running = {'big': 0, 'small': 0}
+        peak = {'big': 0, 'small': 0}
+        finished = {}
+        def handler(e):
+            with lock:
+                running[e.name] += 1
+                peak[e.name] = max(peak[e.name], running[e.name])
+            time.sleep(0.05)
+            with lock:
+                running[e.name] -= 1
+        fanout = event_fanout(handler, parallelism=3, threads=4)
+        big = threading.Thread(target=lambda: (fanout.run([event('big', 'U' + str(i)) for i in range(30)]), finished.setdefault('big', time.time())))
+        big.start()
+        time.sleep(0.02)
+        start = time.time()
+        fanout.run([event('small', 'S' + str(i)) for i in range(3)])
+        small_elapsed = time.time() - start
+        big.join()
+        self.assertEqual(peak['big'], 3)
+        self.assertLess(small_elapsed, 0.3) # 3個來源同時處理約0.05秒，不需等待大量事件的請求處理完(約0.5秒)
+
+# 測試fetcher.circuit_breaker：closed→open→half_open→closed，以及試探請求未回報結果時不會永遠停在half_open
+class circuit_breaker_tests(SimpleTestCase):
+    def test_transitions(self):
+        from .fetcher import circuit_breaker
+        breaker = circuit_breaker(window=4, min_requests=2, failure_rate=0.5, cooldown=0.1)
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'open') # 2次中1次失敗，達到失敗率
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.rejected, 1)
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow()) # 冷卻時間已過，放行一個試探請求
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow()) # 試探請求進行中
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'open') # 試探失敗，重新開啟
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'closed') # 試探成功
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+    def test_lost_probe(self): # 試探請求未回報結果，冷卻時間過後放行下一個試探請求
+        from .fetcher import circuit_breaker
+        breaker = circuit_breaker(window=4, min_requests=1, failure_rate=0.5, cooldown=0.1)
+        breaker.record(False)
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'closed')
+    def test_cancelled_probe(self): # 非同步的試探請求被取消時視為失敗，斷路器重新開啟
+        import asyncio
+        from unittest import mock
+        from . import async_spider
+        url = 'http://cancelled-probe.test/quotes'
+        breaker = async_spider.fetcher.breaker(url)
+        with breaker.lock:
+            breaker.open()
+        breaker.opened_at = 0 # 冷卻時間已過
+        class hanging_client:
+            async def get(self, url, headers=None):
+                await asyncio.sleep(10)
+        async def run():
+            task = asyncio.ensure_future(async_spider.fetch(url))
+            await asyncio.sleep(0.05)
+            self.assertEqual(breaker.state, 'half_open')
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        with mock.patch.object(async_spider, 'get_client', hanging_client):
+            asyncio.run(run())
+        self.assertEqual(breaker.state, 'open')
+
+# 測試spider.after_publish：行情快照在每次證交所發布時間後於背景刷新
+class stock_refresh_schedule_tests(SimpleTestCase):
+    def test_after_publish(self):
+        from .spider import after_publish
+        tz = datetime.timezone(datetime.timedelta(hours=8))
+        at = lambda day, hour, minute: datetime.datetime(2026, 10, day, hour, minute, tzinfo=tz).timestamp()
+        self.assertEqual(after_publish(at(16, 13, 0), delay=60), at(16, 14, 1))
+        self.assertEqual(after_publish(at(16, 14, 0), delay=60), at(16, 14, 1)) # 發布後、刷新前
+        self.assertEqual(after_publish(at(16, 14, 1), delay=60), at(16, 14, 31)) # 刷新當下排下一次
+        self.assertEqual(after_publish(at(16, 14, 31), delay=60), at(17, 14, 1))
+
+# 測試alerts：指令解析、門檻相同時的觸發範圍、同一提醒只推播一次
+class price_alert_tests(TestCase):
+    def test_parse_alert(self):
+        from .alerts import parse_alert
+        self.assertEqual(parse_alert('2330 > 600'), ('2330', 'above', 600.0))
+        self.assertEqual(parse_alert('2330>=600.5'), ('2330', 'above', 600.5))
+        self.assertEqual(parse_alert('黃金 跌破 1,800'), ('黃金', 'below', 1800.0))
+        self.assertEqual(parse_alert('原油低於70'), ('原油', 'below', 70.0))
+        self.assertIsNone(parse_alert('2330'))
+        self.assertIsNone(parse_alert('2330 > abc'))
+        self.assertIsNone(parse_alert('2330 = 600'))
+    def test_match_boundaries(self): # 價格等於門檻時觸發，相同門檻的提醒全部觸發
+        from .alerts import alert_index
+        from .models import PriceAlert
+        def add(direction, threshold, symbol='2330'):
+            return PriceAlert.objects.create(target='U1', market='stock', symbol=symbol, direction=direction, threshold=threshold).id
+        above = [add('above', 590), add('above', 600), add('above', 600)]
+        add('above', 610)
+        below = [add('below', 600), add('below', 600), add('below', 620)]
+        add('below', 580)
+        add('above', 1, symbol='2317') # 快照中沒有價格
+        matches = alert_index('stock').match({'2330': 600.0, '2317': None})
+        self.assertEqual(list(matches), [('2330', 600.0)])
+        self.assertEqual(sorted(matches['2330', 600.0]), sorted(above + below))
+        self.assertEqual(alert_index('stock').match({'2330': 595.0}), {('2330', 595.0): [above[0]] + below})
+        self.assertEqual(alert_index('commodity').match({'2330': 600.0}), {})
+    def test_reused_id(self): # 取消最新的提醒後新增提醒，即使ID被重複使用也不會以舊提醒的條件觸發
+        from unittest import mock
+        from .alerts import alert_monitor, alert_index, stock_prices, cancel_alerts
+        from .models import PriceAlert
+        PriceAlert.objects.create(target='U1', market='stock', symbol='2317', direction='above', threshold=500)
+        newest = PriceAlert.objects.create(target='U1', market='stock', symbol='2330', direction='above', threshold=600)
+        api = mock.Mock()
+        monitor = alert_monitor(api)
+        monitor.executor.shutdown()
+        monitor.indexes['stock'] = alert_index('stock')
+        data = {'2330': ['2330', '台積電', '', '', '', '', '', '610.00']}
+        monitor.check('stock', stock_prices, {}) # 載入索引
+        self.assertEqual(cancel_alerts('U1', newest.id), 1)
+        # 模擬資料庫重複使用最大的ID(沒有AUTOINCREMENT的SQLite、重新啟動後的MySQL等)
+        PriceAlert.objects.create(id=newest.id, target='U2', market='stock', symbol='2330', direction='above', threshold=700)
+        monitor.check('stock', stock_prices, data)
+        self.assertEqual(monitor.stats()['triggered'], 0)
+        api.push_message.assert_not_called()
+        self.assertEqual(monitor.indexes['stock'].symbols['2330'], {'above': ([700.0], [newest.id])}) # 索引已重新載入
+        self.assertEqual(monitor.claim('stock', {('2330', 610.0): [newest.id]}), []) # 即使以舊索引的結果標記，也會再次確認條件
+        self.assertTrue(PriceAlert.objects.filter(id=newest.id, triggered_at=None).exists())
+    def test_claim_once(self): # 兩次檢查(例如兩個worker收到同一份快照)只推播一次
+        from unittest import mock
+        from .alerts import alert_monitor, alert_index, stock_prices
+        from .models import PriceAlert
+        PriceAlert.objects.create(target='U1', market='stock', symbol='2330', direction='above', threshold=600)
+        PriceAlert.objects.create(target='U2', market='stock', symbol='2330', direction='above', threshold=600)
+        PriceAlert.objects.create(target='C1', market='stock', symbol='2330', direction='below', threshold=700)
+        PriceAlert.objects.create(target='U1', market='stock', symbol='2330', direction='above', threshold=650)
+        data = {'2330': ['2330', '台積電', '', '', '', '', '', '610.00']}
+        api = mock.Mock()
+        monitors = [alert_monitor(api), alert_monitor(api)]
+        for monitor in monitors:
+            monitor.indexes['stock'] = alert_index('stock')
+            monitor.check('stock', stock_prices, data)
+            monitor.executor.shutdown()
+        self.assertEqual(monitors[0].stats(), {'triggered': 3, 'pushes': 2, 'failed': 0})
+        self.assertEqual(monitors[1].stats(), {'triggered': 0, 'pushes': 0, 'failed': 0})
+        api.multicast.assert_called_once()
+        self.assertEqual(sorted(api.multicast.call_args[0][0]), ['U1', 'U2'])
+        api.push_message.assert_called_once()
+        self.assertEqual(api.push_message.call_args[0][0], 'C1')
+        self.assertEqual(PriceAlert.objects.filter(triggered_at=None).count(), 1)
+        monitors[0].check('stock', stock_prices, data)
+        self.assertEqual(monitors[0].stats()['pushes'], 2)
+
+# 測試views.resolve_chart：走勢圖指令後接自訂的移動平均天數
+class resolve_chart_tests(SimpleTestCase):
+    def test_windows(self):
+        from . import views
+        self.assertEqual(views.resolve_chart('黃金—價格走勢圖 60 5 20'), (views.commodity_chart, ('黃金', (5, 20, 60))))
+        self.assertEqual(views.resolve_chart('2330—股票走勢圖 MA5,MA120'), (views.stock_chart, ('2330', (5, 120))))
+        self.assertEqual(views.router.resolve('2330—股票走勢圖 ma10'), (views.stock_chart, ('2330', (10,))))
+        self.assertIsNone(views.resolve_chart('黃金—價格走勢圖'))
+        self.assertIsNone(views.resolve_chart('黃金—價格走勢圖 0'))
+        self.assertIsNone(views.resolve_chart('黃金—價格走勢圖 500'))
+        self.assertIsNone(views.resolve_chart('黃金—價格走勢圖 1 2 3 4 5 6'))
+        self.assertIsNone(views.resolve_chart('黃金—股票走勢圖 5'))
+        self.assertIsNone(views.resolve_chart('0000—股票走勢圖 5'))
+
+# 測試event_worker：等待及處理時間以直方圖輸出，可跨worker彙總
+class event_worker_tests(SimpleTestCase):
+    def test_wait_and_run_histograms(self):
+        from .metrics import metrics_registry
+        from .worker import event_worker
+        registry = metrics_registry('test_')
+        done = threading.Event()
+        def handler(event):
+            time.sleep(0.05)
+            done.set()
+        worker = event_worker(handler, threads=1, queue_size=10, metrics=registry)
+        self.assertTrue(worker.submit(event('a', user_id='U1')))
+        self.assertTrue(done.wait(5))
+        for _ in range(100): # 處理完成後才紀錄處理時間
+            if worker.stats()['completed'] == 1:
+                break
+            time.sleep(0.01)
+        text = registry.render()
+        self.assertIn('# TYPE test_worker_wait_seconds histogram', text)
+        self.assertIn('test_worker_wait_seconds_count 1', text)
+        self.assertIn('test_worker_run_seconds_count 1', text)
+        run_sum = float(text.split('test_worker_run_seconds_sum ')[1].split()[0])
+        self.assertGreaterEqual(run_sum, 0.05)
+
+# 測試背景定期工作在測試時不會啟動，測試不連線到上游
+class prefetch_disabled_tests(SimpleTestCase):
+    def test_refresher_not_started(self):
+        from django.conf import settings
+        from . import views
+        self.assertFalse(settings.PREFETCH_ENABLED)
+        self.assertIsNone(views.refresher.thread)
+
+# 測試views.reply_message：預先序列化的訊息透過SDK的http_client送出，錯誤時拋出LineBotApiError
+class reply_message_tests(SimpleTestCase):
+    def test_reply(self):
+        import json, types
+        from unittest import mock
+        from linebot.exceptions import LineBotApiError
+        from linebot.models import TextSendMessage
+        from . import views
+        client = mock.Mock()
+        client.post.return_value = types.SimpleNamespace(status_code=200, headers={}, json={})
+        with mock.patch.object(views.line_bot_api, 'http_client', client):
+            views.reply_message('token', TextSendMessage(text='hi'))
+            url = client.post.call_args[0][0]
+            kwargs = client.post.call_args[1]
+            self.assertEqual(url, views.line_bot_api.endpoint + '/v2/bot/message/reply')
+            self.assertEqual(kwargs['headers']['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(kwargs['data']), {'replyToken': 'token', 'messages': [{'type': 'text', 'text': 'hi'}]})
+            client.post.return_value = types.SimpleNamespace(status_code=400, headers={'X-Line-Request-Id': 'r1'}, json={'message': 'Invalid reply token'})
+            with self.assertRaises(LineBotApiError) as raised:
+                views.reply_message('token', TextSendMessage(text='hi'))
+            self.assertEqual(raised.exception.status_code, 400)
+            self.assertEqual(raised.exception.error.message, 'Invalid reply token')
+
+# 測試http_fetcher：同一網站的請求名額用完時，在slot_timeout後直接失敗並計入斷路器
+class host_slot_tests(SimpleTestCase):
+    def test_busy_host_fails_fast(self):
+        from .fetcher import http_fetcher, host_busy_error
+        fetcher = http_fetcher(per_host_limit=1, slot_timeout=0.1, breaker_min_requests=1)
+        url = 'http://busy-host.test/quotes'
+        held = fetcher.acquire(url) # 模擬卡住的請求佔用唯一的名額
+        start = time.time()
+        with self.assertRaises(host_busy_error):
+            fetcher.get(url)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(fetcher.breaker(url).state, 'open')
+        held.release()
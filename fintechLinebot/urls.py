@@ -1,5 +1,8 @@
 from django.urls import path
 from . import views
 urlpatterns = [
-    path('reply', views.reply)
+    path('reply', views.reply),
+    path('async_reply', views.async_reply),
+    path('image/<str:filename>', views.image),
+    path('metrics', views.prometheus_metrics)
 ]
\ No newline at end of file
@@ -1,120 +1,322 @@
 # django    網頁框架
 from django.shortcuts import render
-from django.http.response import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http.response import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound, HttpResponseNotModified
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 
 # linebot   Linebot SDK，Line官方提供用來處理訊息的套件
 from linebot import LineBotApi, WebhookParser
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, FollowEvent
-from linebot.models import TextSendMessage, ImageSendMessage, TemplateSendMessage, ButtonsTemplate, MessageTemplateAction, CarouselTemplate, CarouselColumn
+from linebot.models import TextSendMessage, ImageSendMessage, TemplateSendMessage, ButtonsTemplate, MessageTemplateAction
 from linebot.models.messages import TextMessage, StickerMessage
+from linebot.models.error import Error
 
 # spider    自己寫的爬蟲套件，內容在spider.py
-from .spider import commodity_spider, get_newest_price_msg, get_newest_stock_price, get_stock_news
+from .spider import load_commodity_spider, load_stock_spider, get_newest_price_msg, get_newest_stock_price, get_stock_news, refresher, chart_cache, janitor
+from .spider import stock_backfilling
+from .spider import metrics, fetcher, commodity_snapshot, stock_snapshot, news_cache
 
-# json      Python標準套件，用來處理JSON格式
-import json
+# async_spider  自己寫的非同步爬蟲套件，內容在async_spider.py
+from . import async_spider
 
-line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN) # 建立LineBotApi物件，用來傳送回應
+# catalog   原物料及產業清單，內容在catalog.py
+from .catalog import commodity_dict, industry_dict
+
+# refdata   自己寫的參考資料索引，內容在refdata.py
+from .refdata import reference_index
+
+# search    自己寫的公司搜尋索引，內容在search.py
+from .search import company_search
+
+# router    自己寫的指令路由表，內容在router.py
+from .router import command_router
+
+# messages  自己寫的固定訊息，內容在messages.py
+from .messages import build_registry, reply_body, company_carousel
+
+# worker    自己寫的背景事件處理工具，內容在worker.py
+from .worker import event_worker, event_fanout, group_events, source_key
+
+# alerts    自己寫的價格提醒，內容在alerts.py
+from . import alerts
+
+# asgiref   Django內建，非同步版本在執行緒中存取資料庫
+from asgiref.sync import sync_to_async
+
+# re        Python標準套件，用來檢查圖片檔名及解析自訂移動平均的走勢圖指令
+# asyncio   Python標準套件，非同步版本同時處理不同來源的事件
+# logging   Python標準套件，用來紀錄非同步版本處理事件時發生的錯誤
+# hmac      Python標準套件，以固定時間比對統計數據的存取token
+import re, asyncio, logging, hmac
+
+logger = logging.getLogger(__name__)
+
+line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN, endpoint=getattr(settings, 'LINE_API_ENDPOINT', 'https://api.line.me')) # 建立LineBotApi物件，用來傳送回應
 parser = WebhookParser(settings.LINE_CHANNEL_SECRET) # 建立WebhookParser物件，用來驗證及解析接收到的訊息
 domain = settings.ALLOWED_HOSTS[-1] # 取得自己的網域名稱，定義在setting.py
+if getattr(settings, 'PREFETCH_ENABLED', True): # 啟動背景定期工作，預先抓取上游資料，測試時關閉
+    refresher.start()
 
-commodity_dict = {
-    "黃金": "COMMGOLD", 
-    "銀": "COMMSILV", 
-    "白金": "COMMPLAT", 
-    "鈀": "COMMPALL", 
-    "銠": "COMMRHDM", 
-    "銅": "COMMCOPP", 
-    "鎳": "COMMNIKL", 
-    "鋁": "COMMALUM", 
-    "鋅": "COMMZINC", 
-    "鉛": "COMMLEAD", 
-    "黃金期貨": "FUTRGOLD", 
-    "銀期貨": "FUTRSILV", 
-    "銅期貨": "FUTRCOPP", 
-    "紐約輕原油": "FUTRWOIL", 
-    "布蘭特油期": "FUTRBOIL", 
-    "天然氣期": "FUTRNGAS", 
-    "燃油期貨": "FUTRHOIL", 
-    "無鉛汽油": "FUTRRBOB", 
-    "玉米期貨": "FUTRCORN", 
-    "小麥期貨": "FUTRWHEA", 
-    "黃豆期貨": "FUTRBEAN", 
-    "黃豆油期貨": "FUTRBNOL", 
-    "活牛期貨": "FUTRCATT", 
-    "瘦豬期貨": "FUTRHOGS", 
-    "可可豆期": "FUTRCOCO", 
-    "咖啡C期": "FUTRCOFF", 
-    "十一號糖": "FUTRSUGR", 
-    "二號棉期": "FUTRCTTN", 
-    "XAU/USD": "XAUUSD", 
-    "XAG/USD": "XAGUSD", 
-    "倫敦銅期貨": "FUTRCOPPUK", 
-    "倫敦鋁期貨": "FUTRALMNUK", 
-    "倫敦鎳期貨": "FUTRNIKLUK", 
-    "倫敦重柴油": "FUTRLNGO", 
-    "碳排放期貨": "FUTRCRBN", 
-    "倫敦咖啡豆": "FUTRLNCF"
-}
+# 公司及產業參考資料索引，第一次查詢時才開啟，多個worker共用同一個唯讀檔案
+refdata = reference_index(settings.BASE_DIR, settings.REFDATA_PATH)
+company_index = company_search(refdata.companies) # 公司名稱及股票代碼搜尋索引，第一次搜尋時才建立
 
-industry_dict = {
-    "1": "水泥工業",
-    "2": "食品工業",
-    "3": "塑膠工業",
-    "4": "紡織工業",
-    "5": "電機機械",
-    "6": "電器電纜",
-    "7": "化學生技業",
-    "21": "化學工業",
-    "22": "生技醫療",
-    "8": "玻璃陶瓷",
-    "9": "造紙工業",
-    "10": "鋼鐵工業",
-    "11": "橡膠工業",
-    "12": "汽車工業",
-    "13": "電子工業",
-    "24": "半導體業",
-    "25": "電腦及週邊設備業",
-    "26": "光電業",
-    "27": "通訊網路業",
-    "28": "電子零組件業",
-    "29": "電子通路業",
-    "30": "資訊服務業",
-    "31": "其他電子業",
-    "14": "建材營造",
-    "15": "航運",
-    "16": "觀光",
-    "17": "金融",
-    "18": "貿易百貨",
-    "23": "油電燃氣",
-    "19": "綜合",
-    "20": "其他",
-    "80": "管理股票",
-    "32": "文化創意業",
-    "33": "農業科技",
-    "34": "電子商務",
-    "91": "台灣存託憑證",
-    "97": "社會企業",
-    "98": "農林漁牧",
-    "-": "傳產其他"
-}
+registry = build_registry(industry_dict, commodity_dict) # 啟動時預先序列化所有固定選單
+
+# 價格提醒，原物料報價及證交所行情快照每次更新時檢查全部提醒，觸發的提醒以推播通知
+alert_monitor = alerts.alert_monitor(line_bot_api)
+alert_monitor.watch(commodity_snapshot, 'commodity', alerts.commodity_prices)
+alert_monitor.watch(stock_snapshot, 'stock', alerts.stock_prices)
+
+def chart_messages(line_chart_urls, table_urls, note=None): # 建構折線圖及表格的圖片訊息，各自使用原圖及縮小的預覽圖，note不為None時附上提醒文字
+    messages = [ImageSendMessage(
+        original_content_url='https://' + domain + line_chart_urls['original'],
+        preview_image_url='https://' + domain + line_chart_urls['preview']
+    ),
+    ImageSendMessage(
+        original_content_url='https://' + domain + table_urls['original'],
+        preview_image_url='https://' + domain + table_urls['preview']
+    )]
+    if note is not None:
+        messages.append(TextSendMessage(text=note))
+    return messages
+
+def no_stock_history(stock_code): # 沒有任何已儲存的歷史價格時的回覆
+    if stock_backfilling(stock_code): # 第一次查詢，正在背景回補
+        return TextSendMessage(text='正在取得此公司股票的歷史價格，請稍後再試。')
+    return TextSendMessage(text='找不到此公司股票的歷史價格。')
+
+# 指令處理函式，皆以(event, *參數)呼叫並回傳回覆訊息
+def prebuilt(event, name): # 傳送預先序列化的固定選單
+    return registry[name]
+
+def text_reply(event, text): # 傳送固定文字訊息
+    return TextSendMessage(text=text)
+
+def unknown_command(event): # 若接收到其他非相關文字訊息
+    if '—' in event.message.text: # 含破折號但不是已知的按鈕指令，不回覆
+        return None
+    return registry['main_menu'] # 傳送主功能選單
+
+def commodity_chart(event, commodity_name, windows=None): # 原物料—價格走勢圖，windows為使用者指定的移動平均天數
+    spider = load_commodity_spider(commodity_dict[commodity_name], windows) # 由本地歷史價格建立commodity_spider物件，本地資料過期時才向上游抓取
+    # 繪製折線圖及表格並傳送圖片
+    return chart_messages(spider.draw_line_chart(), spider.draw_table())
+
+def commodity_price(event, commodity_name): # 原物料—最新價格，內容使用get_newest_price_msg(<原物料名稱>)及時抓取
+    return TextSendMessage(text=get_newest_price_msg(commodity_name))
+
+def stock_price(event, stock_code): # 公司股票代碼—股票價格，內容使用get_newest_stock_price(<公司股票代碼>)及時抓取
+    return TextSendMessage(text=get_newest_stock_price(stock_code))
+
+def stock_chart(event, stock_code, windows=None): # 公司股票代碼—股票走勢圖，與原物料走勢圖共用繪圖及快取
+    spider = load_stock_spider(stock_code, windows) # 由本地股票歷史價格建立走勢圖物件，缺少的月份才向證交所抓取
+    if spider is None:
+        return no_stock_history(stock_code)
+    return chart_messages(spider.draw_line_chart(), spider.draw_table(), spider.note)
+
+def stock_news(event, stock_code): # 公司股票代碼—公司新聞，內容使用get_stock_news(<公司股票代碼>)及時抓取
+    return TextSendMessage(text=get_stock_news(stock_code))
+
+alert_usage = "請輸入名稱或股票代碼、突破或跌破及價格\n例如：「2330 > 600」、「黃金 跌破 1800」\n輸入「我的提醒」查看已設定的提醒" # 價格提醒說明
+
+def current_price(market, symbol): # 目前快照中的價格，尚未抓取過時回傳None，不向上游抓取
+    if market == 'commodity':
+        data = commodity_snapshot.data
+        return None if data is None else alerts.commodity_prices(data).get(symbol)
+    data = stock_snapshot.data
+    return None if data is None or symbol not in data else alerts.parse_price(data[symbol][7])
+
+def add_alert_reply(event, market, symbol, direction, threshold): # 名稱或代碼 突破/跌破 價格—新增價格提醒
+    target = source_key(event)
+    if target is None:
+        return TextSendMessage(text='無法設定提醒。')
+    price = current_price(market, symbol)
+    if price is not None and alerts.triggered(direction, threshold, price): # 已達到門檻，不需提醒
+        return TextSendMessage(text='目前價格' + alerts.format_price(price) + '已' + alerts.direction_names[direction] + alerts.format_price(threshold) + '。')
+    if alerts.add_alert(target, market, symbol, direction, threshold, getattr(settings, 'ALERT_MAX_PER_TARGET', 20)) is None:
+        return TextSendMessage(text='提醒數量已達上限，請先取消部分提醒。')
+    return TextSendMessage(text='已設定提醒：' + alerts.describe(symbol, direction, threshold) + '\n價格更新時檢查，觸發後推播通知。')
+
+def list_alerts_reply(event): # 我的提醒—列出尚未觸發的提醒
+    target = source_key(event)
+    pending = alerts.list_alerts(target) if target is not None else []
+    if not pending:
+        return TextSendMessage(text='目前沒有設定提醒。\n' + alert_usage)
+    lines = ['#' + str(alert.id) + ' ' + alerts.describe(alert.symbol, alert.direction, alert.threshold) for alert in pending]
+    return TextSendMessage(text='\n'.join(lines) + '\n輸入「取消提醒 #編號」取消單一提醒，「取消提醒」取消全部')
+
+def cancel_alerts_reply(event, alert_id): # 取消提醒—取消單一或全部提醒
+    target = source_key(event)
+    count = alerts.cancel_alerts(target, alert_id) if target is not None else 0
+    return TextSendMessage(text='已取消' + str(count) + '個提醒。')
+
+def company_search_reply(event, companies): # 傳送公司搜尋結果
+    return company_carousel(companies, industry_dict)
+
+def industry_analysis_reply(event, industry): # 產業名稱—產業分析，內容在industry_analysis.json中定義
+    return TextSendMessage(text=refdata.industry_text('analysis', industry))
+
+def industry_news_reply(event, industry): # 產業名稱—產業新聞，內容在industry_news.json中定義
+    return TextSendMessage(text=refdata.industry_text('news', industry))
+
+def company_menu(event, stock_code): # 傳送該公司相關資訊功能選單
+    name, industry_id = refdata.company(stock_code)
+    return TemplateSendMessage(
+        alt_text='特定公司相關資訊',
+        template=ButtonsTemplate(
+            title=stock_code + ' - ' + name,
+            text='請選擇欲查詢的項目。',
+            actions=[
+                MessageTemplateAction(
+                    label='股票價格',
+                    text=stock_code + '—股票價格'
+                ),
+                MessageTemplateAction(
+                    label='股票走勢圖',
+                    text=stock_code + '—股票走勢圖'
+                ),
+                MessageTemplateAction(
+                    label='公司新聞',
+                    text=stock_code + '—公司新聞'
+                ),
+                MessageTemplateAction(
+                    label='產業相關資訊',
+                    text=industry_dict[industry_id]
+                )
+            ]
+        )
+    )
+
+# 指令路由表，啟動時建立所有指令，收到文字訊息時只需一次dict查詢
+router = command_router(unknown_command)
+router.add('特定公司相關資訊', text_reply, "請輸入公司股票代碼或公司名稱\n例如：台泥請輸入「1101」或「台泥」")
+router.add('產業相關資訊', prebuilt, 'industry_carousel')
+router.add('原物料價格', prebuilt, 'commodity_carousel')
+router.add('價格提醒', text_reply, alert_usage)
+router.add('我的提醒', list_alerts_reply)
+router.add('取消提醒', cancel_alerts_reply, None)
+for industry in industry_dict.values():
+    router.add(industry, prebuilt, 'industry:' + industry)
+for commodity in commodity_dict.keys():
+    router.add(commodity, prebuilt, 'commodity:' + commodity)
+router.add_subcommands(commodity_dict.keys(), {'價格走勢圖': commodity_chart, '最新價格': commodity_price})
+router.add_subcommands(industry_dict.values(), {'產業分析': industry_analysis_reply, '產業新聞': industry_news_reply})
+
+stock_subcommands = {'股票價格': stock_price, '股票走勢圖': stock_chart, '公司新聞': stock_news} # 公司股票代碼—子指令
+
+def resolve_stock(text): # 公司股票代碼及其子指令數量龐大，改為查詢參考資料索引
+    stock_code, _, subcommand = text.partition('—')
+    if refdata.company(stock_code) is None: # 非公司股票代碼
+        return None
+    if not subcommand: # 若接收到公司股票代碼之文字訊息
+        return (company_menu, (stock_code,))
+    if subcommand in stock_subcommands:
+        return (stock_subcommands[subcommand], (stock_code,))
+    return None
+
+def resolve_alert(text): # 價格提醒及取消單一提醒的指令
+    if text.startswith('取消提醒'):
+        alert_id = text[len('取消提醒'):].strip().lstrip('#')
+        return (cancel_alerts_reply, (int(alert_id),)) if alert_id.isdigit() else None
+    parsed = alerts.parse_alert(text)
+    if parsed is None:
+        return None
+    symbol, direction, threshold = parsed
+    if symbol in commodity_dict:
+        return (add_alert_reply, ('commodity', symbol, direction, threshold))
+    if refdata.company(symbol) is not None:
+        return (add_alert_reply, ('stock', symbol, direction, threshold))
+    return None
+
+def resolve_search(text): # 不是任何指令時，以公司名稱或部分股票代碼搜尋公司
+    if '—' in text: # 按鈕指令不做搜尋
+        return None
+    companies = company_index.search(text)
+    if not companies:
+        return None
+    return (company_search_reply, (companies,))
 
-with open('industry_news.json', encoding='UTF-8') as json_file:
-    industry_news_dict = json.load(json_file)
-with open('industry_analysis.json', encoding='UTF-8') as json_file:
-    industry_analysis = json.load(json_file)
-company_dict = {}
-company_industry_dict = {}
-with open("company.txt", 'r', encoding='UTF-8') as f:
-    line = f.readline().strip()
-    while line:
-        com = line.split(',')
-        company_dict[com[0]] = com[1]
-        company_industry_dict[com[0]] = com[2]
-        line = f.readline().strip()
+# 走勢圖指令後接自訂的移動平均天數，例如「黃金—價格走勢圖 5 20 120」、「2330—股票走勢圖 MA5,MA60」
+chart_windows_pattern = re.compile(r'^(\S+?)—(價格走勢圖|股票走勢圖)\s*((?:MA)?\d+(?:[\s,，]+(?:MA)?\d+)*)$', re.IGNORECASE)
+
+def resolve_chart(text): # 自訂移動平均天數的走勢圖指令，天數由本地歷史價格計算，不需額外向上游抓取
+    match = chart_windows_pattern.match(text)
+    if match is None:
+        return None
+    name, subcommand, numbers = match.groups()
+    windows = tuple(sorted(set(int(number) for number in re.findall(r'\d+', numbers))))
+    if len(windows) > getattr(settings, 'CHART_MA_MAX_COUNT', 5) or windows[0] < 1 or windows[-1] > getattr(settings, 'CHART_MA_MAX_WINDOW', 240):
+        return None
+    if subcommand == '價格走勢圖' and name in commodity_dict:
+        return (commodity_chart, (name, windows))
+    if subcommand == '股票走勢圖' and refdata.company(name) is not None:
+        return (stock_chart, (name, windows))
+    return None
+
+router.add_resolver(resolve_stock)
+router.add_resolver(resolve_chart)
+router.add_resolver(resolve_alert)
+router.add_resolver(resolve_search)
+
+def build_reply(event): # 依事件內容建構回覆訊息，不需回覆時回傳None
+    if isinstance(event, MessageEvent): # 若事件為訊息事件
+        if isinstance(event.message, StickerMessage): # 若訊息內容為貼圖
+            # 傳送主功能選單
+            return registry['main_menu']
+        elif not isinstance(event.message, TextMessage): # 若訊息內容為非文字及貼圖(邏輯上)
+            # 傳送文字訊息
+            return TextSendMessage(text='請傳送文字或貼圖訊息。')
+        with metrics.stage('route'):
+            handler, args = router.resolve(event.message.text) # 查詢指令路由表，第一次搜尋公司時會建立搜尋索引
+        with metrics.stage(handler.__name__, 'handler_seconds', 'handler'): # 紀錄各指令的處理時間
+            return handler(event, *args)
+    elif isinstance(event, FollowEvent): # 若事件為追隨事件
+        # 傳送主功能選單
+        return registry['main_menu']
+    # 未處理其他事件
+    return None
+
+def reply_message(reply_token, messages): # 傳送回應，預先序列化的訊息不需再次轉換，透過SDK公開的http_client介面送出，不依賴SDK的私有方法
+    response = line_bot_api.http_client.post(
+        line_bot_api.endpoint + '/v2/bot/message/reply',
+        headers=dict(line_bot_api.headers, **{'Content-Type': 'application/json'}),
+        data=reply_body(reply_token, messages)
+    )
+    if not 200 <= response.status_code < 300: # 與SDK的reply_message相同，以LineBotApiError回報錯誤
+        raise LineBotApiError(
+            status_code=response.status_code,
+            headers=dict(response.headers.items()),
+            request_id=response.headers.get('X-Line-Request-Id'),
+            error=Error.new_from_json_dict(response.json)
+        )
+    return
+
+def handle_event(event): # 處理單一事件並回覆，各階段的處理時間紀錄在同一筆追蹤資料中
+    with metrics.trace(event=event.type, mode='sync'):
+        messages = build_reply(event)
+        if messages:
+            with metrics.stage('reply'):
+                reply_message(event.reply_token, messages)
+    return
+
+# 背景事件處理工具，settings.LINE_ASYNC_REPLY為True時，事件在此處理後再用reply_message回覆
+worker = event_worker(
+    handle_event,
+    threads=getattr(settings, 'LINE_WORKER_THREADS', 4),
+    queue_size=getattr(settings, 'LINE_QUEUE_SIZE', 100),
+    submit_timeout=getattr(settings, 'LINE_QUEUE_WAIT', 1),
+    metrics=metrics
+)
+
+# 同步處理模式(settings.LINE_ASYNC_REPLY為False)時，同一次webhook中不同來源的事件同時處理
+fanout = event_fanout(
+    handle_event,
+    parallelism=getattr(settings, 'LINE_EVENT_PARALLELISM', 4),
+    threads=getattr(settings, 'LINE_FANOUT_THREADS', 16)
+)
 
 @csrf_exempt # 使請求可以來自其他網域
 def reply(request):
@@ -123,327 +325,187 @@ def reply(request):
         signature = request.META['HTTP_X_LINE_SIGNATURE'] # 此request header用來驗證請求是由LINE Platform發出
         body = request.body.decode('utf-8') # 使用UTF-8編碼解碼請求內容
         try:
-            events = parser.parse(body, signature) # 使用line sdk解析請求內容
+            with metrics.stage('parse'):
+                events = parser.parse(body, signature) # 使用line sdk解析請求內容
         except InvalidSignatureError: # 若signature驗證失敗
+            metrics.inc('webhook_requests_total', status='403')
             return HttpResponseForbidden() # 回傳http status code 403
         except LineBotApiError: # 若解析過程錯誤
+            metrics.inc('webhook_requests_total', status='400')
             return HttpResponseBadRequest() # 回傳http status code 400
+        metrics.inc('webhook_requests_total', status='200')
         # 處理事件
+        if getattr(settings, 'LINE_ASYNC_REPLY', False): # 背景處理模式，立即回應LINE Platform
+            for event in events:
+                if not worker.submit(event): # 佇列已滿，在目前的執行緒直接處理，藉此減緩接收速度
+                    worker.process(event)
+        else:
+            fanout.run(events) # 不同來源同時處理，同一來源依序處理
+        return HttpResponse() # 傳送空回應
+    else: # 若HTTP請求Method為非POST
+        return HttpResponse('HI!') # 在畫面上印出"HI!"，Debug用
+
+breaker_state_values = {'closed': 0, 'half_open': 1, 'open': 2} # 斷路器狀態→Prometheus數值
+
+def collect_stats(): # 在Prometheus抓取時才取出各元件已有的統計數據
+    worker_stats = worker.stats()
+    cache_stats = chart_cache.stats()
+    alert_stats = alert_monitor.stats()
+    janitor_stats = janitor.stats()
+    samples = [
+        ('worker_queue_depth', 'gauge', {}, worker_stats['depth']),
+        ('worker_events_total', 'counter', {'result': 'completed'}, worker_stats['completed']),
+        ('worker_events_total', 'counter', {'result': 'failed'}, worker_stats['failed']),
+        ('worker_events_total', 'counter', {'result': 'rejected'}, worker_stats['rejected']),
+        ('render_cache_requests_total', 'counter', {'result': 'hit'}, cache_stats['hits']),
+        ('render_cache_requests_total', 'counter', {'result': 'miss'}, cache_stats['misses']),
+        ('render_cache_memory_bytes', 'gauge', {}, cache_stats['memory_bytes']),
+        ('artifact_janitor_alive', 'gauge', {}, janitor_stats['alive']),
+        ('artifact_janitor_removed_total', 'counter', {}, janitor_stats['removed']),
+        ('upstream_not_modified_total', 'counter', {}, fetcher.not_modified),
+        ('price_alerts_triggered_total', 'counter', {}, alert_stats['triggered']),
+        ('price_alert_pushes_total', 'counter', {'result': 'sent'}, alert_stats['pushes']),
+        ('price_alert_pushes_total', 'counter', {'result': 'failed'}, alert_stats['failed'])
+    ]
+    for name, cache in [('commodity_quotes', commodity_snapshot), ('stock_day', stock_snapshot), ('stock_news', news_cache)]:
+        stats = cache.stats()
+        samples.append(('snapshot_requests_total', 'counter', {'cache': name, 'result': 'hit'}, stats['hits']))
+        samples.append(('snapshot_requests_total', 'counter', {'cache': name, 'result': 'miss'}, stats['misses']))
+        samples.append(('snapshot_requests_total', 'counter', {'cache': name, 'result': 'stale'}, stats['stale_hits']))
+    for host, (state, rejected) in fetcher.breaker_states().items():
+        samples.append(('upstream_circuit_state', 'gauge', {'host': host}, breaker_state_values[state]))
+        samples.append(('upstream_circuit_rejected_total', 'counter', {'host': host}, rejected))
+    return samples
+
+metrics.add_collector(collect_stats)
+metrics.describe('stage_seconds', 'Webhook stages: signature check and parsing, command routing, and the reply call to LINE')
+metrics.describe('handler_seconds', 'Time spent building the reply, by command handler')
+metrics.describe('spider_seconds', 'Time spent in spider functions, including upstream fetches and parsing')
+metrics.describe('upstream_seconds', 'Upstream request time by host, including retries')
+metrics.describe('render_seconds', 'Chart drawing time in the render processes')
+metrics.describe('artifact_janitor_alive', 'Legacy chart folders still within their max age after the last sweep')
+metrics.describe('artifact_janitor_removed_total', 'Legacy chart folders removed by the janitor')
+metrics.describe('worker_wait_seconds', 'Time webhook events waited in the background worker queues')
+metrics.describe('worker_run_seconds', 'Time spent handling and replying to one event in the background worker or the request thread')
+metrics.describe('event_seconds', 'Total time to handle one webhook event')
+metrics.describe('upstream_circuit_state', 'Upstream circuit breaker state: 0 closed, 1 half-open, 2 open')
+
+def prometheus_metrics(request): # 以Prometheus文字格式提供此行程的統計數據，預設關閉，設定METRICS_TOKEN時需帶上相同的Bearer token
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return HttpResponseNotFound()
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token): # 與reply驗證LINE簽章相同，未通過時回傳403
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+image_types = {'png': 'image/png', 'jpg': 'image/jpeg'} # 副檔名→Content-Type
+image_filename = re.compile(r'^[0-9a-f]{40}\.(png|jpg)$') # 圖片檔名為內容的SHA-1加副檔名
+
+def image(request, filename): # 提供圖表圖片下載，檔名即內容雜湊，內容永不改變，讓LINE及CDN長期快取
+    match = image_filename.match(filename)
+    if match is None:
+        return HttpResponseNotFound()
+    etag = '"' + filename.split('.')[0] + '"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''): # 用戶端已有相同內容
+        response = HttpResponseNotModified()
+    else:
+        data = chart_cache.get(filename)
+        if data is None: # 已被淘汰或由其他主機繪製
+            return HttpResponseNotFound()
+        response = HttpResponse(data, content_type=image_types[match.group(1)])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+async def async_commodity_chart(event, commodity_name, windows=None): # 非同步版本的commodity_chart
+    spider = await async_spider.load_commodity_spider(commodity_dict[commodity_name], windows)
+    return chart_messages(*(await async_spider.draw_commodity_charts(spider)))
+
+async def async_commodity_price(event, commodity_name): # 非同步版本的commodity_price
+    return TextSendMessage(text=await async_spider.get_newest_price_msg(commodity_name))
+
+async def async_stock_price(event, stock_code): # 非同步版本的stock_price
+    return TextSendMessage(text=await async_spider.get_newest_stock_price(stock_code))
+
+async def async_stock_chart(event, stock_code, windows=None): # 非同步版本的stock_chart
+    spider = await async_spider.load_stock_spider(stock_code, windows)
+    if spider is None:
+        return no_stock_history(stock_code)
+    return chart_messages(*(await async_spider.draw_commodity_charts(spider)), spider.note)
+
+async def async_stock_news(event, stock_code): # 非同步版本的stock_news
+    return TextSendMessage(text=await async_spider.get_stock_news(stock_code))
+
+# 需要向上游抓取資料或存取資料庫的處理函式→非同步版本
+async_handlers = {
+    commodity_chart: async_commodity_chart,
+    commodity_price: async_commodity_price,
+    stock_price: async_stock_price,
+    stock_chart: async_stock_chart,
+    stock_news: async_stock_news,
+    add_alert_reply: sync_to_async(add_alert_reply), # 存取資料庫的指令在執行緒中執行
+    list_alerts_reply: sync_to_async(list_alerts_reply),
+    cancel_alerts_reply: sync_to_async(cancel_alerts_reply)
+}
+
+async def async_build_reply(event): # 非同步版本的build_reply，需要向上游抓取資料的指令改用async_spider
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        with metrics.stage('route'):
+            handler, args = router.resolve(event.message.text) # 查詢指令路由表，第一次搜尋公司時會建立搜尋索引
+        if handler in async_handlers:
+            with metrics.stage(handler.__name__, 'handler_seconds', 'handler'): # 與同步版本使用相同的指令名稱
+                return await async_handlers[handler](event, *args)
+    return build_reply(event) # 其他指令不需要網路請求，直接使用同步版本
+
+async def async_reply_message(reply_token, messages): # 透過共用的非同步連線池傳送回應
+    response = await async_spider.get_client().post(
+        line_bot_api.endpoint + '/v2/bot/message/reply',
+        content=reply_body(reply_token, messages),
+        headers=dict(line_bot_api.headers, **{'Content-Type': 'application/json'})
+    )
+    response.raise_for_status()
+    return
+
+async def async_handle_event(event): # 非同步版本的handle_event，錯誤不會往外拋出，不影響其他事件的回覆
+    try:
+        with metrics.trace(event=event.type, mode='async'):
+            messages = await async_build_reply(event)
+            if messages:
+                with metrics.stage('reply'):
+                    await async_reply_message(event.reply_token, messages)
+    except Exception:
+        logger.exception('handling event failed')
+    return
+
+async def async_handle_group(events, limit): # 依序處理同一來源的事件
+    async with limit:
         for event in events:
-            if isinstance(event, MessageEvent): # 若事件為訊息事件
-                if isinstance(event.message, StickerMessage): # 若訊息內容為貼圖
-                    # 傳送主功能選單
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TemplateSendMessage(
-                            alt_text='功能選單',
-                            template=ButtonsTemplate(
-                                title='產業資訊',
-                                text='本功能提供查詢產業、原物料、特定公司等相關資訊。',
-                                actions=[
-                                    MessageTemplateAction(
-                                        label='查詢特定公司相關資訊',
-                                        text='特定公司相關資訊'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='查詢原物料價格',
-                                        text='原物料價格'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='查詢產業相關資訊',
-                                        text='產業相關資訊'
-                                    )
-                                ]
-                            )
-                        )
-                    )
-                elif not isinstance(event.message, TextMessage): # 若訊息內容為非文字及貼圖(邏輯上)
-                    # 傳送文字訊息
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TextSendMessage(text='請傳送文字或貼圖訊息。')
-                    )
-                elif event.message.text == "特定公司相關資訊": # 若接收到"特定公司相關資訊"文字訊息
-                    # 傳送文字訊息
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TextSendMessage(text="請輸入公司股票代碼\n例如：台泥請輸入「1101」")
-                    )
-                elif event.message.text == "產業相關資訊": # 若接收到"產業相關資訊"文字訊息
-                    # 傳送產業輪播選單
-                    button_list = []
-                    count = 0
-                    ### 將產業按鈕每三個分成一個sublist
-                    for industry in industry_dict.values():
-                        if count % 3 == 0:
-                            button_list.append([]) # 插入新的空sublist
-                        #在最後一個sublist放入按鈕
-                        button_list[-1].append(
-                            MessageTemplateAction(
-                                label=industry,
-                                text=industry
-                            )
-                        )
-                        count += 1
-                    ### 將選單分為兩則訊息
-                    carousel_lists = [[], []]
-                    for index, sub_button_list in enumerate(button_list[:7]):
-                        carousel = CarouselColumn(
-                                        title='產業' + str(index+1),
-                                        text=' ',
-                                        actions=sub_button_list
-                                    )
-                        carousel_lists[0].append(carousel)
-                    for index, sub_button_list in enumerate(button_list[7:]):
-                        carousel = CarouselColumn(
-                                        title='產業' + str(index+8),
-                                        text=' ',
-                                        actions=sub_button_list
-                                    )
-                        carousel_lists[1].append(carousel)
-                    ### 傳送訊息
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        [
-                            TemplateSendMessage(
-                                alt_text='產業列表',
-                                template=CarouselTemplate(
-                                    columns=carousel_lists[0]
-                                )
-                            ),
-                            TemplateSendMessage(
-                                alt_text='產業列表',
-                                template=CarouselTemplate(
-                                    columns=carousel_lists[1]
-                                )
-                            )
-                        ]
-                    )
-                elif event.message.text == "原物料價格": # 若接收到"原物料價格"文字訊息
-                    # 傳送原物料輪播選單
-                    button_list = []
-                    count = 0
-                    ### 將原物料按鈕每三個分成一個sublist
-                    for commodity in commodity_dict.keys():
-                        if count % 3 == 0:
-                            button_list.append([]) # 插入新的空sublist
-                        #在最後一個sublist放入按鈕
-                        button_list[-1].append(
-                            MessageTemplateAction(
-                                label=commodity,
-                                text=commodity
-                            )
-                        )
-                        count += 1
-                    ### 將選單分為兩則訊息
-                    carousel_lists = [[], []]
-                    for index, sub_button_list in enumerate(button_list[:6]):
-                        carousel = CarouselColumn(
-                                        title='原料' + str(index+1),
-                                        text=' ',
-                                        actions=sub_button_list
-                                    )
-                        carousel_lists[0].append(carousel)
-                    for index, sub_button_list in enumerate(button_list[6:]):
-                        carousel = CarouselColumn(
-                                        title='原料' + str(index+7),
-                                        text=' ',
-                                        actions=sub_button_list
-                                    )
-                        carousel_lists[1].append(carousel)
-                    ### 傳送訊息
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        [
-                            TemplateSendMessage(
-                                alt_text='原物料列表',
-                                template=CarouselTemplate(
-                                    columns=carousel_lists[0]
-                                )
-                            ),
-                            TemplateSendMessage(
-                                alt_text='原物料列表',
-                                template=CarouselTemplate(
-                                    columns=carousel_lists[1]
-                                )
-                            )
-                        ]
-                    )
-                elif '—' in event.message.text: # 若文字訊息中有破折號，正常應為按鈕回傳的指令
-                    split_msg = event.message.text.split('—') # 將訊息以破折號切段
-                    if split_msg[0] in commodity_dict.keys(): # 若第一段訊息為原物料名稱
-                        if split_msg[1] == '價格走勢圖': # 若第二段訊息為"價格走勢圖"
-                            spider = commodity_spider(commodity_dict[split_msg[0]]) # 宣告commodity_spider物件並傳入目標原物料名稱進行初始化
-                            if spider: # 若commodity_spider物件初始化成功
-                                line_chart_path = spider.draw_line_chart() # 繪製折線圖
-                                table_path = spider.draw_table() # 繪製表格
-                                # 傳送圖片
-                                line_bot_api.reply_message(
-                                    event.reply_token,
-                                    [ImageSendMessage(
-                                        original_content_url='https://' + domain + line_chart_path, 
-                                        preview_image_url='https://' + domain + line_chart_path
-                                    ),
-                                    ImageSendMessage(
-                                        original_content_url='https://' + domain + table_path, 
-                                        preview_image_url='https://' + domain + table_path
-                                    )]
-                                )
-                        elif split_msg[1] == '最新價格': # 若第二段訊息為"最新價格"
-                            # 傳送文字訊息，內容使用get_newest_price_msg(<原物料名稱>)及時抓取
-                            line_bot_api.reply_message(
-                                event.reply_token,
-                                TextSendMessage(text=get_newest_price_msg(split_msg[0]))
-                            )
-                    elif split_msg[0] in company_dict.keys(): # 若第一段訊息為公司股票代碼
-                        if split_msg[1] == '股票價格': # 若第二段訊息為"股票價格"
-                             # 傳送文字訊息，內容使用get_newest_stock_price(<公司股票代碼>)及時抓取
-                            line_bot_api.reply_message(
-                                event.reply_token,
-                                TextSendMessage(text=get_newest_stock_price(split_msg[0]))
-                            )
-                        elif split_msg[1] == '公司新聞': # 若第二段訊息為"公司新聞"
-                            # 傳送文字訊息，內容使用get_stock_news(<公司股票代碼>)及時抓取
-                            line_bot_api.reply_message(
-                                event.reply_token,
-                                TextSendMessage(text=get_stock_news(split_msg[0]))
-                            )
-                    elif split_msg[0] in industry_dict.values(): # 若第一段訊息為產業名稱
-                        if split_msg[1] == '產業分析': # 若第二段訊息為"產業分析"
-                            # 傳送文字訊息，內容在industry_analysis.json中定義
-                            line_bot_api.reply_message(
-                                event.reply_token,
-                                TextSendMessage(text=industry_analysis[split_msg[0]])
-                            )
-                        elif split_msg[1] == '產業新聞': # 若第二段訊息為"產業新聞"
-                            # 傳送文字訊息，內容在industry_news.json中定義
-                            line_bot_api.reply_message(
-                                event.reply_token,
-                                TextSendMessage(text=industry_news_dict[split_msg[0]])
-                            )
-                elif event.message.text in industry_dict.values(): # 若接收到產業名稱之文字訊息
-                    # 傳送產業資訊功能選單
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TemplateSendMessage(
-                            alt_text=event.message.text + '產業資訊',
-                            template=ButtonsTemplate(
-                                title=event.message.text,
-                                text='請選擇欲查詢的項目。',
-                                actions=[
-                                    MessageTemplateAction(
-                                        label='產業分析',
-                                        text=event.message.text + '—產業分析'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='產業新聞',
-                                        text=event.message.text + '—產業新聞'
-                                    )
-                                ]
-                            )
-                        )
-                    )
-                elif event.message.text in commodity_dict.keys(): # 若接收到原物料名稱之文字訊息
-                    # 傳送原物料價格功能選單
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TemplateSendMessage(
-                            alt_text='原物料價格',
-                            template=ButtonsTemplate(
-                                title=event.message.text,
-                                text='請選擇欲查詢的項目。',
-                                actions=[
-                                    MessageTemplateAction(
-                                        label='價格走勢圖',
-                                        text=event.message.text + '—價格走勢圖'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='最新價格',
-                                        text=event.message.text + '—最新價格'
-                                    )
-                                ]
-                            )
-                        )
-                    )
-                elif event.message.text in company_dict.keys(): # 若接收到公司股票代碼之文字訊息
-                    # 傳送該公司相關資訊功能選單
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TemplateSendMessage(
-                            alt_text='特定公司相關資訊',
-                            template=ButtonsTemplate(
-                                title=event.message.text + ' - ' + company_dict[event.message.text],
-                                text='請選擇欲查詢的項目。',
-                                actions=[
-                                    MessageTemplateAction(
-                                        label='股票價格',
-                                        text=event.message.text + '—股票價格'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='公司新聞',
-                                        text=event.message.text + '—公司新聞'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='產業相關資訊',
-                                        text=industry_dict[company_industry_dict[event.message.text]]
-                                    )
-                                ]
-                            )
-                        )
-                    )
-                else: # 若接收到其他非相關文字訊息
-                    # 傳送主功能選單
-                    line_bot_api.reply_message(
-                        event.reply_token,
-                        TemplateSendMessage(
-                            alt_text='功能選單',
-                            template=ButtonsTemplate(
-                                title='產業資訊',
-                                text='本功能提供查詢產業、原物料、特定公司等相關資訊。',
-                                actions=[
-                                    MessageTemplateAction(
-                                        label='查詢特定公司相關資訊',
-                                        text='特定公司相關資訊'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='查詢原物料價格',
-                                        text='原物料價格'
-                                    ),
-                                    MessageTemplateAction(
-                                        label='查詢產業相關資訊',
-                                        text='產業相關資訊'
-                                    )
-                                ]
-                            )
-                        )
-                    )
-            elif isinstance(event, FollowEvent): # 若事件為追隨事件
-                # 傳送主功能選單
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TemplateSendMessage(
-                        alt_text='功能選單',
-                        template=ButtonsTemplate(
-                            title='產業資訊',
-                            text='本功能提供查詢產業、原物料、特定公司等相關資訊。',
-                            actions=[
-                                MessageTemplateAction(
-                                    label='查詢特定公司相關資訊',
-                                    text='特定公司相關資訊'
-                                ),
-                                MessageTemplateAction(
-                                    label='查詢原物料價格',
-                                    text='原物料價格'
-                                ),
-                                MessageTemplateAction(
-                                    label='查詢產業相關資訊',
-                                    text='產業相關資訊'
-                                )
-                            ]
-                        )
-                    )
-                )
-            # 未處理其他事件
+            await async_handle_event(event)
+    return
+
+async def async_reply(request): # 非同步版本的reply，以ASGI佈署時同一個行程可同時等待大量上游請求
+    if request.method == 'POST': # 若HTTP請求Method為POST
+        # 解析請求內容
+        signature = request.META['HTTP_X_LINE_SIGNATURE'] # 此request header用來驗證請求是由LINE Platform發出
+        body = request.body.decode('utf-8') # 使用UTF-8編碼解碼請求內容
+        try:
+            with metrics.stage('parse'):
+                events = parser.parse(body, signature) # 使用line sdk解析請求內容
+        except InvalidSignatureError: # 若signature驗證失敗
+            metrics.inc('webhook_requests_total', status='403')
+            return HttpResponseForbidden() # 回傳http status code 403
+        except LineBotApiError: # 若解析過程錯誤
+            metrics.inc('webhook_requests_total', status='400')
+            return HttpResponseBadRequest() # 回傳http status code 400
+        metrics.inc('webhook_requests_total', status='200')
+        # 處理事件，不同來源同時處理，同一來源依序處理
+        limit = asyncio.Semaphore(getattr(settings, 'LINE_EVENT_PARALLELISM', 4)) # 此次請求同時處理的來源數上限
+        if isinstance(request, ASGIRequest): # 長駐的事件迴圈，使用共用連線池
+            await asyncio.gather(*[async_handle_group(group, limit) for group in group_events(events)])
+        else: # WSGI佈署，事件迴圈只存在於此次請求，連線池在請求結束時關閉
+            async with async_spider.request_client():
+                await asyncio.gather(*[async_handle_group(group, limit) for group in group_events(events)])
         return HttpResponse() # 傳送空回應
     else: # 若HTTP請求Method為非POST
-        return HttpResponse('HI!') # 在畫面上印出"HI!"，Debug用
\ No newline at end of file
+        return HttpResponse('HI!') # 在畫面上印出"HI!"，Debug用
+async_reply.csrf_exempt = True # 使請求可以來自其他網域，csrf_exempt裝飾器不支援async view，直接設定屬性
@@ -0,0 +1,150 @@
+# queue         Python標準套件，有上限的工作佇列
+# threading     Python標準套件，用來建立背景工作執行緒
+# time          Python標準套件，用來計算等待及處理時間
+# logging       Python標準套件，用來紀錄處理事件時發生的錯誤
+# collections   Python標準套件，OrderedDict用來依來源分組並保持順序
+# concurrent    Python標準套件，同時處理不同來源的事件
+import queue, threading, time, logging, collections
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def source_key(event): # 事件來源的識別碼，優先使用傳送者，沒有時使用群組或聊天室，同一來源的事件需依序處理
+    source = getattr(event, 'source', None)
+    for name in ('user_id', 'group_id', 'room_id'):
+        key = getattr(source, name, None)
+        if key:
+            return key
+    return None
+
+def group_events(events): # 依來源將事件分組，回傳[[同一來源的事件, ...], ...]，組內保持原本順序，沒有來源的事件各自一組
+    groups = collections.OrderedDict()
+    for index, event in enumerate(events):
+        key = source_key(event)
+        groups.setdefault(key if key is not None else index, []).append(event)
+    return list(groups.values())
+
+def process_event(handler, event): # 處理單一事件，錯誤不會往外拋出，回傳是否成功
+    try:
+        handler(event)
+    except Exception:
+        logger.exception('handling event failed')
+        return False
+    return True
+
+# 定義event_fanout物件，同一次webhook中不同來源的事件同時處理，同一來源的事件依序處理，一個事件失敗不影響其他事件的回覆
+# 執行緒池由所有請求共用，每個請求最多同時使用parallelism-1個執行緒，一次大量事件不會佔滿執行緒池而讓其他請求等待
+class event_fanout:
+    def __init__(self, handler, parallelism=4, threads=16): # 初始化，parallelism為每個請求同時處理的來源數上限(含目前的執行緒)，1為依序處理，threads為共用執行緒池的大小
+        self.handler = handler # 處理單一事件的函式
+        self.parallelism = parallelism
+        self.threads = threads
+        self.lock = threading.Lock() # 保護執行緒池的建立
+        self.executor = None # 所有請求共用的執行緒池，第一次需要時才建立
+        return
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='event-fanout')
+            return self.executor
+    def run_group(self, events): # 依序處理同一來源的事件
+        for event in events:
+            process_event(self.handler, event)
+        return
+    def drain(self, pending, lock): # 依序取出此請求尚未處理的來源並處理，直到全部取完
+        while True:
+            with lock:
+                if not pending:
+                    return
+                group = pending.popleft()
+            self.run_group(group)
+    def run(self, events): # 處理一次webhook中的全部事件，全部完成後才回傳
+        groups = group_events(events)
+        if len(groups) <= 1 or self.parallelism <= 1:
+            for group in groups:
+                self.run_group(group)
+            return
+        pending = collections.deque(groups) # 此請求尚未處理的來源
+        lock = threading.Lock() # 保護pending
+        executor = self.get_executor()
+        helpers = min(self.parallelism, len(groups)) - 1 # 此請求使用的執行緒數，其他執行緒留給其他請求
+        futures = [executor.submit(self.drain, pending, lock) for i in range(helpers)]
+        self.drain(pending, lock) # 目前的執行緒也一起處理
+        for future in futures:
+            future.result()
+        return
+
+# 定義event_worker物件，將webhook事件放入有上限的佇列，由背景執行緒依序處理並回覆
+# 每個執行緒有各自的佇列，同一來源的事件固定放入同一個佇列，因此會依收到的順序處理
+class event_worker:
+    def __init__(self, handler, threads=4, queue_size=100, submit_timeout=0, metrics=None): # 初始化，submit_timeout為佇列已滿時最多等待的秒數，metrics為metrics_registry
+        self.handler = handler # 處理單一事件的函式
+        self.metrics = metrics # 紀錄等待及處理時間的直方圖，可跨worker彙總
+        self.threads = threads # 背景執行緒數量
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // threads)) for i in range(threads)] # 有上限的工作佇列，滿了代表處理不及
+        self.submit_timeout = submit_timeout
+        self.lock = threading.Lock() # 保護統計數據及執行緒啟動
+        self.started = False # 背景執行緒是否已啟動
+        # 統計數據
+        self.submitted = 0 # 放入佇列的事件數
+        self.rejected = 0 # 佇列已滿而在請求執行緒直接處理的事件數
+        self.completed = 0 # 處理完成的事件數
+        self.failed = 0 # 處理失敗的事件數
+        return
+    def observe(self, name, seconds): # 在直方圖中紀錄一次等待或處理時間
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds)
+        return
+    def start(self): # 啟動背景執行緒，重複呼叫不會重複啟動
+        with self.lock:
+            if self.started:
+                return
+            for i in range(self.threads):
+                threading.Thread(target=self.run, args=(self.queues[i],), name='event-worker-' + str(i), daemon=True).start()
+            self.started = True
+        return
+    def queue_for(self, event): # 同一來源的事件固定使用同一個佇列，沒有來源的事件輪流分配
+        key = source_key(event)
+        if key is None:
+            with self.lock:
+                key = self.submitted
+        return self.queues[hash(key) % self.threads]
+    def submit(self, event): # 將事件放入佇列，佇列已滿時最多等待submit_timeout秒，仍然已滿時回傳False
+        self.start()
+        jobs = self.queue_for(event)
+        try:
+            if self.submit_timeout > 0: # 等待同一來源的佇列有空位，維持處理順序
+                jobs.put((time.time(), event), timeout=self.submit_timeout)
+            else:
+                jobs.put_nowait((time.time(), event))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.submitted += 1
+        return True
+    def process(self, event): # 處理單一事件並紀錄處理時間，錯誤不會往外拋出
+        start = time.time()
+        ok = process_event(self.handler, event)
+        elapsed = time.time() - start
+        with self.lock:
+            self.completed += 1
+            self.failed += 0 if ok else 1
+        self.observe('worker_run_seconds', elapsed)
+        return ok
+    def run(self, jobs): # 背景執行緒主迴圈，只處理自己的佇列
+        while True:
+            enqueued_at, event = jobs.get()
+            self.observe('worker_wait_seconds', time.time() - enqueued_at)
+            self.process(event)
+            jobs.task_done()
+    def stats(self): # 回傳目前統計數據
+        with self.lock:
+            return {
+                'depth': sum(jobs.qsize() for jobs in self.queues),
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed
+            }